@@ -1,78 +1,105 @@
 import streamlit as st
 import os
+import io
 import json
+import hashlib
 import yaml
 import numpy as np
 import hdbscan
-import umap
 import matplotlib.pyplot as plt
-from collections import defaultdict
-from sentence_transformers import SentenceTransformer
-import openai
-import random
+from collections import OrderedDict
+
+from ars_cluster import METHODS, CategoryModel, cluster_embeddings
+from ars_embed import get_engine
+from ars_grammar import TransitionModel
+from ars_ingest import decode_bytes, parse_text
+from ars_naming import RemoteNamer, name_clusters
+from ars_reduce import reduce_embeddings
+from ars_sampler import ChainSampler
 
 # === Konfiguration ===
 USE_GPT = st.sidebar.checkbox("GPT zur Clusterbenennung verwenden?", value=False)
-openai.api_key = st.sidebar.text_input("OpenAI API-Key", type="password")
+OPENAI_API_KEY = st.sidebar.text_input("OpenAI API-Key", type="password")
+CLUSTER_METHOD = st.sidebar.selectbox("Clustering-Verfahren", METHODS, index=0)
+CATEGORY_DIR = st.sidebar.text_input("Kategorienmodell (Verzeichnis, optional)", "")
+REDUCE = st.sidebar.selectbox("Dimensionsreduktion vor dem Clustering", ["keine", "pca", "umap"], index=0)
+REUSE_CATEGORIES = st.sidebar.checkbox("Bekannte Kategorien zuordnen statt neu clustern", value=False)
+
+# Analysen je Sitzung (Dateiinhalt + Parameter), älteste fallen zuerst heraus
+MAX_ANALYSES = 16
+
+def get_category_model():
+    # Über Uploads hinweg stabile Kategorie-IDs; optional auf Platte gespeichert
+    if "category_model" not in st.session_state:
+        if CATEGORY_DIR and os.path.exists(os.path.join(CATEGORY_DIR, "meta.json")):
+            st.session_state.category_model = CategoryModel.load(CATEGORY_DIR)
+        else:
+            st.session_state.category_model = CategoryModel(encoder="all-MiniLM-L6-v2")
+    return st.session_state.category_model
+
+@st.cache_resource(show_spinner=False)
+def load_engine(model_name="all-MiniLM-L6-v2"):
+    # Ein Modell pro Serverprozess, über alle Sitzungen und Reruns hinweg
+    return get_engine(model_name)
 
 @st.cache_data(show_spinner=False)
 def embed_utterances(utterances, model_name="all-MiniLM-L6-v2"):
-    model = SentenceTransformer(model_name)
-    return model.encode(utterances, show_progress_bar=False)
+    return load_engine(model_name).encode(utterances)
 
-def cluster_utterances(embeddings):
+def cluster_utterances(embeddings, method="hdbscan"):
+    # Liefert (Labels, Clusterer); mit prediction_data kann das Kategorienmodell
+    # neue Äußerungen später per approximate_predict zuordnen
+    if method != "hdbscan":
+        return cluster_embeddings(embeddings, method=method, min_cluster_size=5), None
     clusterer = hdbscan.HDBSCAN(min_cluster_size=5, prediction_data=True)
-    return clusterer.fit_predict(embeddings)
-
-def gpt_category(samples):
-    prompt = "Gib eine knappe Kategorienbezeichnung (1–2 Wörter) für folgende Aussagen:
-" + "\n".join(f"- {s}" for s in samples[:5])
-    try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.3
-        )
-        return response["choices"][0]["message"]["content"].strip()
-    except Exception:
-        return local_category(samples)
-
-def local_category(samples):
-    fallback = ["Frage", "Antwort", "Befehl", "Hinweis", "Ironie", "Zweifel"]
-    return random.choice(fallback)
-
-def assign_categories(utterances, labels):
-    clusters = defaultdict(list)
-    for u, l in zip(utterances, labels):
-        clusters[l].append(u)
+    return clusterer.fit_predict(embeddings), clusterer
+
+def label_utterances(embeddings, model, features=None):
+    # features: reduzierte Koordinaten fürs Clustering; das Kategorienmodell
+    # arbeitet weiter auf den vollen Embeddings
+    if REUSE_CATEGORIES and len(model):
+        return model.predict(embeddings)
+    features = embeddings if features is None else features
+    labels, clusterer = cluster_utterances(features, CLUSTER_METHOD)
+    if features is not embeddings:
+        clusterer = None  # approximate_predict erwartet reduzierte Eingaben
+    return model.update(embeddings, labels, clusterer=clusterer)
+
+@st.cache_resource(show_spinner=False)
+def get_remote_namer(api_key):
+    # Nebenläufige GPT-Anfragen mit persistentem Namens-Cache (siehe ars_naming)
+    return RemoteNamer(api_key=api_key)
+
+def assign_categories(utterances, labels, model=None, embeddings=None):
+    # Namen lokal per c-TF-IDF (deterministisch), mit GPT nur für neue Cluster
+    known = set(model.names) if model is not None else set()
+    remote = get_remote_namer(OPENAI_API_KEY) if USE_GPT else None
+    names = name_clusters(utterances, labels, embeddings, remote=remote, known=known)
     label_to_name = {}
-    for l, samples in clusters.items():
-        label_to_name[l] = gpt_category(samples) if USE_GPT else local_category(samples)
+    for l in dict.fromkeys(labels):
+        if l in known:
+            # Bekannte Kategorie behält ihren Namen
+            label_to_name[l] = model.names[l]
+            continue
+        label_to_name[l] = names[l]
+        if model is not None and l >= 0:
+            model.names[int(l)] = label_to_name[l]
     return [label_to_name[l] for l in labels], label_to_name
 
 def induce_pcfg(sequence):
-    transitions = defaultdict(lambda: defaultdict(int))
-    for i in range(len(sequence) - 1):
-        transitions[sequence[i]][sequence[i + 1]] += 1
-    return {k: {kk: vv / sum(v.values()) for kk, vv in v.items()} for k, v in transitions.items()}
+    return TransitionModel().update(sequence).to_grammar().normalize()
 
-def simulate_dialog(pcfg, start=None, maxlen=15):
+def simulate_dialog(pcfg, start=None, maxlen=15, sampler=None):
     if not pcfg: return []
-    if not start:
-        start = random.choice(list(pcfg.keys()))
-    result = [start]
-    for _ in range(maxlen - 1):
-        if start not in pcfg:
-            break
-        next_items = list(pcfg[start].items())
-        next_tokens, probs = zip(*next_items)
-        start = random.choices(next_tokens, probs)[0]
-        result.append(start)
-    return result
-
-def render_umap(embeddings, labels):
-    reducer = umap.UMAP(random_state=42)
-    reduced = reducer.fit_transform(embeddings)
+    sampler = sampler or ChainSampler(pcfg)
+    return sampler.sample_symbols(1, maxlen, start=start or None)[0]
+
+def render_umap(embeddings, labels, projection=None):
+    # Projektion wird pro Embedding-Inhalt nur einmal angepasst (ars_reduce),
+    # nicht bei jedem Streamlit-Rerun
+    if projection is None:
+        projection = reduce_embeddings(embeddings, method="umap", n_components=2)
+    reduced = projection.coords_2d()
     fig, ax = plt.subplots()
     unique_labels = set(labels)
     for label in unique_labels:
@@ -82,6 +109,61 @@ def render_umap(embeddings, labels):
     ax.legend()
     return fig
 
+def figure_to_png(fig):
+    # Abbildung einmal rastern; Reruns zeigen nur noch das fertige Bild
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
+
+def analysis_key(content, params):
+    digest = hashlib.sha1(content)
+    digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+def analyze_file(name, content):
+    # Komplette Analyse einer hochgeladenen Datei. Streamlit führt bei jeder
+    # Interaktion das ganze Skript erneut aus; das Ergebnis wird daher pro
+    # Dateiinhalt + Parametern in der Sitzung gehalten und nur bei Änderungen
+    # neu berechnet. None, wenn die Datei keine Dialogzeilen enthält.
+    params = {"cluster": CLUSTER_METHOD, "reduce": REDUCE, "reuse": REUSE_CATEGORIES,
+              "gpt": USE_GPT, "categories": CATEGORY_DIR}
+    key = analysis_key(content, params)
+    if "analyses" not in st.session_state:
+        st.session_state.analyses = OrderedDict()
+    analyses = st.session_state.analyses
+    if key in analyses:
+        analyses.move_to_end(key)
+        return analyses[key]
+
+    raw_text = decode_bytes(content)
+    utterances = [text for speaker, text in parse_text(raw_text, with_speaker=True) if speaker]
+    result = None
+    if utterances:
+        embeddings = embed_utterances(utterances)
+        projection = reduce_embeddings(embeddings, method=REDUCE) if REDUCE != "keine" else None
+        category_model = get_category_model()
+        labels = label_utterances(embeddings, category_model,
+                                  projection.coords if projection is not None else None)
+        categories, label_map = assign_categories(utterances, labels, category_model, embeddings)
+        if CATEGORY_DIR:
+            category_model.save(CATEGORY_DIR, with_clusterer=True)
+        pcfg = induce_pcfg(categories)
+        result = {
+            "name": name,
+            "labels": labels,
+            "label_map": label_map,
+            "pcfg": pcfg,
+            "sampler": ChainSampler(pcfg) if pcfg else None,
+            "plot": figure_to_png(render_umap(embeddings, labels, projection)),
+            "yaml": yaml.dump(pcfg.to_dict(), allow_unicode=True),
+            "dot": pcfg_to_dot(pcfg),
+        }
+    analyses[key] = result
+    while len(analyses) > MAX_ANALYSES:
+        analyses.popitem(last=False)
+    return result
+
 def pcfg_to_dot(pcfg):
     lines = ["digraph PCFG {"]
     for src, dsts in pcfg.items():
@@ -97,34 +179,28 @@ uploaded_files = st.file_uploader("Lade Transkripte hoch (.txt)", type="txt", ac
 if uploaded_files:
     for file in uploaded_files:
         st.subheader(f"📄 Datei: {file.name}")
-        raw_text = file.read().decode("utf-8")
-        utterances = [line.split(":", 1)[1].strip() for line in raw_text.splitlines() if ":" in line]
+        analysis = analyze_file(file.name, file.getvalue())
 
-        if not utterances:
+        if analysis is None:
             st.warning("Keine dialogischen Äußerungen gefunden.")
             continue
 
-        embeddings = embed_utterances(utterances)
-        labels = cluster_utterances(embeddings)
-        categories, label_map = assign_categories(utterances, labels)
-        pcfg = induce_pcfg(categories)
-
         st.markdown("### 🔖 Kategorien")
-        for cluster, name in label_map.items():
+        for cluster, name in analysis["label_map"].items():
             st.write(f"**Cluster {cluster}** → {name}")
 
         st.markdown("### 🧠 PCFG-Simulation")
         if st.button(f"🎲 Simuliere Dialog ({file.name})"):
-            dialog = simulate_dialog(pcfg)
+            dialog = simulate_dialog(analysis["pcfg"], sampler=analysis["sampler"])
             st.write(" → ".join(dialog))
 
         st.markdown("### 📊 Cluster-Visualisierung")
-        st.pyplot(render_umap(embeddings, labels))
+        st.image(analysis["plot"])
 
         st.markdown("### 📥 Export")
         col1, col2 = st.columns(2)
 
         with col1:
-            st.download_button("📎 PCFG als YAML", yaml.dump(pcfg, allow_unicode=True), file_name=f"{file.name}_pcfg.yaml")
+            st.download_button("📎 PCFG als YAML", analysis["yaml"], file_name=f"{file.name}_pcfg.yaml")
         with col2:
-            st.download_button("📎 PCFG als DOT", pcfg_to_dot(pcfg), file_name=f"{file.name}_pcfg.dot")
+            st.download_button("📎 PCFG als DOT", analysis["dot"], file_name=f"{file.name}_pcfg.dot")
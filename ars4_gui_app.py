@@ -1,15 +1,22 @@
 import os
 import json
+import time
+import threading
 import numpy as np
-from sklearn.cluster import HDBSCAN
-from sentence_transformers import SentenceTransformer
-from collections import defaultdict
-from scipy.stats import pearsonr
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
 
-# Modell für Embeddings
-model = SentenceTransformer("all-MiniLM-L6-v2")
+from ars_ingest import ingest_files
+from ars_cluster import CategoryModel, cluster_embeddings
+from ars_embed import get_engine
+from ars_grammar import Grammar, SymbolTable, TransitionModel, count_unigrams, transition_matrix, expected_counts
+from ars_sampler import ChainSampler, estimate_counts
+from ars_induction import repair
+from ars_artifact import save_artifact, load_artifact
+from ars_jobs import JobScheduler, JobCancelled
+
+# Modell für Embeddings (wird beim ersten Aufruf geladen)
+MODEL_NAME = "all-MiniLM-L6-v2"
 
 class ARSGUI:
     def __init__(self, root):
@@ -18,6 +25,14 @@ class ARSGUI:
         self.transcripts = []
         self.terminal_symbols = []
         self.pcfg = {}
+        self.counts = None
+        self.embeddings = None
+        self.nonterminals = {}
+        self.nonterminal_counts = {}
+        self.cluster_method = None  # Standard aus ARS_CLUSTER_METHOD, sonst HDBSCAN
+        self.category_model = CategoryModel(encoder=MODEL_NAME)
+        self.jobs = JobScheduler(root)
+        self._grammar_job = None
         
         self.setup_ui()
     
@@ -35,8 +50,19 @@ class ARSGUI:
         
         ttk.Button(main_frame, text="Export JSON", command=lambda: self.export_grammar("json")).grid(row=2, column=0)
         ttk.Button(main_frame, text="Export YAML", command=lambda: self.export_grammar("yaml")).grid(row=2, column=1)
+        ttk.Button(main_frame, text="Save Categories", command=self.save_categories).grid(row=2, column=2)
+        ttk.Button(main_frame, text="Load Categories", command=self.load_categories).grid(row=2, column=3)
+        ttk.Button(main_frame, text="Save Analysis", command=self.save_analysis).grid(row=3, column=0)
+        ttk.Button(main_frame, text="Load Analysis", command=self.load_analysis).grid(row=3, column=1)
+        ttk.Button(main_frame, text="Cancel", command=self.cancel_jobs).grid(row=3, column=2)
+        self.progress = ttk.Progressbar(main_frame, mode="determinate")
+        self.progress.grid(row=4, column=0, columnspan=4, sticky="ew", pady=5)
     
     def log(self, message):
+        if threading.current_thread() is not threading.main_thread():
+            # Aus Hintergrundjobs: Tk nur im UI-Thread anfassen
+            self.jobs.call_soon(self.log, message)
+            return
         self.output_text.insert(tk.END, message + "\n")
         self.output_text.see(tk.END)
     
@@ -45,24 +71,51 @@ class ARSGUI:
         if not files:
             return
             
-        self.transcripts = []
-        for file in files:
-            with open(file, 'r', encoding='utf-8') as f:
-                self.transcripts.extend([line.strip() for line in f if line.strip()])
+        self.corpus = ingest_files(files)
+        self.transcripts = self.corpus.lines()
         
         self.log(f"Loaded {len(self.transcripts)} utterances from {len(files)} files.")
     
+    def _show_progress(self, done, total):
+        self.progress["maximum"] = max(total, 1)
+        self.progress["value"] = done
+    
+    def _job_failed(self, error):
+        if isinstance(error, JobCancelled):
+            self.log(f"Cancelled: {error}")
+        else:
+            self.log(f"Failed: {error}")
+    
+    def cancel_jobs(self):
+        if self.jobs.busy():
+            self.log("Cancelling after the current batch...")
+            self.jobs.cancel()
+    
     def generate_grammar(self):
         if not self.transcripts:
             messagebox.showwarning("Warning", "No transcripts loaded!")
             return
-            
+        if self._grammar_job is not None and self._grammar_job.active:
+            messagebox.showinfo("Info", "Grammar generation is already running.")
+            return
+        # Einbettung, Clustering und Induktion im Hintergrund
+        self.progress["value"] = 0
+        self._grammar_job = self.jobs.submit(
+            "generate grammar", self._generate_grammar,
+            on_error=self._job_failed, on_progress=self._show_progress)
+    
+    def _generate_grammar(self, job):
         # Schritt 1: Terminalzeichen generieren
-        embeddings = model.encode(self.transcripts)
+        engine = get_engine(MODEL_NAME)
+        embeddings = engine.encode(self.transcripts, progress=job.report, cancel=job.cancel_event)
+        self.embeddings = embeddings
+        self.log(f"Embedded {len(self.transcripts)} utterances ({engine.throughput():.0f}/s)")
         
         # KORREKTUR: Parameter gen_min_span_tree entfernt
-        clusterer = HDBSCAN(min_cluster_size=3)
-        clusters = clusterer.fit_predict(embeddings)
+        clusters = cluster_embeddings(embeddings, method=self.cluster_method, min_cluster_size=3)
+        job.check()
+        # Stabile IDs: bekannte Cluster behalten ihr Terminalzeichen
+        clusters = self.category_model.update(embeddings, clusters)
         
         # Unique Terminalzeichen erstellen
         self.terminal_symbols = [f"T_{c+1}" for c in clusters]
@@ -72,116 +125,241 @@ class ARSGUI:
         
         # Schritt 2: Nonterminale und Regeln ableiten
         self.pcfg = self.induce_grammar_rules(self.terminal_symbols)
+        self.log(f"Induced {len(self.nonterminals)} nonterminals for repeated subsequences.")
         self.log("\nGenerated PCFG rules:")
         for nt, rules in self.pcfg.items():
-            self.log(f"{nt} → {rules}")
-    
-    def induce_grammar_rules(self, terminals, n=3):
-        rules = defaultdict(dict)
-        
-        # Einfache Übergänge zwischen Terminalzeichen
-        for i in range(len(terminals)-1):
-            src = terminals[i]
-            dst = terminals[i+1]
-            rules[src][dst] = rules[src].get(dst, 0) + 1
-        
-        # Nonterminale für häufige N-Gramme
-        ngram_counts = defaultdict(int)
-        for i in range(len(terminals)-n+1):
-            ngram = " ".join(terminals[i:i+n])
-            ngram_counts[ngram] += 1
-        
-        # Füge Nonterminale für häufige N-Gramme hinzu
-        for ngram, count in ngram_counts.items():
-            if count > 1:
-                nt = f"NT_{ngram.replace(' ', '_')}"
-                rules[nt] = {ngram: 1.0}
-                
-                # Ersetze Vorkommen im Haupt-PCFG
-                for src in list(rules.keys()):
-                    if ngram in rules[src]:
-                        rules[src][nt] = rules[src].pop(ngram)
+            if nt in self.nonterminal_counts:
+                length = len(self._expand(nt))
+                self.log(f"{nt} → {dict(rules)}  (count {self.nonterminal_counts[nt]}, length {length})")
+            else:
+                self.log(f"{nt} → {dict(rules)}")
+    
+    def classify_utterances(self, utterances):
+        # Neue Äußerungen ohne erneutes Clustern auf bestehende Terminale abbilden
+        embeddings = get_engine(MODEL_NAME).encode(utterances)
+        return [f"T_{c+1}" for c in self.category_model.predict(embeddings)]
+    
+    def save_categories(self):
+        directory = filedialog.askdirectory()
+        if directory:
+            self.category_model.save(directory)
+            self.log(f"Saved {len(self.category_model)} categories to {directory}")
+    
+    def load_categories(self):
+        directory = filedialog.askdirectory()
+        if not directory:
+            return
+        if not os.path.exists(os.path.join(directory, "meta.json")):
+            messagebox.showwarning("Warning", "No category model in this directory!")
+            return
+        self.category_model = CategoryModel.load(directory)
+        self.log(f"Loaded {len(self.category_model)} categories from {directory}")
+    
+    def save_analysis(self):
+        if not self.pcfg:
+            messagebox.showwarning("Warning", "Generate grammar first!")
+            return
+        file = filedialog.asksaveasfilename(defaultextension=".npz", filetypes=[("ARS analysis", "*.npz")])
+        if not file:
+            return
+        corpus = getattr(self, "corpus", None)
+        save_artifact(
+            file, self.pcfg, counts=self.counts,
+            nonterminals=self.nonterminals, nonterminal_counts=self.nonterminal_counts,
+            labels=self.terminal_symbols, utterances=self.transcripts, embeddings=self.embeddings,
+            files=corpus.files if corpus is not None else None,
+            file_ids=corpus.file_ids if corpus is not None else None,
+            line_numbers=corpus.line_numbers if corpus is not None else None,
+            meta={"encoder": MODEL_NAME},
+        )
+        self.log(f"Analysis saved to {file}")
+    
+    def load_analysis(self):
+        # Grammatik, Nonterminale und Labels aus dem binären Artefakt,
+        # Embeddings bleiben eine Memmap auf die Datei
+        file = filedialog.askopenfilename(filetypes=[("ARS analysis", "*.npz")])
+        if not file:
+            return
+        start = time.perf_counter()
+        try:
+            artifact = load_artifact(file)
+        except (ValueError, KeyError, OSError) as e:
+            messagebox.showerror("Error", f"Cannot load analysis: {e}")
+            return
+        self.pcfg = artifact.grammar
+        self.counts = artifact.counts
+        self.nonterminals = artifact.nonterminals
+        self.nonterminal_counts = artifact.nonterminal_counts
+        self.terminal_symbols = artifact.label_symbols or []
+        self.transcripts = artifact.utterances or []
+        self.embeddings = artifact.embeddings
+        self.log(f"Loaded analysis from {file} in {time.perf_counter() - start:.3f}s: "
+                 f"{len(self.transcripts)} utterances, {len(set(self.terminal_symbols))} terminals, "
+                 f"{len(self.nonterminals)} nonterminals.")
+    
+    def induce_grammar_rules(self, terminals, min_count=2, max_rules=None):
+        from scipy.sparse import csr_matrix
+        # Einfache Übergänge zwischen Terminalzeichen (vektorisiert gezählt)
+        model = TransitionModel()
+        ids = model.intern(terminals)
+        counts = model.update_ids(ids).counts.tocoo()
+        self.counts = model.to_grammar()
+        table = SymbolTable(model.symbols)
+        rows, cols, values = counts.row.tolist(), counts.col.tolist(), counts.data.astype(float).tolist()
         
-        # Normalisiere Wahrscheinlichkeiten
-        for src in rules:
-            total = sum(rules[src].values())
-            rules[src] = {dst: cnt/total for dst, cnt in rules[src].items()}
+        # Hierarchische Nonterminale für wiederholte Teilfolgen beliebiger
+        # Länge (Re-Pair über die int-kodierte Kette)
+        induced = repair(ids, len(model.symbols), min_count=min_count, max_rules=max_rules)
+        names = list(model.symbols) + [f"NT_{k + 1}" for k in range(len(induced))]
+        self.nonterminals = {}
+        self.nonterminal_counts = {}
+        for nt in induced.nonterminals():
+            left, right = induced.rules[nt]
+            self.nonterminals[names[nt]] = [names[left], names[right]]
+            self.nonterminal_counts[names[nt]] = induced.counts[nt]
+            rows.append(table.add(names[nt]))
+            cols.append(table.add(f"{names[left]} {names[right]}"))
+            values.append(1.0)
         
-        return dict(rules)
+        # Normalisiere Wahrscheinlichkeiten (zeilenweise, dünne Matrix)
+        n = len(table)
+        return Grammar(csr_matrix((values, (rows, cols)), shape=(n, n)), table).normalize()
     
-    def optimize_grammar(self, iterations=10):
-        if not self.pcfg:
+    def optimize_grammar(self, iterations=10, mode="analytic", max_chains=5000, batch_chains=500,
+                         tol=0.005, time_budget=60.0, seed=0):
+        pending = self._grammar_job if self._grammar_job is not None and self._grammar_job.active else None
+        if not self.pcfg and pending is None:
             messagebox.showwarning("Warning", "Generate grammar first!")
             return
+        # Wartet ggf. auf die laufende Grammatik-Erzeugung
+        self.progress["value"] = 0
+        return self.jobs.submit(
+            "optimize grammar", self._optimize_grammar, iterations, mode, max_chains, batch_chains,
+            tol, time_budget, seed, after=pending, on_done=self._finish_optimization,
+            on_error=self._job_failed, on_progress=self._show_progress)
+    
+    def _optimize_grammar(self, job, iterations=10, mode="analytic", max_chains=5000, batch_chains=500,
+                          tol=0.005, time_budget=60.0, seed=0):
+        from scipy.stats import pearsonr
             
+        # Grammar-Operationen liefern neue Objekte: der Worker arbeitet auf seiner
+        # eigenen Folge, self.pcfg wird erst im UI-Thread ersetzt (_finish_optimization)
+        pcfg = self.pcfg
         empirical_freq = self.calculate_frequencies([self.terminal_symbols])
+        deadline = time.monotonic() + time_budget if time_budget else None
+        previous_corr = None
         
         for i in range(iterations):
-            generated_chains = []
-            for _ in range(5):
-                chain = self.simulate_chain(max_length=len(self.terminal_symbols))
-                generated_chains.append(chain)
-            
-            gen_freq = self.calculate_frequencies(generated_chains)
+            job.check()
+            job.report(i, iterations)
+            if mode == "analytic":
+                # Erwartete Häufigkeiten exakt aus der Übergangsmatrix
+                gen_counts = self.expected_frequencies(len(self.terminal_symbols), pcfg)
+                detail = "exact"
+            else:
+                # Viele Ketten pro Iteration, stapelweise bis die Schätzung stabil ist
+                sampler = self.compile_sampler(seed=None if seed is None else seed + i, pcfg=pcfg)
+                gen_counts, stderr, n_chains = estimate_counts(
+                    sampler, self._terminal_counter(sampler), len(self.terminal_symbols),
+                    reference=empirical_freq, max_chains=max_chains, batch_chains=batch_chains,
+                    tol=tol, deadline=deadline, include_start=False,
+                )
+                detail = f"±{stderr:.3f}, {n_chains} chains"
+            gen_freq = gen_counts / gen_counts.sum() if gen_counts.sum() > 0 else gen_counts
             corr, p_value = pearsonr(empirical_freq, gen_freq)
             
-            self.log(f"Iteration {i+1}: Correlation = {corr:.3f}, p = {p_value:.3f}")
+            self.log(f"Iteration {i+1}: Correlation = {corr:.3f} ({detail}), p = {p_value:.3f}")
             
             if corr > 0.9:
                 break
+            if previous_corr is not None and abs(corr - previous_corr) < tol:
+                self.log("Converged.")
+                break
+            if deadline is not None and time.monotonic() > deadline:
+                self.log("Time budget exhausted.")
+                break
+            previous_corr = corr
                 
-            self.adjust_probabilities(empirical_freq, gen_freq)
+            pcfg = self.adjust_probabilities(pcfg, empirical_freq, gen_freq)
+        job.report(iterations, iterations)
+        return pcfg
     
-    def calculate_frequencies(self, chains):
-        all_terminals = sorted(set(self.terminal_symbols))
-        freq = np.zeros(len(all_terminals))
-        term_to_idx = {t: i for i, t in enumerate(all_terminals)}
+    def _finish_optimization(self, pcfg):
+        self.pcfg = pcfg
+        self.log("Optimization finished.")
+    
+    def _expansion_matrix(self, symbols):
+        # Matrix: erzeugtes Symbol -> Anzahl Terminale seiner Expansion
+        table = SymbolTable(sorted(set(self.terminal_symbols)))
+        expansion = np.zeros((len(symbols), len(table)))
+        for i, item in enumerate(symbols):
+            for t in self._expand(item):
+                j = table.id(t)
+                if j >= 0:
+                    expansion[i, j] += 1
+        return expansion
+    
+    def _terminal_counter(self, sampler):
+        expansion = self._expansion_matrix(sampler.symbols)
         
-        for chain in chains:
-            for term in chain:
-                if term in term_to_idx:
-                    freq[term_to_idx[term]] += 1
+        def count(ids):
+            return count_unigrams(ids, len(sampler.symbols)) @ expansion
+        return count
+    
+    def expected_frequencies(self, max_length, pcfg=None):
+        # Erwartete Terminalhäufigkeiten für Ketten wie in simulate_chains,
+        # berechnet über dünne Matrix-Vektor-Produkte statt Simulation
+        from scipy.sparse import csr_matrix
+        pcfg = pcfg if pcfg is not None else self.pcfg
+        P, table = transition_matrix(pcfg)
+        n = len(table)
+        start = np.zeros(n)
+        start[[table.id(s) for s in pcfg]] = 1.0 / len(pcfg)
+        follow = [table.id(self._continue_from(s)) for s in table.symbols]
+        rows = [i for i, j in enumerate(follow) if j >= 0]
+        S = csr_matrix((np.ones(len(rows)), (rows, [follow[i] for i in rows])), shape=(n, n))
+        counts = expected_counts(P, start, max_length, next_state=S)
+        return counts @ self._expansion_matrix(table.symbols)
+    
+    def calculate_frequencies(self, chains):
+        table = SymbolTable(sorted(set(self.terminal_symbols)))
+        ids = [table.encode(chain, add=False) for chain in chains]
+        freq = count_unigrams(ids, len(table)).astype(float)
         
         return freq / freq.sum() if freq.sum() > 0 else freq
     
-    def adjust_probabilities(self, empirical_freq, gen_freq):
+    def adjust_probabilities(self, pcfg, empirical_freq, gen_freq):
+        # Regeln auf Terminale um 0.1 * Abweichung verschieben (auf [0.01, 0.99]
+        # begrenzt), Regeln auf Nonterminale bleiben; danach neu normalisieren.
+        # Liefert eine neue Grammatik
         all_terminals = sorted(set(self.terminal_symbols))
         adjustment = empirical_freq - gen_freq
-        
-        for src in self.pcfg:
-            new_rules = {}
-            for dst in self.pcfg[src]:
-                if dst in all_terminals:
-                    idx = all_terminals.index(dst)
-                    new_prob = max(0.01, min(0.99, self.pcfg[src][dst] + 0.1 * adjustment[idx]))
-                    new_rules[dst] = new_prob
-                else:
-                    new_rules[dst] = self.pcfg[src][dst]
-            
-            total = sum(new_rules.values())
-            self.pcfg[src] = {k: v/total for k, v in new_rules.items()}
+        columns = pcfg.table.encode(all_terminals, add=False)
+        return pcfg.adjust_columns(columns, 0.1 * adjustment)
+    
+    def _expand(self, item):
+        # Terminal-Expansion: Nonterminale rekursiv, Regel-Rümpfe ("A B") gliedweise
+        if item in self.nonterminals:
+            return [t for part in self.nonterminals[item] for t in self._expand(part)]
+        if " " in item:
+            return [t for part in item.split() for t in self._expand(part)]
+        return [item]
+    
+    def _continue_from(self, item):
+        expanded = self._expand(item)
+        return expanded[-1] if expanded else None
+    
+    def compile_sampler(self, seed=None, pcfg=None):
+        # Nonterminale werden expandiert, weiter geht es ab ihrem letzten Terminal
+        return ChainSampler(pcfg if pcfg is not None else self.pcfg, seed=seed, state_of=self._continue_from)
+    
+    def simulate_chains(self, n_chains, max_length=10, sampler=None):
+        sampler = sampler or self.compile_sampler()
+        items = sampler.sample_symbols(n_chains, max_length, include_start=False)
+        return [[t for item in chain for t in self._expand(item)] for chain in items]
     
     def simulate_chain(self, max_length=10):
-        chain = []
-        current = np.random.choice(list(self.pcfg.keys()))
-        
-        for _ in range(max_length):
-            if current not in self.pcfg:
-                break
-                
-            next_options = list(self.pcfg[current].keys())
-            probs = list(self.pcfg[current].values())
-            next_item = np.random.choice(next_options, p=probs)
-            
-            if next_item.startswith("NT_"):
-                expanded = next_item[3:].replace("_", " ").split()
-                chain.extend(expanded)
-                current = expanded[-1] if expanded else None
-            else:
-                chain.append(next_item)
-                current = next_item
-        
-        return chain
+        return self.simulate_chains(1, max_length)[0]
     
     def simulate_dialog(self):
         if not self.pcfg:
@@ -207,11 +385,11 @@ class ARSGUI:
             
         if format == "json":
             with open(file, 'w') as f:
-                json.dump(self.pcfg, f, indent=2)
+                json.dump(self.pcfg.to_dict(), f, indent=2)
         elif format == "yaml":
             import yaml
             with open(file, 'w') as f:
-                yaml.dump(self.pcfg, f)
+                yaml.dump(self.pcfg.to_dict(), f)
         
         self.log(f"Grammar exported to {file}")
 
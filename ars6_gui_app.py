@@ -1,33 +1,61 @@
 import os
 import json
 import numpy as np
-from sklearn.cluster import HDBSCAN
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sentence_transformers import SentenceTransformer
-from collections import defaultdict
-from scipy.stats import pearsonr
 import tkinter as tk
 from tkinter import filedialog, ttk, messagebox
-import networkx as nx
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-from nltk import ngrams
-from langdetect import detect
-from transformers import pipeline
 import threading
+import time
 from copy import deepcopy
 
+from ars_cache import MeaningCache
+from ars_ingest import ingest_files
+from ars_lang import UNKNOWN, detect_languages, language_summary, route_by_language
+from ars_llm import generate_batched
+from ars_rules import get_classifier
+from ars_cluster import CategoryModel, cluster_embeddings
+from ars_embed import get_engine
+from ars_grammar import (
+    Grammar, SymbolTable, TransitionModel, pair_counts, count_selected_pairs, remap_chains,
+    transition_matrix, expected_counts, expected_bigram_counts, reduce_to_terminals,
+)
+from ars_sampler import ChainSampler, estimate_counts
+from ars_artifact import save_artifact, load_artifact
+from ars_jobs import JobScheduler, JobCancelled
+from ars_models import get_llm, MULTILINGUAL_ENCODER, DEFAULT_LLM
+
+MEANING_PROMPT = """Generate a SINGLE, concise interpretation for this dialog utterance in German:
+        Context: '{context}'
+        Utterance: '{utterance}'
+        Interpretation: The speaker"""
+
+# Persistenter Bedeutungs-Cache (SQLite); Pfad über ARS_MEANING_CACHE änderbar
+MEANING_CACHE_PATH = os.environ.get(
+    "ARS_MEANING_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "ars", "meanings.sqlite"))
+
 class EnhancedDialogAnalyzer:
     def __init__(self, root):
         self.root = root
         self.root.title("LLM-enhanced Dialog Analyzer")
         
-        # Modelle initialisieren
-        self.embedding_model = SentenceTransformer("paraphrase-multilingual-mpnet-base-v2")
-        self.llm = pipeline("text2text-generation", model="google/flan-t5-base")
+        # Modelle werden erst bei der ersten Verwendung geladen
+        self.embedding_model_name = MULTILINGUAL_ENCODER
+        self.llm_model_name = DEFAULT_LLM
+        self.cluster_method = None  # Standard aus ARS_CLUSTER_METHOD, sonst HDBSCAN
+        self.category_model = CategoryModel(encoder=self.embedding_model_name)
+        
+        self._meaning_cache = None
+        self.rules = get_classifier()  # Regeltabelle aus ARS_RULES oder eingebaut
+        # Hintergrundjobs: jede Stufe wartet auf die vorherige (after=...)
+        self.jobs = JobScheduler(root)
+        self._preprocess_job = None
+        self._meaning_job = None
+        self._pcfg_job = None
         
         # Datenstrukturen
         self.transcripts = []
+        self.languages = []
+        self.embeddings = None
+        self.embeddings_by_encoder = {}
         self.interacts = []
         self.pcfg = {}
         self.empirical_chain = []
@@ -36,6 +64,21 @@ class EnhancedDialogAnalyzer:
         self.setup_ui()
         self.setup_visualization()
         
+    @property
+    def embedding_model(self):
+        return get_engine(self.embedding_model_name)
+    
+    @property
+    def llm(self):
+        return get_llm(self.llm_model_name)
+    
+    @property
+    def meaning_cache(self):
+        # Bei Modellwechsel neu öffnen, da das Modell Teil des Schlüssels ist
+        if self._meaning_cache is None or self._meaning_cache.model_name != self.llm_model_name:
+            self._meaning_cache = MeaningCache(MEANING_CACHE_PATH, self.llm_model_name, MEANING_PROMPT)
+        return self._meaning_cache
+        
     def setup_ui(self):
         main_frame = ttk.Frame(self.root, padding="10")
         main_frame.grid(row=0, column=0, sticky="nsew")
@@ -54,7 +97,18 @@ class EnhancedDialogAnalyzer:
         self.output_text = tk.Text(main_frame, height=20, width=80)
         self.output_text.grid(row=0, column=1, rowspan=5, padx=10)
         
+        ttk.Button(main_frame, text="Cancel",
+                  command=self.cancel_analysis).grid(row=5, column=0, pady=5)
+        self.progress = ttk.Progressbar(main_frame, mode="determinate")
+        self.progress.grid(row=5, column=1, sticky="ew", padx=10)
+        ttk.Button(main_frame, text="Save Analysis",
+                  command=self.save_analysis).grid(row=6, column=0, pady=5)
+        ttk.Button(main_frame, text="Load Analysis",
+                  command=self.load_analysis).grid(row=7, column=0, pady=5)
+        
     def setup_visualization(self):
+        import matplotlib.pyplot as plt
+        from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
         self.figure = plt.Figure(figsize=(8, 6), dpi=100)
         self.canvas = FigureCanvasTkAgg(self.figure, master=self.root)
         self.canvas.get_tk_widget().grid(row=0, column=2, rowspan=5, padx=10)
@@ -64,91 +118,146 @@ class EnhancedDialogAnalyzer:
         if not files:
             return
             
-        self.transcripts = []
-        for file in files:
-            with open(file, 'r', encoding='utf-8') as f:
-                self.transcripts.extend([line.strip() for line in f if line.strip()])
+        self.corpus = ingest_files(files)
+        self.transcripts = self.corpus.lines()
         
         self.log(f"Loaded {len(self.transcripts)} utterances")
-        threading.Thread(target=self._preprocess).start()
+        self.embeddings = None
+        self.embeddings_by_encoder = {}
+        self._preprocess_job = self.jobs.submit(
+            "preprocess", self._preprocess, on_error=self._job_failed, on_progress=self._show_progress)
     
-    def _preprocess(self):
-        self.root.after(0, lambda: self.log("Detecting languages..."))
-        languages = set()
-        for utterance in self.transcripts:
-            try:
-                lang = detect(utterance)
-                languages.add(lang)
-            except:
-                pass
-        self.root.after(0, lambda: self.log(f"Detected languages: {', '.join(languages)}"))
-        
-        self.root.after(0, lambda: self.log("Creating embeddings..."))
-        self.embeddings = self.embedding_model.encode(self.transcripts)
+    @staticmethod
+    def _pending(job):
+        return job if job is not None and job.active else None
+    
+    def _job_failed(self, error):
+        if isinstance(error, JobCancelled):
+            self.log(f"Cancelled: {error}")
+        else:
+            self.log(f"Failed: {error}")
+    
+    def _preprocess(self, job):
+        self.log("Detecting languages...")
+        # Kurze Äußerungen erben die Sprache ihres Sprechers in der Datei
+        groups = list(zip(self.corpus.file_ids.tolist(), self.corpus.speaker_ids.tolist()))
+        try:
+            self.languages = detect_languages(self.corpus.texts(), groups)
+        except Exception as e:
+            self.log(f"Language detection failed: {e}")
+            self.languages = [UNKNOWN] * len(self.transcripts)
+        summary = ", ".join(f"{lang} ({n})" for lang, n in language_summary(self.languages))
+        self.log(f"Detected languages: {summary}")
+        
+        self.log("Creating embeddings...")
+        # Encoder je Sprache (z. B. Englisch mit MiniLM, sonst mehrsprachig);
+        # verschiedene Encoder liefern getrennte Vektorräume
+        embeddings_by_encoder = {}
+        done = 0
+        for name, idx in route_by_language(self.languages).items():
+            vectors = get_engine(name).encode(
+                [self.transcripts[i] for i in idx], cancel=job.cancel_event,
+                progress=lambda n, total, done=done: job.report(done + n, len(self.transcripts)))
+            done += len(idx)
+            embeddings_by_encoder[name] = (np.asarray(idx, dtype=np.int64), vectors)
+            self.log(f"  {name}: {len(idx)} utterances")
+        self.embeddings_by_encoder = embeddings_by_encoder
+        # Eine gemeinsame Matrix nur bei einem Encoder; sonst bleiben die
+        # Vektorräume getrennt (je Encoder Zeilenindizes + Matrix)
+        if len(embeddings_by_encoder) == 1:
+            self.embeddings = next(iter(embeddings_by_encoder.values()))[1]
+        else:
+            self.embeddings = None
         
     def analyze_meanings(self):
         if not self.transcripts:
             messagebox.showwarning("Warning", "Load transcripts first!")
             return
+        if self._pending(self._meaning_job):
+            messagebox.showinfo("Info", "Meaning analysis is already running.")
+            return
             
+        # Läuft im Hintergrund, nach einer ggf. noch laufenden Vorverarbeitung
+        self.progress["value"] = 0
+        self.log(f"Analyzing meanings of {len(self.transcripts)} utterances...")
+        self._meaning_job = self.jobs.submit(
+            "meaning analysis", self._analyze_meanings_worker, list(self.transcripts),
+            after=self._pending(self._preprocess_job),
+            on_done=lambda result: self._finish_meanings(*result),
+            on_error=self._job_failed, on_progress=self._show_progress)
+    
+    def cancel_analysis(self):
+        if self.jobs.busy():
+            self.log("Cancelling after the current batch...")
+            self.jobs.cancel()
+    
+    def _analyze_meanings_worker(self, job, transcripts):
+        start = time.perf_counter()
+        cache = self.meaning_cache
+        # Zuerst manuelle Klassifikation versuchen (ein Regex-Lauf für alle)
+        self.rules.reset_stats()
+        meanings = self.rules.classify(transcripts)
+        # Der Kontext hängt nur vom Text der drei vorherigen Äußerungen ab,
+        # daher lassen sich alle Prompts vorab bauen
+        contexts = [" | ".join(transcripts[max(0, i - 3):i]) for i in range(len(transcripts))]
+        pending = [i for i, m in enumerate(meanings) if m is None]
+        keys = [cache.key(transcripts[i], contexts[i]) for i in pending]
+        for i, cached in zip(pending, cache.get_many(keys)):
+            meanings[i] = cached
+        
+        # Fehlende Bedeutungen gebündelt erzeugen, gleiche Schlüssel nur einmal
+        todo = {}
+        for i, key in zip(pending, keys):
+            if meanings[i] is None:
+                todo.setdefault(key, []).append(i)
+        prompts = [MEANING_PROMPT.format(context=contexts[idx[0]], utterance=transcripts[idx[0]])
+                   for idx in todo.values()]
+        
+        # Abbruch zwischen zwei Stapeln; bereits Erzeugtes bleibt im Cache
+        generated = generate_batched(self.llm, prompts, progress=job.report, cancel=job.cancel_event,
+                                     max_length=50, num_return_sequences=1) if prompts else []
+        cache.put_many((key, m) for key, m in zip(todo, generated) if m is not None)
+        for idx, meaning in zip(todo.values(), generated):
+            for i in idx:
+                meanings[i] = meaning
+        elapsed = time.perf_counter() - start
+        return transcripts, meanings, pending, job.cancelled(), len(prompts), elapsed
+    
+    def _show_progress(self, done, total):
+        self.progress["maximum"] = total
+        self.progress["value"] = done
+    
+    def _finish_meanings(self, transcripts, meanings, generated, cancelled, n_prompts, elapsed):
+        stats = self.meaning_cache.stats()
+        cache_line = (f"Meaning cache: {stats['memory_hits']} memory hits, {stats['disk_hits']} disk hits, "
+                      f"{stats['misses']} misses (hit rate {stats['hit_rate']:.0%}, {stats['entries']} entries)")
+        if cancelled:
+            # Bereits erzeugte Bedeutungen liegen im Cache, ein neuer Lauf setzt dort fort
+            done = sum(1 for i in generated if meanings[i] is not None)
+            self.log(f"Meaning analysis cancelled ({done}/{len(generated)} LLM meanings available).")
+            self.log(cache_line)
+            return
+        
         self.interacts = []
-        for i, utterance in enumerate(self.transcripts):
-            # Zuerst manuelle Klassifikation versuchen
-            manual_meaning = self._preprocess_utterance(utterance)
-            if manual_meaning:
-                self.interacts.append({
-                    "utterance": utterance,
-                    "meanings": [manual_meaning],
-                    "selected_meaning": manual_meaning
-                })
-                continue
-                
-            context = " | ".join([u["utterance"] for u in self.interacts[-3:]]) if i > 0 else ""
-            meanings = self._generate_meanings(utterance, context)
-            filtered_meanings = self._filter_meanings(meanings, i)
-            
+        llm_indices = set(generated)
+        for i, (utterance, meaning) in enumerate(zip(transcripts, meanings)):
+            meaning = meaning or "UNK"
+            filtered_meanings = self._filter_meanings([meaning], i)
             self.interacts.append({
                 "utterance": utterance,
-                "meanings": meanings,
+                "meanings": [meaning],
                 "selected_meaning": filtered_meanings[0] if filtered_meanings else "UNK"
             })
-            
-            self.log(f"Utterance {i+1}: {utterance[:50]}...")
-            self.log(f"  Selected meaning: {filtered_meanings[0] if filtered_meanings else 'UNK'}")
-    
-    def _preprocess_utterance(self, utterance):
-        # Kürzen und Normalisieren
-        utterance = utterance[:100].lower().replace('\n', ' ')
-        
-        # Erweiterte Mustererkennung
-        patterns = {
-            'order': ['bitte', 'nehme', 'hätte', 'kaufen', 'gramm', 'kilo'],
-            'question': ['?', 'wie', 'was', 'wo '],
-            'confirmation': ['ja', 'okay', 'genau', 'richtig'],
-            'greeting': ['guten tag', 'hallo', 'guten morgen'],
-            'thanks': ['danke', 'vielen dank', 'dankeschön']
-        }
-        
-        for category, keywords in patterns.items():
-            if any(kw in utterance for kw in keywords):
-                return f"{category.upper()}"
-        
-        return None
-    
-    def _generate_meanings(self, utterance, context):
-        manual_meaning = self._preprocess_utterance(utterance)
-        if manual_meaning:
-            return [manual_meaning]
-            
-        prompt = f"""Generate a SINGLE, concise interpretation for this dialog utterance in German:
-        Context: '{context}'
-        Utterance: '{utterance}'
-        Interpretation: The speaker"""
-        try:
-            output = self.llm(prompt, max_length=50, num_return_sequences=1)
-            return [output[0]["generated_text"].strip()]
-        except Exception as e:
-            return ["UNK"]
+            if i in llm_indices:
+                self.log(f"Utterance {i+1}: {utterance[:50]}...")
+                self.log(f"  Selected meaning: {self.interacts[-1]['selected_meaning']}")
+        
+        rule_counts = self.rules.stats()["categories"]
+        self.log(f"Rule-based labels: {len(transcripts) - len(generated)}/{len(transcripts)} "
+                 f"({', '.join(f'{c} {n}' for c, n in rule_counts.items())})")
+        rate = n_prompts / elapsed if elapsed > 0 else 0.0
+        self.log(f"Generated {n_prompts} meanings in {elapsed:.1f}s ({rate:.1f}/s)")
+        self.log(cache_line)
     
     def _filter_meanings(self, meanings, index):
         if index == 0 or not meanings:
@@ -156,16 +265,28 @@ class EnhancedDialogAnalyzer:
         return [meanings[0]]  # Immer erste Bedeutung akzeptieren
     
     def build_semantic_pcfg(self):
-        if not self.interacts:
+        pending = self._pending(self._meaning_job)
+        if not self.interacts and pending is None:
             messagebox.showwarning("Warning", "Analyze meanings first!")
             return
-            
+        self.progress["value"] = 0
+        self._pcfg_job = self.jobs.submit(
+            "build PCFG", self._build_semantic_pcfg, after=pending,
+            on_error=self._job_failed, on_progress=self._show_progress)
+    
+    def _build_semantic_pcfg(self, job):
+        if not self.interacts:
+            # Bedeutungsanalyse wurde abgebrochen, bevor Ergebnisse vorlagen
+            self.log("No meanings available.")
+            return
         meaning_embeddings = self.embedding_model.encode(
-            [i["selected_meaning"] for i in self.interacts]
+            [i["selected_meaning"] for i in self.interacts], progress=job.report, cancel=job.cancel_event
         )
         
-        clusterer = HDBSCAN(min_cluster_size=3, metric='cosine')
-        clusters = clusterer.fit_predict(meaning_embeddings)
+        clusters = cluster_embeddings(meaning_embeddings, method=self.cluster_method,
+                                      min_cluster_size=3, metric='cosine')
+        # Stabile Kategorie-IDs über wiederholte Läufe (siehe CategoryModel)
+        clusters = self.category_model.update(meaning_embeddings, clusters)
         
         terminal_symbols = []
         for i, cluster_id in enumerate(clusters):
@@ -174,125 +295,155 @@ class EnhancedDialogAnalyzer:
             else:
                 terminal_symbols.append(f"C_{cluster_id}")
         
-        self.pcfg = defaultdict(dict)
         self.empirical_chain = terminal_symbols
         
-        # Stärkere Gewichtung häufiger Übergänge mit exponentieller Gewichtung
-        for i in range(len(terminal_symbols)-1):
-            src = terminal_symbols[i]
-            dst = terminal_symbols[i+1]
-            src_nt = f"NT_{src}"
-            
-            weight = np.exp(-0.1 * i)  # Exponentielle Gewichtung für nahe Übergänge
-            self.pcfg[src][src_nt] = 1.0
-            self.pcfg[src_nt][dst] = self.pcfg[src_nt].get(dst, 0) + weight
-        
-        # Normalisierung der Wahrscheinlichkeiten
-        for src in self.pcfg:
-            total = sum(self.pcfg[src].values())
-            self.pcfg[src] = {dst: count/total for dst, count in self.pcfg[src].items()}
+        from scipy.sparse import csr_matrix
+        # Regeln src -> NT_src (1.0) und NT_src -> dst; stärkere Gewichtung
+        # naher Übergänge mit exponentieller Gewichtung, als dünne Matrix
+        table = SymbolTable()
+        ids = table.encode(terminal_symbols)
+        src, dst = ids[:-1], ids[1:]
+        nt = table.encode([f"NT_{s}" for s in terminal_symbols[:-1]])
+        weights = np.exp(-0.1 * np.arange(len(src)))
+        rows = np.concatenate([src, nt])
+        cols = np.concatenate([nt, dst])
+        values = np.concatenate([np.ones(len(src)), weights])
+        n = len(table)
+        self.pcfg = Grammar(csr_matrix((values, (rows, cols)), shape=(n, n)), table).normalize()
         
         self.log("\nGenerated Semantic PCFG:")
         for src in list(self.pcfg.keys())[:5]:
             for dst, prob in list(self.pcfg[src].items())[:3]:
                 self.log(f"  {src.ljust(10)} → {dst.ljust(15)} [{prob:.2f}]")
     
-    def _calculate_frequencies(self, chains):
-        freq_dict = defaultdict(lambda: defaultdict(int))
-        
-        for chain in chains:
-            for i in range(len(chain)-1):
-                current = chain[i]
-                next_symbol = chain[i+1]
-                freq_dict[current][next_symbol] += 1
-        
-        all_transitions = []
-        for src in freq_dict:
-            for dst in freq_dict[src]:
-                all_transitions.append(freq_dict[src][dst])
-        
-        return np.array(all_transitions)
-
-    def _simulate_chain(self, max_length):
+    def save_analysis(self):
         if not self.pcfg:
-            return []
-        
-        chain = []
-        current = np.random.choice(list(self.pcfg.keys()))
-        chain.append(current)
-        
-        while len(chain) < max_length:
-            if current not in self.pcfg:
-                break
-                
-            next_symbols = list(self.pcfg[current].keys())
-            probs = list(self.pcfg[current].values())
-            next_symbol = np.random.choice(next_symbols, p=probs)
-            
-            chain.append(next_symbol)
-            current = next_symbol
-            
-        return chain
-
-    def _adjust_probabilities(self, empirical, generated):
+            messagebox.showwarning("Warning", "Build PCFG first!")
+            return
+        file = filedialog.asksaveasfilename(defaultextension=".npz", filetypes=[("ARS analysis", "*.npz")])
+        if not file:
+            return
+        # Bedeutungen und Sprachen als Textspalten je Äußerung
+        columns = {"meaning": [i["selected_meaning"] for i in self.interacts]}
+        if len(self.languages) == len(self.interacts):
+            columns["language"] = self.languages
+        corpus = getattr(self, "corpus", None)
+        save_artifact(
+            file, self.pcfg, labels=self.empirical_chain,
+            utterances=[i["utterance"] for i in self.interacts], embeddings=self.embeddings,
+            embedding_groups=self.embeddings_by_encoder if self.embeddings is None else None,
+            files=corpus.files if corpus is not None else None,
+            file_ids=corpus.file_ids if corpus is not None else None,
+            line_numbers=corpus.line_numbers if corpus is not None else None,
+            columns=columns,
+            meta={"encoder": self.embedding_model_name, "llm": self.llm_model_name},
+        )
+        self.log(f"Analysis saved to {file}")
+    
+    def load_analysis(self):
+        # Ersetzt die Schritte 1–3: keine Einbettung, kein LLM, kein Clustering
+        file = filedialog.askopenfilename(filetypes=[("ARS analysis", "*.npz")])
+        if not file:
+            return
+        start = time.perf_counter()
+        try:
+            artifact = load_artifact(file)
+        except (ValueError, KeyError, OSError) as e:
+            messagebox.showerror("Error", f"Cannot load analysis: {e}")
+            return
+        self.pcfg = artifact.grammar
+        self.empirical_chain = artifact.label_symbols or []
+        self.transcripts = artifact.utterances or []
+        meanings = artifact.column("meaning") or ["UNK"] * len(self.transcripts)
+        self.interacts = [{"utterance": u, "meanings": [m], "selected_meaning": m}
+                          for u, m in zip(self.transcripts, meanings)]
+        self.languages = artifact.column("language") or []
+        self.embeddings = artifact.embeddings
+        self.embeddings_by_encoder = artifact.embedding_groups
+        self.log(f"Loaded analysis from {file} in {time.perf_counter() - start:.3f}s: "
+                 f"{len(self.transcripts)} utterances, {len(self.pcfg)} rule sources.")
+    
+    def _adjust_probabilities(self, pcfg, empirical, generated):
         # Dynamische Lernrate basierend auf Datensatzgröße
         adjustment_factor = max(0.01, 0.2 * (1 - np.exp(-len(self.empirical_chain)/100)))
         
-        temp_freq = defaultdict(lambda: defaultdict(float))
-        
-        for i in range(len(self.empirical_chain)-1):
-            src = self.empirical_chain[i]
-            dst = self.empirical_chain[i+1]
-            temp_freq[src][dst] += 1
-        
-        for src in self.pcfg:
-            for dst in self.pcfg[src]:
-                base_prob = temp_freq[src].get(dst, 0)
-                smoothed_prob = (base_prob + 0.1) / (sum(temp_freq[src].values()) + 0.1 * len(self.pcfg[src]))
-                self.pcfg[src][dst] = (1 - adjustment_factor) * self.pcfg[src][dst] + \
-                                      adjustment_factor * smoothed_prob
-        
-        for src in self.pcfg:
-            total = sum(self.pcfg[src].values())
-            if total > 0:
-                for dst in self.pcfg[src]:
-                    self.pcfg[src][dst] /= total
+        # Empirische Übergänge, additiv geglättet auf dem Regelmuster der
+        # Grammatik, werden mit adjustment_factor eingemischt
+        counts = TransitionModel().update(self.empirical_chain).to_grammar()
+        smoothed = pcfg.smooth(counts, alpha=0.1)
+        return pcfg.blend(smoothed, adjustment_factor).normalize()
     
-    def optimize_grammar(self, iterations=20):
-        if not self.pcfg:
+    def optimize_grammar(self, iterations=20, mode="analytic", max_chains=5000, batch_chains=500,
+                         tol=0.005, time_budget=60.0, seed=0):
+        pending = self._pending(self._pcfg_job)
+        if not self.pcfg and pending is None:
             messagebox.showwarning("Warning", "Build PCFG first!")
             return
+        self.progress["value"] = 0
+        return self.jobs.submit(
+            "optimize", self._optimize_grammar, iterations, mode, max_chains, batch_chains,
+            tol, time_budget, seed, after=pending, on_done=self._finish_optimization,
+            on_error=self._job_failed, on_progress=self._show_progress)
+    
+    def _optimize_grammar(self, job, iterations=20, mode="analytic", max_chains=5000, batch_chains=500,
+                          tol=0.005, time_budget=60.0, seed=0):
+        from scipy.stats import pearsonr
             
-        empirical_freq = self._calculate_frequencies([self.empirical_chain])
+        # Empirische Übergänge als feste Referenz; erzeugte Ketten werden auf
+        # genau diese Übergänge gezählt (gleiche Reihenfolge, gleiche Länge)
+        table = SymbolTable()
+        rows, cols, empirical_freq = pair_counts([table.encode(self.empirical_chain)], len(table), order="first")
+        # Der Worker optimiert eine eigene Kopie; self.pcfg wird erst im
+        # UI-Thread ersetzt (_finish_optimization), Export/Simulation lesen solange die alte
+        pcfg = deepcopy(self.pcfg)
         best_corr = -1
-        best_pcfg = deepcopy(self.pcfg)
+        best_pcfg = pcfg
+        previous_corr = None
+        deadline = time.monotonic() + time_budget if time_budget else None
         
         for i in range(iterations):
-            generated_chains = [
-                self._simulate_chain(max_length=len(self.empirical_chain)) 
-                for _ in range(5)
-            ]
-            
-            gen_freq = self._calculate_frequencies(generated_chains)
-            
-            min_length = min(len(empirical_freq), len(gen_freq))
-            empirical = empirical_freq[:min_length]
-            generated = gen_freq[:min_length]
+            if job.cancelled():
+                self.log("Optimization cancelled.")
+                break
+            job.report(i, iterations)
+            if mode == "analytic":
+                gen_freq = self._expected_transitions(pcfg, table, rows, cols, len(self.empirical_chain))
+                detail = "exact"
+            else:
+                sampler = ChainSampler(pcfg, seed=None if seed is None else seed + i)
+                mapping = table.encode(sampler.symbols, add=False)
+                
+                def count(ids):
+                    # Nonterminale (NT_*) fallen heraus, gezählt wird die Terminalkette
+                    return count_selected_pairs(remap_chains(ids, mapping), len(table), rows, cols)
+                
+                gen_freq, stderr, n_chains = estimate_counts(
+                    sampler, count, len(self.empirical_chain), reference=empirical_freq,
+                    max_chains=max_chains, batch_chains=batch_chains, tol=tol, deadline=deadline,
+                )
+                detail = f"±{stderr:.3f}, {n_chains} chains"
             
             try:
-                if len(empirical) > 1 and len(generated) > 1:
-                    corr, p_value = pearsonr(empirical, generated)
-                    self.log(f"Iteration {i+1}: r = {corr:.3f}, p = {p_value:.3f}")
+                if len(empirical_freq) > 1 and gen_freq.sum() > 0:
+                    corr, p_value = pearsonr(empirical_freq, gen_freq)
+                    self.log(f"Iteration {i+1}: r = {corr:.3f} ({detail}), p = {p_value:.3f}")
                     
                     if abs(corr) > 0.3 and p_value < 0.1:  # Nur signifikante Anpassungen
                         if corr > best_corr:
                             best_corr = corr
-                            best_pcfg = deepcopy(self.pcfg)
+                            best_pcfg = pcfg
                         
-                        self._adjust_probabilities(empirical_freq, gen_freq)
+                        pcfg = self._adjust_probabilities(pcfg, empirical_freq, gen_freq)
                     
                     if corr > 0.9:
                         break
+                    if previous_corr is not None and abs(corr - previous_corr) < tol:
+                        self.log("Converged.")
+                        break
+                    if deadline is not None and time.monotonic() > deadline:
+                        self.log("Time budget exhausted.")
+                        break
+                    previous_corr = corr
                 else:
                     self.log(f"Iteration {i+1}: Not enough data for correlation")
                     break
@@ -301,13 +452,39 @@ class EnhancedDialogAnalyzer:
                 self.log(f"Error in iteration {i+1}: {str(e)}")
                 break
         
-        self.pcfg = best_pcfg  # Restore best version
+        job.report(iterations, iterations)
+        return best_pcfg, best_corr
+    
+    def _finish_optimization(self, result):
+        self.pcfg, best_corr = result  # Beste Version übernehmen
         self.log(f"Optimization finished. Best r = {best_corr:.3f}")
         self.evaluate_grammar()
 
+    def _expected_transitions(self, pcfg, table, rows, cols, length):
+        # Erwartete Terminal-Übergänge einer simulierten Kette der Länge `length`:
+        # Nonterminale werden aus der Übergangsmatrix eliminiert, danach
+        # Besuchshäufigkeiten über dünne Matrix-Vektor-Produkte
+        P, full = transition_matrix(pcfg)
+        start = np.zeros(len(full))
+        start[[full.id(s) for s in pcfg]] = 1.0 / len(pcfg)
+        is_terminal = np.array([s in table for s in full.symbols], dtype=bool)
+        
+        visits = start + expected_counts(P, start, length - 1)
+        horizon = int(round(visits[is_terminal].sum()))
+        Q, terminals, start_terminal = reduce_to_terminals(P, is_terminal, start)
+        bigrams = expected_bigram_counts(Q, start_terminal, horizon)
+        
+        position = np.full(len(table), -1)
+        position[table.encode([full.symbols[t] for t in terminals], add=False)] = np.arange(len(terminals))
+        r, c = position[rows], position[cols]
+        found = (r >= 0) & (c >= 0)
+        expected = np.zeros(len(rows))
+        expected[found] = np.asarray(bigrams[r[found], c[found]]).ravel()
+        return expected
+
     def evaluate_grammar(self):
         # Berechne Konsistenz der generierten Dialoge
-        test_chains = [self._simulate_chain(10) for _ in range(10)]
+        test_chains = ChainSampler(self.pcfg).sample_symbols(10, 10)
         coherence_scores = [self._calculate_coherence(chain) for chain in test_chains]
         self.log(f"Average coherence: {np.mean(coherence_scores):.2f}")
 
@@ -323,6 +500,8 @@ class EnhancedDialogAnalyzer:
         if not self.pcfg:
             messagebox.showwarning("Warning", "Build PCFG first!")
             return
+        import networkx as nx
+        import matplotlib.pyplot as plt
 
         self.figure.clf()
         G = nx.DiGraph()
@@ -382,6 +561,10 @@ class EnhancedDialogAnalyzer:
         self.canvas.draw()
     
     def log(self, message):
+        if threading.current_thread() is not threading.main_thread():
+            # Aus Hintergrundjobs: Tk nur im UI-Thread anfassen
+            self.jobs.call_soon(self.log, message)
+            return
         self.output_text.insert(tk.END, message + "\n")
         self.output_text.see(tk.END)
 
@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import struct
+import zipfile
+import numpy as np
+
+from ars_grammar import Grammar, SymbolTable
+
+# Binäres Analyse-Artefakt: Symboltabelle, Grammatik (CSR), Übergangszählungen,
+# Nonterminal-Expansionen, Label je Äußerung, Äußerungen samt Herkunft und
+# optional Embeddings in einer unkomprimierten .npz-Datei. np.load ignoriert
+# mmap_mode bei .npz; die Arrays werden deshalb direkt an ihrem Offset in der
+# Datei als Memmap geöffnet, Laden kostet unabhängig von der Größe nur
+# Millisekunden. Zeichenketten liegen als UTF-8-Puffer + Offsets vor.
+
+FORMAT = "ars-artifact"
+VERSION = 1
+EXTENSION = ".npz"
+
+
+def _pack_strings(strings):
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum(np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded)), out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+def _unpack_strings(blob, offsets):
+    raw = np.asarray(blob).tobytes()
+    bounds = np.asarray(offsets).tolist()
+    return [raw[a:b].decode("utf-8") for a, b in zip(bounds[:-1], bounds[1:])]
+
+
+def _put_strings(arrays, name, strings):
+    arrays[f"{name}_text"], arrays[f"{name}_offsets"] = _pack_strings(strings)
+
+
+def _put_grammar(arrays, name, grammar):
+    m = grammar.matrix
+    arrays[f"{name}_data"] = m.data
+    arrays[f"{name}_indices"] = m.indices
+    arrays[f"{name}_indptr"] = m.indptr
+
+
+def save_artifact(path, grammar, counts=None, nonterminals=None, nonterminal_counts=None,
+                  labels=None, utterances=None, embeddings=None, files=None, file_ids=None,
+                  line_numbers=None, columns=None, embedding_groups=None, meta=None):
+    # grammar: Grammar (Wahrscheinlichkeiten); counts: Grammar der Zählungen;
+    # nonterminals: {NT: [Symbol, ...]}; labels: Label je Äußerung (Symbole
+    # oder Cluster-Nummern); columns: weitere Textspalten je Äußerung;
+    # embedding_groups: {Encoder: (Zeilenindizes, Matrix)}, wenn Äußerungen
+    # mit verschiedenen Encodern (getrennten Vektorräumen) eingebettet wurden
+    grammar = Grammar.from_dict(grammar)
+    # Gemeinsame Symboltabelle für Grammatik, Zählungen, Expansionen und Labels
+    table = SymbolTable(grammar.symbols)
+    arrays = {}
+
+    numeric_labels = False
+    if labels is not None:
+        labels = np.asarray(labels) if not isinstance(labels, list) else labels
+        numeric_labels = isinstance(labels, np.ndarray) and labels.dtype.kind in "iu"
+        arrays["labels"] = table.encode(labels)
+    if counts is not None:
+        table.encode(counts.symbols)
+    if nonterminals:
+        heads = table.encode(list(nonterminals))
+        bodies = [table.encode(list(body)) for body in nonterminals.values()]
+        arrays["expansion_heads"] = heads
+        arrays["expansion_offsets"] = np.cumsum([0] + [len(b) for b in bodies]).astype(np.int64)
+        arrays["expansion_body"] = np.concatenate(bodies).astype(np.int32)
+        arrays["expansion_counts"] = np.array([(nonterminal_counts or {}).get(nt, 0) for nt in nonterminals],
+                                              dtype=np.int64)
+    # Erst jetzt ist die Tabelle vollständig; Matrizen auf ihre Größe bringen
+    _put_grammar(arrays, "grammar", Grammar(grammar.matrix, table))
+    if counts is not None:
+        _put_grammar(arrays, "counts", counts.align(table))
+    _put_strings(arrays, "symbols", table.symbols)
+
+    if utterances is not None:
+        _put_strings(arrays, "utterances", utterances)
+    if files is not None:
+        _put_strings(arrays, "files", [str(f) for f in files])
+    if file_ids is not None:
+        arrays["file_ids"] = np.asarray(file_ids, dtype=np.int32)
+    if line_numbers is not None:
+        arrays["line_numbers"] = np.asarray(line_numbers, dtype=np.int32)
+    for name, values in (columns or {}).items():
+        _put_strings(arrays, f"column_{name}", [str(v) for v in values])
+    if embeddings is not None:
+        arrays["embeddings"] = np.asarray(embeddings, dtype=np.float32)
+    for k, (rows, vectors) in enumerate((embedding_groups or {}).values()):
+        arrays[f"embedding_rows_{k}"] = np.asarray(rows, dtype=np.int64)
+        arrays[f"embeddings_{k}"] = np.asarray(vectors, dtype=np.float32)
+
+    # Feste Schlüssel nach meta: ein Aufrufer kann format/version/... nicht überschreiben
+    header = {
+        **(meta or {}),
+        "format": FORMAT,
+        "version": VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "numeric_labels": numeric_labels,
+        "columns": list(columns or {}),
+        "embedding_encoders": list(embedding_groups or {}),
+    }
+    arrays["header"] = np.frombuffer(json.dumps(header).encode("utf-8"), dtype=np.uint8)
+
+    # Erst vollständig schreiben, dann ersetzen: ein Abbruch lässt die alte Datei stehen
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, path)
+    return path
+
+
+_HEADER_READERS = {
+    (1, 0): np.lib.format.read_array_header_1_0,
+    (2, 0): np.lib.format.read_array_header_2_0,
+}
+
+
+def _map_members(path):
+    # Name -> Array; unkomprimierte Einträge als schreibgeschützte Memmap
+    arrays = {}
+    fallback = []
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        for info in archive.infolist():
+            name = info.filename[:-4] if info.filename.endswith(".npy") else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                fallback.append(name)
+                continue
+            # Lokaler Dateikopf: 30 Bytes + Name + Extrafeld, dann die .npy-Daten
+            f.seek(info.header_offset)
+            local = f.read(30)
+            name_len, extra_len = struct.unpack("<HH", local[26:30])
+            f.seek(info.header_offset + 30 + name_len + extra_len)
+            version = np.lib.format.read_magic(f)
+            reader = _HEADER_READERS.get(version)
+            if reader is None:
+                fallback.append(name)
+                continue
+            shape, fortran, dtype = reader(f)
+            if dtype.hasobject:
+                fallback.append(name)
+                continue
+            if int(np.prod(shape)) == 0:
+                arrays[name] = np.zeros(shape, dtype=dtype)
+                continue
+            arrays[name] = np.memmap(path, dtype=dtype, mode="r", offset=f.tell(), shape=shape,
+                                     order="F" if fortran else "C")
+    if fallback:
+        with np.load(path, allow_pickle=False) as data:
+            for name in fallback:
+                arrays[name] = data[name]
+    return arrays
+
+
+class Artifact:
+    """Geladenes Analyse-Artefakt.
+
+    Große Arrays (Embeddings, Texte, Labels) bleiben Memmaps; Symboltabelle,
+    Grammatik und Textlisten werden erst beim ersten Zugriff aufgebaut.
+    """
+
+    def __init__(self, arrays, meta, path=None):
+        self.arrays = arrays
+        self.meta = meta
+        self.path = path
+        self._table = None
+        self._strings = {}
+
+    def __contains__(self, name):
+        return name in self.arrays
+
+    def _string_list(self, name):
+        if name not in self._strings:
+            if f"{name}_text" not in self.arrays:
+                return None
+            self._strings[name] = _unpack_strings(self.arrays[f"{name}_text"], self.arrays[f"{name}_offsets"])
+        return self._strings[name]
+
+    def _grammar(self, name):
+        from scipy.sparse import csr_matrix
+        if f"{name}_data" not in self.arrays:
+            return None
+        n = len(self.table)
+        # Grammar bereinigt die Matrix in place, daher Kopien (nnz-groß)
+        parts = [np.array(self.arrays[f"{name}_{part}"]) for part in ("data", "indices", "indptr")]
+        return Grammar(csr_matrix(tuple(parts), shape=(n, n)), self.table)
+
+    @property
+    def table(self):
+        if self._table is None:
+            self._table = SymbolTable(self._string_list("symbols"))
+        return self._table
+
+    @property
+    def grammar(self):
+        return self._grammar("grammar")
+
+    @property
+    def counts(self):
+        return self._grammar("counts")
+
+    @property
+    def nonterminals(self):
+        if "expansion_heads" not in self.arrays:
+            return {}
+        symbols = self.table.symbols
+        offsets = self.arrays["expansion_offsets"].tolist()
+        body = self.arrays["expansion_body"].tolist()
+        return {symbols[h]: [symbols[i] for i in body[offsets[k]:offsets[k + 1]]]
+                for k, h in enumerate(self.arrays["expansion_heads"].tolist())}
+
+    @property
+    def nonterminal_counts(self):
+        if "expansion_heads" not in self.arrays:
+            return {}
+        symbols = self.table.symbols
+        return {symbols[h]: int(c) for h, c in zip(self.arrays["expansion_heads"].tolist(),
+                                                   self.arrays["expansion_counts"].tolist())}
+
+    @property
+    def label_ids(self):
+        return self.arrays.get("labels")
+
+    @property
+    def labels(self):
+        # Symbole je Äußerung; Cluster-Nummern kommen als int-Array zurück
+        ids = self.label_ids
+        if ids is None:
+            return None
+        symbols = self.table.symbols
+        if self.meta.get("numeric_labels"):
+            # Nur gelabelte Symbole sind Zahlen; Abbildung über eine Nachschlagetabelle
+            used = np.unique(ids)
+            lookup = np.zeros(len(symbols), dtype=np.int64)
+            lookup[used] = [int(symbols[i]) for i in used]
+            return lookup[ids]
+        return self.label_symbols
+
+    @property
+    def label_symbols(self):
+        ids = self.label_ids
+        if ids is None:
+            return None
+        return np.array(self.table.symbols, dtype=object)[ids].tolist()
+
+    @property
+    def utterances(self):
+        return self._string_list("utterances")
+
+    @property
+    def files(self):
+        return self._string_list("files")
+
+    @property
+    def file_ids(self):
+        return self.arrays.get("file_ids")
+
+    @property
+    def line_numbers(self):
+        return self.arrays.get("line_numbers")
+
+    @property
+    def embeddings(self):
+        return self.arrays.get("embeddings")
+
+    @property
+    def embedding_groups(self):
+        # {Encoder: (Zeilenindizes, Matrix)}; leer, wenn nur ein Encoder benutzt wurde
+        return {name: (self.arrays[f"embedding_rows_{k}"], self.arrays[f"embeddings_{k}"])
+                for k, name in enumerate(self.meta.get("embedding_encoders", []))}
+
+    def column(self, name):
+        return self._string_list(f"column_{name}")
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self.arrays.values())
+
+
+def load_artifact(path, mmap=True):
+    arrays = _map_members(path) if mmap else dict(np.load(path, allow_pickle=False))
+    header = arrays.pop("header", None)
+    meta = json.loads(np.asarray(header).tobytes().decode("utf-8")) if header is not None else {}
+    if meta.get("format") != FORMAT:
+        raise ValueError(f"Kein ARS-Artefakt: {path}")
+    if meta.get("version", 0) > VERSION:
+        raise ValueError(f"Artefakt-Version {meta['version']} ist neuer als unterstützt ({VERSION}): {path}")
+    return Artifact(arrays, meta, path=path)
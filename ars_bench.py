@@ -0,0 +1,473 @@
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+# Benchmarks für ARS. Aufruf z. B.:
+#   python ars_bench.py import --budget 0.8
+# Rückgabewert != 0, wenn ein Budget überschritten wird.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Module, die beim reinen Import nicht geladen werden dürfen
+HEAVY_MODULES = [
+    "sentence_transformers", "transformers", "torch", "sklearn", "hdbscan",
+    "yaml", "scipy", "umap", "networkx", "langdetect",
+]
+
+IMPORT_TARGETS = ["ars_core", "ars_cli", "ars_gui_app", "ars4_gui_app", "ars6_gui_app"]
+
+_IMPORT_PROBE = """
+import sys, time, json
+t = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - t
+print(json.dumps({{"seconds": elapsed, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure_import(module, repeat=3):
+    # Jeweils frischer Interpreter, damit der Kaltstart gemessen wird
+    best = None
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", _IMPORT_PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=HERE, capture_output=True, text=True,
+        )
+        if out.returncode != 0:
+            return {"module": module, "error": out.stderr.strip().splitlines()[-1]}
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        if best is None or result["seconds"] < best["seconds"]:
+            best = result
+    best["module"] = module
+    return best
+
+
+def bench_import(args):
+    failed = False
+    for module in args.modules or IMPORT_TARGETS:
+        result = measure_import(module, repeat=args.repeat)
+        if "error" in result:
+            print(f"{module:15s} FEHLER: {result['error']}")
+            failed = True
+            continue
+        status = "ok"
+        if result["seconds"] > args.budget:
+            status = f"ZU LANGSAM (> {args.budget:.2f}s)"
+            failed = True
+        if result["heavy"]:
+            status = f"schwere Importe: {', '.join(result['heavy'])}"
+            failed = True
+        print(f"{module:15s} {result['seconds']:.3f}s  {status}")
+    return 1 if failed else 0
+
+
+def synthetic_utterances(n, seed=0):
+    # Äußerungen aus den Beispieltranskripten, zufällig verlängert
+    import glob
+    import random
+    from ars_ingest import ingest_files
+    base = ingest_files(sorted(glob.glob(os.path.join(HERE, "[Tt]ext*.txt")))).texts()
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(base) for _ in range(rng.randint(1, 4))) for _ in range(n)]
+
+
+def bench_embed(args):
+    import time
+    import numpy as np
+    from ars_models import get_encoder
+    from ars_embed import EmbeddingEngine
+
+    utterances = synthetic_utterances(args.n)
+    model = get_encoder(args.model)
+    model.encode(utterances[:32])  # Aufwärmen
+
+    t = time.perf_counter()
+    baseline = model.encode(utterances)
+    base_seconds = time.perf_counter() - t
+    print(f"model.encode (Standard)    {args.n / base_seconds:8.1f} Äußerungen/s")
+
+    for processes in args.processes:
+        engine = EmbeddingEngine(args.model, processes=processes)
+        result = engine.encode(utterances)
+        engine.close()
+        max_diff = float(np.abs(result - baseline).max())
+        print(f"EmbeddingEngine ({processes} Proz.)  {engine.throughput():8.1f} Äußerungen/s  "
+              f"x{base_seconds / engine.last_stats['seconds']:.2f}  max. Abw. {max_diff:.1e}")
+    return 0
+
+
+def _dict_transitions(sequence):
+    # Bisherige Variante (dict-of-dicts mit Python-Schleife) als Referenz
+    from collections import defaultdict
+    transitions = defaultdict(lambda: defaultdict(int))
+    for i in range(len(sequence) - 1):
+        transitions[sequence[i]][sequence[i + 1]] += 1
+    return transitions
+
+
+def bench_transitions(args):
+    import time
+    import numpy as np
+    from ars_grammar import SymbolTable, count_transitions
+
+    rng = np.random.default_rng(0)
+    symbols = np.array([f"T_{i}" for i in range(args.symbols)])
+    chain = symbols[rng.integers(0, args.symbols, args.n)]
+    as_list = chain.tolist()
+
+    t = time.perf_counter()
+    reference = _dict_transitions(as_list)
+    dict_seconds = time.perf_counter() - t
+
+    t = time.perf_counter()
+    table = SymbolTable()
+    ids = table.encode(as_list)
+    encode_seconds = time.perf_counter() - t
+    counts = count_transitions(ids, len(table))
+    vec_seconds = time.perf_counter() - t
+
+    ok = all(counts[table.id(s), table.id(d)] == c for s in reference for d, c in reference[s].items())
+    print(f"Kette: {args.n:,} Symbole, {args.symbols} Terminale")
+    print(f"dict-of-dicts          {dict_seconds:8.3f}s")
+    print(f"SymbolTable + bincount {vec_seconds:8.3f}s  x{dict_seconds / vec_seconds:.1f}  "
+          f"{'identisch' if ok else 'ABWEICHUNG'}")
+    print(f"  davon Kodierung      {encode_seconds:8.3f}s")
+    print(f"  davon Zählung        {vec_seconds - encode_seconds:8.3f}s")
+    return 0 if ok else 1
+
+
+def _loop_simulate(pcfg, length):
+    # Bisherige Variante: Listen und np.random.choice pro Schritt
+    import numpy as np
+    current = np.random.choice(list(pcfg.keys()))
+    sequence = [current]
+    for _ in range(length - 1):
+        if current not in pcfg:
+            break
+        current = np.random.choice(list(pcfg[current].keys()), p=list(pcfg[current].values()))
+        sequence.append(current)
+    return sequence
+
+
+def bench_sample(args):
+    import time
+    import numpy as np
+    from ars_sampler import ChainSampler
+
+    rng = np.random.default_rng(0)
+    symbols = [f"T_{i}" for i in range(args.symbols)]
+    pcfg = {}
+    for src in symbols:
+        weights = rng.random(args.symbols)
+        pcfg[src] = dict(zip(symbols, weights / weights.sum()))
+
+    loop_chains = max(1, 20000 // args.length)
+    t = time.perf_counter()
+    for _ in range(loop_chains):
+        _loop_simulate(pcfg, args.length)
+    loop_rate = loop_chains * args.length / (time.perf_counter() - t)
+
+    t = time.perf_counter()
+    sampler = ChainSampler(pcfg, seed=0)
+    compile_seconds = time.perf_counter() - t
+    t = time.perf_counter()
+    ids = sampler.sample(args.chains, args.length)
+    rate = ids.size / (time.perf_counter() - t)
+
+    print(f"{args.symbols} Symbole, {args.chains} Ketten x {args.length}")
+    print(f"Schleife + np.random.choice  {loop_rate:14,.0f} Token/s")
+    print(f"ChainSampler (Alias)         {rate:14,.0f} Token/s  x{rate / loop_rate:.0f}  "
+          f"(Kompilieren {compile_seconds * 1000:.1f} ms)")
+    return 0
+
+
+def bench_cluster(args):
+    import time
+    import numpy as np
+    from sklearn.metrics import adjusted_rand_score
+    from ars_cluster import cluster_embeddings
+
+    # Synthetische Cluster auf der Einheitssphäre (wie normierte Satz-Embeddings)
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(args.clusters, args.dim))
+    truth = rng.integers(0, args.clusters, args.n)
+    embeddings = (centers[truth] + rng.normal(scale=args.noise, size=(args.n, args.dim))).astype(np.float32)
+
+    print(f"{args.n:,} Punkte, {args.dim} Dim., {args.clusters} Cluster")
+    if args.reduce:
+        from ars_reduce import fit_projection
+        t = time.perf_counter()
+        embeddings = fit_projection(embeddings, method=args.reduce, n_components=args.components).coords
+        print(f"Reduktion {args.reduce} -> {embeddings.shape[1]} Dim. {time.perf_counter() - t:8.2f}s  "
+              f"({embeddings.nbytes / 2**20:.1f} MiB statt {args.n * args.dim * 4 / 2**20:.1f} MiB)")
+    reference = None
+    failed = False
+    for method in args.methods:
+        options = {"sample_size": args.sample_size} if method == "sample" else {}
+        t = time.perf_counter()
+        labels = cluster_embeddings(embeddings, method=method, min_cluster_size=args.min_cluster_size, **options)
+        seconds = time.perf_counter() - t
+        if method == "hdbscan":
+            reference = labels
+        ari = adjusted_rand_score(truth, labels)
+        line = f"{method:10s} {seconds:8.2f}s  ARI(Wahrheit) {ari:.3f}"
+        if reference is not None and method != "hdbscan":
+            line += f"  ARI(HDBSCAN) {adjusted_rand_score(reference, labels):.3f}"
+        if ari < args.min_ari:
+            line += "  ZU UNGENAU"
+            failed = True
+        print(line)
+    return 1 if failed else 0
+
+
+def _loop_classify(rules, utterance):
+    # Bisherige Variante: Teilstring-Suche je Schlüsselwort und Kategorie
+    utterance = utterance[:100].lower().replace('\n', ' ')
+    for category, keywords in rules.items():
+        if any(kw in utterance for kw in keywords):
+            return category.upper()
+    return None
+
+
+def bench_rules(args):
+    import time
+    import random
+    from ars_rules import DEFAULT_RULES, KeywordClassifier
+
+    rules = {c: list(kws) for c, kws in DEFAULT_RULES.items()}
+    rng = random.Random(0)
+    for i in range(args.extra_keywords):
+        # Zusätzliche, kaum treffende Schlüsselwörter für große Regeltabellen
+        word = "".join(rng.choice("bcdfghklmnprstvwz") + rng.choice("aeiou") for _ in range(4))
+        rules.setdefault(f"extra_{i % 20}", []).append(word)
+    base = synthetic_utterances(2000)
+    utterances = (base * (args.n // len(base) + 1))[:args.n]
+    n_keywords = sum(len(kws) for kws in rules.values())
+
+    t = time.perf_counter()
+    for u in utterances:
+        _loop_classify(rules, u)
+    loop_seconds = time.perf_counter() - t
+
+    classifier = KeywordClassifier(rules)
+    t = time.perf_counter()
+    labels = classifier.classify(utterances)
+    seconds = time.perf_counter() - t
+    labelled = sum(1 for label in labels if label)
+    print(f"{args.n:,} Äußerungen, {n_keywords} Schlüsselwörter in {len(rules)} Kategorien")
+    print(f"Teilstring-Schleife       {args.n / loop_seconds:12,.0f} Äußerungen/s")
+    print(f"KeywordClassifier (Regex) {args.n / seconds:12,.0f} Äußerungen/s  x{loop_seconds / seconds:.1f}  "
+          f"({labelled / args.n:.0%} regelbasiert beschriftet)")
+    return 0
+
+
+def bench_repair(args):
+    import time
+    import numpy as np
+    from ars_induction import repair
+
+    # Zufällige Dialoge mit wiederkehrenden Mustern; geprüft wird, dass keine
+    # Paare mehr min_count-mal vorkommen und die Expansion die Eingabe ergibt
+    rng = np.random.default_rng(0)
+    failed = 0
+    seconds = 0.0
+    for _ in range(args.trials):
+        patterns = [rng.integers(0, args.symbols, rng.integers(2, 6)) for _ in range(4)]
+        dialogs = []
+        for _ in range(rng.integers(1, 4)):
+            parts = [patterns[rng.integers(0, 4)] if rng.random() < 0.5 else rng.integers(0, args.symbols, 3)
+                     for _ in range(rng.integers(1, args.length))]
+            dialogs.append(np.concatenate(parts))
+        t = time.perf_counter()
+        induced = repair(dialogs, args.symbols, min_count=args.min_count)
+        seconds += time.perf_counter() - t
+        expanded = [s for sym in induced.sequence.tolist() for s in ([sym] if sym < 0 else induced.expand(sym))]
+        original = np.concatenate([np.append(d, -1) for d in dialogs])[:-1].tolist()
+        if induced.repeated_pairs(args.min_count) or expanded != original:
+            failed += 1
+    print(f"{args.trials} Folgen, {args.symbols} Terminale, min_count={args.min_count}: "
+          f"{failed} fehlerhaft, {seconds:.2f}s")
+    return 1 if failed else 0
+
+
+def _dict_normalize(pcfg):
+    return {src: {dst: c / sum(t.values()) for dst, c in t.items()} for src, t in pcfg.items()}
+
+
+def _dict_adjust(pcfg, terminals, adjustment, rows=None):
+    # Bisherige Variante aus ars4 (list.index in der Schleife)
+    result = {}
+    for src in list(pcfg)[:rows]:
+        new_rules = {}
+        for dst, p in pcfg[src].items():
+            if dst in terminals:
+                new_rules[dst] = max(0.01, min(0.99, p + 0.1 * adjustment[terminals.index(dst)]))
+            else:
+                new_rules[dst] = p
+        total = sum(new_rules.values())
+        result[src] = {k: v / total for k, v in new_rules.items()}
+    return result
+
+
+def _dict_blend(pcfg, counts, factor):
+    # Bisherige Variante aus ars6 (_adjust_probabilities)
+    result = {}
+    for src, targets in pcfg.items():
+        row = counts.get(src, {})
+        row_total = sum(row.values())
+        blended = {dst: (1 - factor) * p + factor * (row.get(dst, 0) + 0.1) / (row_total + 0.1 * len(targets))
+                   for dst, p in targets.items()}
+        total = sum(blended.values())
+        result[src] = {dst: v / total for dst, v in blended.items()}
+    return result
+
+
+def _measure(fn):
+    import time
+    import tracemalloc
+    tracemalloc.start()
+    t = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - t
+    # Dauerhaft belegter Speicher des Ergebnisses und Spitze während des Aufbaus
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, seconds, retained, peak
+
+
+def bench_grammar(args):
+    import time
+    import numpy as np
+    from ars_core import build_pcfg
+    from ars_grammar import TransitionModel
+
+    rng = np.random.default_rng(0)
+    # Kette mit lokaler Struktur: je Symbol nur wenige typische Nachfolger
+    successors = rng.integers(0, args.symbols, (args.symbols, args.fanout))
+    ids = np.empty(args.n, dtype=np.int64)
+    ids[0] = 0
+    picks = rng.integers(0, args.fanout, args.n)
+    for i in range(1, args.n):
+        ids[i] = successors[ids[i - 1], picks[i]]
+    names = [f"T_{i}" for i in range(args.symbols)]
+    chain = [names[i] for i in ids]
+
+    def build_dict():
+        counts = _dict_transitions(chain)
+        return {src: dict(t) for src, t in counts.items()}
+
+    def build_grammar():
+        # Derselbe Weg wie in der Pipeline: build_pcfg über ein TransitionModel
+        model = TransitionModel()
+        build_pcfg(chain, None, model=model)
+        return model.to_grammar()
+
+    dict_counts, dict_build, dict_mem, dict_peak = _measure(build_dict)
+    counts, grammar_build, grammar_mem, grammar_peak = _measure(build_grammar)
+    rules = counts.matrix.nnz
+    print(f"{args.symbols:,} Symbole, {rules:,} Regeln aus {args.n:,} Übergängen")
+    print(f"{'':24s}{'dict-of-dicts':>16s}{'build_pcfg':>16s}")
+    print(f"{'Aufbau':24s}{dict_build:14.3f}s {grammar_build:14.3f}s")
+    print(f"{'Speicher belegt/Spitze':24s}{dict_mem / 2**20:10.1f}/{dict_peak / 2**20:.0f} MiB "
+          f"{grammar_mem / 2**20:8.1f}/{grammar_peak / 2**20:.0f} MiB")
+
+    t = time.perf_counter()
+    dict_pcfg = _dict_normalize(dict_counts)
+    dict_norm = time.perf_counter() - t
+    t = time.perf_counter()
+    grammar = counts.normalize()
+    grammar_norm = time.perf_counter() - t
+    print(f"{'Normalisierung':24s}{dict_norm:14.3f}s {grammar_norm:14.3f}s   x{dict_norm / grammar_norm:.0f}")
+
+    terminals = sorted(names)
+    adjustment = rng.normal(scale=0.01, size=len(terminals))
+    sample_rows = max(1, min(len(dict_pcfg), args.adjust_rows))
+    t = time.perf_counter()
+    _dict_adjust(dict_pcfg, terminals, adjustment, rows=sample_rows)
+    dict_adjust = (time.perf_counter() - t) * len(dict_pcfg) / sample_rows
+    t = time.perf_counter()
+    grammar.adjust_columns(grammar.table.encode(terminals, add=False), 0.1 * adjustment)
+    grammar_adjust = time.perf_counter() - t
+    print(f"{'Anpassung (ars4)':24s}{dict_adjust:14.3f}s {grammar_adjust:14.3f}s   x{dict_adjust / grammar_adjust:.0f}"
+          f"  (dict hochgerechnet aus {sample_rows} Zeilen)")
+
+    t = time.perf_counter()
+    _dict_blend(dict_pcfg, dict_counts, 0.2)
+    dict_blend = time.perf_counter() - t
+    t = time.perf_counter()
+    grammar.blend(grammar.smooth(counts, alpha=0.1), 0.2).normalize()
+    grammar_blend = time.perf_counter() - t
+    print(f"{'Glätten + Mischen (ars6)':24s}{dict_blend:14.3f}s {grammar_blend:14.3f}s   x{dict_blend / grammar_blend:.0f}")
+
+    ok = all(abs(grammar.row(src)[dst] - p) < 1e-9 for src in list(dict_pcfg)[:100] for dst, p in dict_pcfg[src].items())
+    print("Ergebnis identisch" if ok else "ABWEICHUNG")
+    return 0 if ok else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ARS Benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("import", help="Kaltstart-Importzeit der Module messen")
+    p.add_argument("modules", nargs="*")
+    p.add_argument("--budget", type=float, default=0.8, help="maximale Importzeit in Sekunden")
+    p.add_argument("--repeat", type=int, default=3)
+    p.set_defaults(func=bench_import)
+
+    p = sub.add_parser("embed", help="Embedding-Durchsatz: Engine vs. einzelner encode-Aufruf")
+    p.add_argument("--n", type=int, default=5000)
+    p.add_argument("--model", default="all-MiniLM-L6-v2")
+    p.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    p.set_defaults(func=bench_embed)
+
+    p = sub.add_parser("transitions", help="Übergangszählung: dict-Schleife vs. vektorisiert")
+    p.add_argument("--n", type=int, default=10_000_000)
+    p.add_argument("--symbols", type=int, default=50)
+    p.set_defaults(func=bench_transitions)
+
+    p = sub.add_parser("sample", help="Dialogsimulation: Schleife vs. kompilierter Sampler")
+    p.add_argument("--symbols", type=int, default=50)
+    p.add_argument("--chains", type=int, default=10000)
+    p.add_argument("--length", type=int, default=500)
+    p.set_defaults(func=bench_sample)
+
+    p = sub.add_parser("cluster", help="Clustering: volles HDBSCAN vs. kNN-Graph und Stichprobe")
+    p.add_argument("--n", type=int, default=20000)
+    p.add_argument("--dim", type=int, default=384)
+    p.add_argument("--clusters", type=int, default=30)
+    p.add_argument("--noise", type=float, default=0.05)
+    p.add_argument("--sample-size", type=int, default=3000)
+    p.add_argument("--min-cluster-size", type=int, default=3)
+    p.add_argument("--min-ari", type=float, default=0.9)
+    p.add_argument("--methods", nargs="+", default=["hdbscan", "knn-graph", "sample"])
+    p.add_argument("--reduce", choices=["pca", "umap"], help="vor dem Clustering reduzieren")
+    p.add_argument("--components", type=int, default=20)
+    p.set_defaults(func=bench_cluster)
+
+    p = sub.add_parser("rules", help="Regelbasierte Vorklassifikation: Schleife vs. kombinierter Regex")
+    p.add_argument("--n", type=int, default=200_000)
+    p.add_argument("--extra-keywords", type=int, default=0)
+    p.set_defaults(func=bench_rules)
+
+    p = sub.add_parser("repair", help="Re-Pair: keine wiederholten Paare, Expansion ergibt die Eingabe")
+    p.add_argument("--trials", type=int, default=2000)
+    p.add_argument("--symbols", type=int, default=6)
+    p.add_argument("--length", type=int, default=30)
+    p.add_argument("--min-count", type=int, default=2)
+    p.set_defaults(func=bench_repair)
+
+    p = sub.add_parser("grammar", help="PCFG: dict-of-dicts vs. Grammar (CSR)")
+    p.add_argument("--symbols", type=int, default=10000)
+    p.add_argument("--fanout", type=int, default=20)
+    p.add_argument("--n", type=int, default=1_000_000)
+    p.add_argument("--adjust-rows", type=int, default=200)
+    p.set_defaults(func=bench_grammar)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,342 @@
+import os
+import json
+import hashlib
+import unicodedata
+import numpy as np
+
+
+def normalize_utterance(text):
+    # Unicode vereinheitlichen, Leerraum zusammenfassen
+    text = unicodedata.normalize("NFC", text)
+    return " ".join(text.split())
+
+
+def utterance_key(model_name, revision, text):
+    raw = f"{model_name}\0{revision}\0{normalize_utterance(text)}"
+    return hashlib.sha1(raw.encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """Persistenter Embedding-Speicher (float32-Memmap + Indexdatei).
+
+    Schlüssel ist (Modellname, Modellrevision, Hash der normalisierten Äußerung).
+    Zeile i der Matrix gehört zu Schlüssel i im Index. Index und Metadaten
+    werden per os.replace ersetzt; beim Verdrängen entsteht eine neue
+    Datendatei, auf die erst der neue Index verweist.
+    """
+
+    def __init__(self, directory, model_name, revision="main", max_bytes=None):
+        self.directory = directory
+        self.model_name = model_name
+        self.revision = revision
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+        self._meta_path = os.path.join(directory, "meta.json")
+        self._index_path = os.path.join(directory, "index.npz")
+        self._data_name = "vectors.f32"
+
+        self.dim = None
+        self.capacity = 0
+        self._keys = []
+        self._stamps = []
+        self._rows = {}
+        self._tick = 0
+        self._vectors = None
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    # --- Persistenz ---
+
+    def _load(self):
+        if not os.path.exists(self._meta_path):
+            return
+        with open(self._meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("model") != self.model_name or meta.get("revision") != self.revision:
+            # Anderes Modell im selben Verzeichnis: Cache verwerfen
+            return
+        self.dim = meta["dim"]
+        self._tick = meta.get("tick", 0)
+        with np.load(self._index_path) as index:
+            self._keys = [bytes(k) for k in index["keys"]]
+            self._stamps = index["stamps"].tolist()
+            if "data" in index:
+                self._data_name = str(index["data"])
+        self._rows = {k: i for i, k in enumerate(self._keys)}
+        self._remove_stale_data()
+        # Kapazität aus der Dateigröße: die Datei wächst immer vor dem Index
+        size = os.path.getsize(self._data_path) if os.path.exists(self._data_path) else 0
+        self.capacity = size // (self.dim * 4)
+        if self.capacity:
+            self._vectors = np.memmap(self._data_path, dtype=np.float32, mode="r+",
+                                      shape=(self.capacity, self.dim))
+
+    @property
+    def _data_path(self):
+        return os.path.join(self.directory, self._data_name)
+
+    def _remove_stale_data(self):
+        # Datendateien eines abgebrochenen Verdrängens, auf die kein Index zeigt
+        for name in os.listdir(self.directory):
+            if name.startswith("vectors") and name.endswith(".f32") and name != self._data_name:
+                os.remove(os.path.join(self.directory, name))
+
+    @staticmethod
+    def _replace(path, write):
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            write(f)
+        os.replace(tmp, path)
+
+    def flush(self):
+        # Reihenfolge: Vektoren, Index, Metadaten; jede Datei wird atomar
+        # ersetzt, ein Absturz lässt immer einen gültigen Stand zurück
+        if self.dim is None:
+            return
+        if self._vectors is not None:
+            self._vectors.flush()
+        keys = np.array(self._keys, dtype="S20") if self._keys else np.zeros(0, dtype="S20")
+        self._replace(self._index_path, lambda f: np.savez(
+            f, keys=keys, stamps=np.asarray(self._stamps, dtype=np.int64), data=np.array(self._data_name)))
+        meta = {
+            "model": self.model_name,
+            "revision": self.revision,
+            "dim": self.dim,
+            "capacity": self.capacity,
+            "tick": self._tick,
+        }
+        self._replace(self._meta_path, lambda f: f.write(json.dumps(meta).encode("utf-8")))
+
+    def _next_data_name(self):
+        generation = self._tick
+        while os.path.exists(os.path.join(self.directory, f"vectors.{generation}.f32")):
+            generation += 1
+        return f"vectors.{generation}.f32"
+
+    def _budget_rows(self):
+        return None if self.max_bytes is None else self.max_bytes // (self.dim * 4)
+
+    def _reserve(self, rows):
+        if rows <= self.capacity:
+            return
+        capacity = max(rows, 2 * self.capacity, 1024)
+        budget = self._budget_rows()
+        if budget is not None:
+            # Nicht über max_bytes hinaus vorab wachsen
+            capacity = max(rows, min(capacity, budget))
+        if self._vectors is not None:
+            self._vectors.flush()
+            del self._vectors
+        with open(self._data_path, "ab") as f:
+            f.truncate(capacity * self.dim * 4)
+        self.capacity = capacity
+        self._vectors = np.memmap(self._data_path, dtype=np.float32, mode="r+",
+                                  shape=(self.capacity, self.dim))
+
+    # --- Zugriff ---
+
+    def get_many(self, texts):
+        keys = [utterance_key(self.model_name, self.revision, t) for t in texts]
+        self._tick += 1
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        for i, key in enumerate(keys):
+            row = self._rows.get(key)
+            if row is not None:
+                rows[i] = row
+                self._stamps[row] = self._tick
+        found = rows >= 0
+        self.hits += int(found.sum())
+        self.misses += int((~found).sum())
+        vectors = None
+        if self.dim is not None and found.any():
+            vectors = np.zeros((len(keys), self.dim), dtype=np.float32)
+            vectors[found] = self._vectors[rows[found]]
+        return vectors, found
+
+    def put_many(self, texts, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        self._tick += 1
+        new_keys = []
+        new_rows = []
+        for text, vec in zip(texts, vectors):
+            key = utterance_key(self.model_name, self.revision, text)
+            if key in self._rows:
+                continue
+            self._rows[key] = len(self._keys) + len(new_keys)
+            new_keys.append(key)
+            new_rows.append(vec)
+        if new_keys:
+            start = len(self._keys)
+            self._reserve(start + len(new_keys))
+            self._vectors[start:start + len(new_keys)] = np.vstack(new_rows)
+            self._keys.extend(new_keys)
+            self._stamps.extend([self._tick] * len(new_keys))
+        self.evict()
+
+    def encode(self, encoder, utterances, **encode_kwargs):
+        # Nur Fehltreffer werden kodiert, Duplikate nur einmal
+        cached, found = self.get_many(utterances)
+        slots = {}
+        for i, u in enumerate(utterances):
+            if not found[i]:
+                slots.setdefault(normalize_utterance(u), []).append(i)
+        if slots:
+            unique = [utterances[idx[0]] for idx in slots.values()]
+            encoded = np.asarray(encoder.encode(unique, **encode_kwargs), dtype=np.float32)
+            self.put_many(unique, encoded)
+            self.flush()
+            if cached is None:
+                cached = np.zeros((len(utterances), encoded.shape[1]), dtype=np.float32)
+            for vec, idx in zip(encoded, slots.values()):
+                cached[idx] = vec
+        if cached is None:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return cached
+
+    # --- Verdrängung & Statistik ---
+
+    def nbytes(self):
+        return len(self._keys) * (self.dim or 0) * 4
+
+    def evict(self, max_bytes=None):
+        budget = max_bytes if max_bytes is not None else self.max_bytes
+        if budget is None or self.dim is None or self.nbytes() <= budget:
+            return 0
+        keep = budget // (self.dim * 4)
+        # Zuletzt benutzte Einträge behalten und in eine neue, passend große
+        # Datei kompaktieren; erst der neue Index verweist auf sie
+        order = np.argsort(np.asarray(self._stamps), kind="stable")[::-1][:keep]
+        order.sort()
+        removed = len(self._keys) - len(order)
+        old_path = self._data_path
+        self._data_name = self._next_data_name()
+        if len(order):
+            kept = np.memmap(self._data_path, dtype=np.float32, mode="w+", shape=(len(order), self.dim))
+            kept[:] = self._vectors[order]
+        else:
+            kept = None
+            open(self._data_path, "wb").close()
+        del self._vectors
+        self._vectors = kept
+        self.capacity = len(order)
+        self._keys = [self._keys[i] for i in order]
+        self._stamps = [self._stamps[i] for i in order]
+        self._rows = {k: i for i, k in enumerate(self._keys)}
+        self.flush()
+        os.remove(old_path)
+        return removed
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._keys),
+            "bytes": self.nbytes(),
+            "file_bytes": self.capacity * (self.dim or 0) * 4,
+        }
+
+
+def meaning_key(model_name, template, utterance, context):
+    raw = f"{model_name}\0{template}\0{normalize_utterance(utterance)}\0{normalize_utterance(context)}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class MeaningCache:
+    """Persistenter Cache für LLM-Bedeutungen: LRU im Speicher, SQLite auf Platte.
+
+    Schlüssel ist (Modellname, Prompt-Vorlage, normalisierte Äußerung,
+    Kontextfenster). Threadsicher, damit auch Hintergrund-Threads ihn nutzen.
+    """
+
+    def __init__(self, path, model_name, template, capacity=4096):
+        import sqlite3
+        import threading
+        from collections import OrderedDict
+        self.path = path
+        self.model_name = model_name
+        self.template = template
+        self.capacity = capacity
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS meanings (key TEXT PRIMARY KEY, meaning TEXT NOT NULL)")
+        self._db.commit()
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def key(self, utterance, context=""):
+        return meaning_key(self.model_name, self.template, utterance, context)
+
+    def _remember(self, key, meaning):
+        self._lru[key] = meaning
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.capacity:
+            self._lru.popitem(last=False)
+
+    def get_many(self, keys):
+        # Liefert eine Liste mit Bedeutung bzw. None je Schlüssel
+        results = [None] * len(keys)
+        with self._lock:
+            missing = {}
+            for i, key in enumerate(keys):
+                meaning = self._lru.get(key)
+                if meaning is not None:
+                    self._lru.move_to_end(key)
+                    results[i] = meaning
+                    self.memory_hits += 1
+                else:
+                    missing.setdefault(key, []).append(i)
+            unique = list(missing)
+            for start in range(0, len(unique), 500):
+                chunk = unique[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, meaning FROM meanings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, meaning in rows:
+                    self._remember(key, meaning)
+                    for i in missing.pop(key):
+                        results[i] = meaning
+                        self.disk_hits += 1
+            self.misses += sum(len(idx) for idx in missing.values())
+        return results
+
+    def get(self, utterance, context=""):
+        return self.get_many([self.key(utterance, context)])[0]
+
+    def put_many(self, items):
+        # items: Folge von (Schlüssel, Bedeutung)
+        items = list(items)
+        with self._lock:
+            for key, meaning in items:
+                self._remember(key, meaning)
+            self._db.executemany("INSERT OR REPLACE INTO meanings (key, meaning) VALUES (?, ?)", items)
+            self._db.commit()
+
+    def put(self, utterance, context, meaning):
+        self.put_many([(self.key(utterance, context), meaning)])
+
+    def hit_rate(self):
+        total = self.memory_hits + self.disk_hits + self.misses
+        return (self.memory_hits + self.disk_hits) / total if total else 0.0
+
+    def stats(self):
+        entries = self._db.execute("SELECT COUNT(*) FROM meanings").fetchone()[0]
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hit_rate(),
+            "entries": entries,
+            "memory_entries": len(self._lru),
+        }
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,256 @@
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import signal
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Kommandozeile ohne Oberfläche, z. B. für nächtliche Läufe auf Servern:
+#   ars corpus_a/ corpus_b/ "archiv/2024/*.txt" --out ergebnisse --workers 2
+# Jedes Korpus (Verzeichnis, Glob oder Datei; optional NAME=...) wird für
+# sich verarbeitet. Mehrere Korpora laufen parallel in einem Prozesspool;
+# jeder Worker lädt das Embedding-Modell einmal und behält es für alle
+# Korpora, die er bearbeitet.
+
+EXIT_OK = 0
+EXIT_FAILED = 1      # mindestens ein Korpus ist fehlgeschlagen
+EXIT_USAGE = 2       # keine Transkripte gefunden / falsche Argumente
+EXIT_INTERRUPTED = 130
+
+FORMATS = ("json", "yaml", "csv", "npz")
+
+
+def resolve_corpus(spec, recursive=False):
+    # "NAME=Pfad" oder Pfad: Verzeichnis (alle .txt), Glob-Muster oder Datei
+    name = None
+    if "=" in spec and not os.path.exists(spec):
+        name, spec = spec.split("=", 1)
+    if os.path.isdir(spec):
+        pattern = os.path.join(spec, "**", "*.txt") if recursive else os.path.join(spec, "*.txt")
+        files = sorted(glob.glob(pattern, recursive=recursive))
+        default = os.path.basename(os.path.normpath(spec))
+    elif glob.has_magic(spec):
+        files = sorted(f for f in glob.glob(spec, recursive=True) if os.path.isfile(f))
+        # Name aus dem festen Verzeichnisteil vor dem ersten Platzhalter
+        prefix = spec[:min(spec.find(c) for c in "*?[" if c in spec)]
+        default = os.path.basename(os.path.abspath(os.path.dirname(prefix) or ".")) or "corpus"
+    else:
+        files = [spec] if os.path.isfile(spec) else []
+        default = os.path.splitext(os.path.basename(spec))[0]
+    return name or default, files
+
+
+def unique_names(corpora):
+    # Gleichnamige Korpora (z. B. zwei "2024"-Verzeichnisse) durchnummerieren
+    seen = {}
+    result = []
+    for name, files in corpora:
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        result.append((f"{name}_{count + 1}" if count else name, files))
+    return result
+
+
+def run_fingerprint(files, formats, with_embeddings, options):
+    # Dateiliste, Exportformate und Optionen: ändert sich eines davon, ist
+    # ein vorhandenes Ergebnis nicht mehr aktuell
+    raw = json.dumps({"files": sorted(os.path.abspath(f) for f in files), "formats": sorted(formats),
+                      "embeddings": with_embeddings, "options": options}, sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def is_up_to_date(out_dir, files, fingerprint=None):
+    marker = os.path.join(out_dir, "summary.json")
+    if not os.path.exists(marker):
+        return False
+    try:
+        with open(marker, "r", encoding="utf-8") as f:
+            summary = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if summary.get("status") != "ok" or summary.get("fingerprint") != fingerprint:
+        return False
+    built = os.path.getmtime(marker)
+    return all(os.path.getmtime(f) <= built for f in files)
+
+
+def _init_worker(model_name, threads):
+    # Einmal pro Worker: Threads begrenzen, keine verschachtelten Pools,
+    # Modell vorab laden (bleibt in der Registry für alle Korpora).
+    # Strg-C behandelt nur der Hauptprozess: er bricht den Pool ab
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    os.environ["ARS_EMBED_PROCESSES"] = "1"
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    from ars_models import get_encoder
+    get_encoder(model_name)
+
+
+def failed_summary(name, files, out_dir, error, seconds=0.0, trace=None):
+    return {
+        "corpus": name, "files": len(files), "output": out_dir, "status": "failed",
+        "error": f"{type(error).__name__}: {error}",
+        "traceback": trace or "".join(traceback.format_exception(type(error), error, error.__traceback__)),
+        "seconds": round(seconds, 3),
+    }
+
+
+def run_corpus(name, files, out_dir, formats=FORMATS, with_embeddings=True, fingerprint=None, **options):
+    # Ein Korpus verarbeiten und exportieren; Fehler werden als Ergebnis
+    # gemeldet, damit ein kaputtes Korpus die anderen nicht abbricht
+    from ars_core import (process_multiple_dialogs, save_analysis,
+                          export_pcfg_to_json, export_pcfg_to_yaml, export_pcfg_to_csv)
+    start = time.perf_counter()
+    summary = {"corpus": name, "files": len(files), "output": out_dir, "fingerprint": fingerprint}
+    try:
+        result = process_multiple_dialogs(files, **options)
+        os.makedirs(out_dir, exist_ok=True)
+        exporters = {"json": export_pcfg_to_json, "yaml": export_pcfg_to_yaml, "csv": export_pcfg_to_csv}
+        for fmt in formats:
+            path = os.path.join(out_dir, "analysis.npz" if fmt == "npz" else f"pcfg.{fmt}")
+            if fmt == "npz":
+                save_analysis(result, path, with_embeddings=with_embeddings)
+            else:
+                exporters[fmt](result["pcfg"], path)
+        pcfg = result["pcfg"]
+        summary.update({
+            "status": "ok",
+            "utterances": len(result["labels"]),
+            "symbols": len(pcfg.symbols),
+            "rules": int(pcfg.matrix.nnz),
+            "stages": result.get("stages"),
+            "seconds": round(time.perf_counter() - start, 3),
+        })
+        with open(os.path.join(out_dir, "summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    except Exception as e:
+        return failed_summary(name, files, out_dir, e, time.perf_counter() - start, traceback.format_exc())
+    return summary
+
+
+def _report(summary):
+    if summary["status"] == "ok":
+        print(f"{summary['corpus']:20s} ok      {summary['utterances']:7d} Äußerungen, "
+              f"{summary['symbols']} Symbole, {summary['rules']} Regeln, {summary['seconds']:.1f}s")
+    elif summary["status"] == "skipped":
+        print(f"{summary['corpus']:20s} aktuell (übersprungen)")
+    else:
+        print(f"{summary['corpus']:20s} FEHLER  {summary['error']}", file=sys.stderr)
+
+
+def build_parser():
+    from ars_cluster import METHODS
+    parser = argparse.ArgumentParser(prog="ars", description="ARS ohne Oberfläche: Transkripte verarbeiten und Grammatiken exportieren")
+    parser.add_argument("corpora", nargs="+", help="Verzeichnis, Glob oder Datei je Korpus, optional NAME=...")
+    parser.add_argument("--out", default="ars_output", help="Zielverzeichnis (ein Unterverzeichnis je Korpus)")
+    parser.add_argument("--workers", type=int, default=1, help="Korpora parallel (Prozesse)")
+    parser.add_argument("--recursive", action="store_true", help="Verzeichnisse rekursiv durchsuchen")
+    parser.add_argument("--formats", default=",".join(FORMATS), help=f"Exportformate, Auswahl aus {','.join(FORMATS)}")
+    parser.add_argument("--no-embeddings", action="store_true", help="Embeddings nicht ins Artefakt schreiben")
+    parser.add_argument("--skip-existing", action="store_true", help="Korpora ohne neuere Transkripte überspringen")
+    parser.add_argument("--store", default=None,
+                        help="Zwischenergebnisse je Stufe hier ablegen und wiederverwenden (Standard: ARS_STAGE_STORE)")
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--cluster-method", choices=METHODS, default=None)
+    parser.add_argument("--min-cluster-size", type=int, default=3)
+    parser.add_argument("--reduce", choices=["pca", "umap"], default=None)
+    parser.add_argument("--components", type=int, default=20)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    unknown = [f for f in formats if f not in FORMATS]
+    if unknown:
+        parser.error(f"unbekannte Formate: {', '.join(unknown)}")
+
+    corpora = unique_names([resolve_corpus(spec, args.recursive) for spec in args.corpora])
+    for (name, files), spec in zip(corpora, args.corpora):
+        if not files:
+            print(f"Keine Transkripte für {spec}", file=sys.stderr)
+    corpora = [(name, files) for name, files in corpora if files]
+    if not corpora:
+        return EXIT_USAGE
+
+    options = {
+        "batch_size": args.batch_size,
+        "cluster_method": args.cluster_method,
+        "min_cluster_size": args.min_cluster_size,
+        "reduce": args.reduce,
+        "n_components": args.components,
+        "store": args.store,
+    }
+    with_embeddings = not args.no_embeddings
+    summaries = []
+    todo = []
+    for name, files in corpora:
+        out_dir = os.path.join(args.out, name)
+        fingerprint = run_fingerprint(files, formats, with_embeddings, options)
+        if args.skip_existing and is_up_to_date(out_dir, files, fingerprint):
+            summaries.append({"corpus": name, "files": len(files), "output": out_dir, "status": "skipped"})
+            _report(summaries[-1])
+        else:
+            todo.append((name, files, out_dir, fingerprint))
+
+    from ars_core import MODEL_NAME
+    workers = max(1, min(args.workers, len(todo)))
+    started = time.perf_counter()
+    status = "failed"
+    pool = None
+    try:
+        if workers == 1:
+            for name, files, out_dir, fingerprint in todo:
+                summaries.append(run_corpus(name, files, out_dir, formats, with_embeddings, fingerprint, **options))
+                _report(summaries[-1])
+        elif todo:
+            threads = max(1, (os.cpu_count() or 1) // workers)
+            # Pool ohne with-Block: dessen __exit__ würde bei Strg-C auf alle
+            # wartenden Korpora warten
+            pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                       initargs=(MODEL_NAME, threads))
+            futures = {pool.submit(run_corpus, name, files, out_dir, formats, with_embeddings, fingerprint,
+                                   **options): (name, files, out_dir)
+                       for name, files, out_dir, fingerprint in todo}
+            for future in as_completed(futures):
+                try:
+                    summaries.append(future.result())
+                except Exception as e:
+                    # Worker abgestürzt oder Initialisierung fehlgeschlagen (BrokenProcessPool)
+                    summaries.append(failed_summary(*futures[future], e))
+                _report(summaries[-1])
+            pool.shutdown()
+        status = "ok"
+    except KeyboardInterrupt:
+        status = "interrupted"
+        if pool is not None:
+            # Wartende Korpora verwerfen, laufende Worker beenden (sie ignorieren SIGINT)
+            processes = list((getattr(pool, "_processes", None) or {}).values())
+            pool.shutdown(wait=False, cancel_futures=True)
+            for process in processes:
+                process.terminate()
+        print("Abgebrochen.", file=sys.stderr)
+    finally:
+        # run.json auch nach Abbruch: bis dahin fertige Korpora bleiben erfasst
+        os.makedirs(args.out, exist_ok=True)
+        with open(os.path.join(args.out, "run.json"), "w", encoding="utf-8") as f:
+            json.dump({"status": status, "seconds": round(time.perf_counter() - started, 3),
+                       "workers": workers, "corpora": summaries}, f, indent=2)
+    if status == "interrupted":
+        return EXIT_INTERRUPTED
+
+    failed = [s for s in summaries if s["status"] == "failed"]
+    print(f"{len(summaries) - len(failed)}/{len(summaries)} Korpora ok, "
+          f"{time.perf_counter() - started:.1f}s mit {workers} Worker(n)")
+    return EXIT_FAILED if failed else EXIT_OK
+
+if __name__ == "__main__":
+    sys.exit(main())
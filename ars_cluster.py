@@ -0,0 +1,311 @@
+import os
+import json
+import logging
+import numpy as np
+
+# Clustering der Embeddings. Neben dem bisherigen HDBSCAN über die volle
+# Matrix gibt es zwei skalierbare Varianten für große Korpora:
+#   "knn-graph": kNN-Graph über einen ANN-Index (HNSW, falls hnswlib
+#                installiert ist), Cluster = Zusammenhangskomponenten
+#                ausreichend ähnlicher Nachbarn
+#   "sample":    HDBSCAN auf einer Stichprobe, restliche Punkte per
+#                kNN-Mehrheitsvotum der Stichprobe zugeordnet
+# Auswahl über method=... oder die Umgebungsvariable ARS_CLUSTER_METHOD.
+
+METHODS = ("hdbscan", "knn-graph", "sample")
+
+logger = logging.getLogger(__name__)
+_warned_exact = False
+
+
+def l2_normalize(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def _warn_exact_fallback():
+    # Einmal pro Prozess: ohne hnswlib ist die Suche exakt und skaliert schlecht
+    global _warned_exact
+    if not _warned_exact:
+        _warned_exact = True
+        logger.warning("hnswlib nicht installiert: kNN-Suche läuft exakt (sklearn) statt über HNSW; "
+                       "pip install ars3[ann]")
+
+
+class KnnIndex:
+    """Nächste-Nachbarn-Index über L2-normierte Vektoren (Kosinus-Ähnlichkeit)."""
+
+    def __init__(self, vectors, backend="auto", ef=64, M=16, seed=42):
+        self.vectors = l2_normalize(vectors)
+        self.backend = backend
+        if backend == "auto":
+            try:
+                import hnswlib  # noqa: F401
+                self.backend = "hnsw"
+            except ImportError:
+                self.backend = "exact"
+                _warn_exact_fallback()
+        n, dim = self.vectors.shape
+        if self.backend == "hnsw":
+            import hnswlib
+            self._index = hnswlib.Index(space="ip", dim=dim)
+            self._index.init_index(max_elements=max(n, 1), ef_construction=max(ef, 100), M=M, random_seed=seed)
+            self._index.add_items(self.vectors, np.arange(n))
+            self._index.set_ef(ef)
+        else:
+            from sklearn.neighbors import NearestNeighbors
+            self._index = NearestNeighbors(n_jobs=-1).fit(self.vectors)
+
+    def query(self, vectors, k):
+        # Liefert (Indizes, Kosinus-Ähnlichkeiten), je Zeile absteigend
+        vectors = l2_normalize(vectors)
+        k = min(k, len(self.vectors))
+        if self.backend == "hnsw":
+            self._index.set_ef(max(k, self._index.ef))
+            indices, distances = self._index.knn_query(vectors, k=k)
+            return indices.astype(np.int64), 1.0 - distances
+        distances, indices = self._index.kneighbors(vectors, n_neighbors=k)
+        return indices, 1.0 - distances ** 2 / 2.0
+
+
+def _hdbscan(min_cluster_size, **options):
+    try:
+        import hdbscan
+        return hdbscan.HDBSCAN(min_cluster_size=min_cluster_size, **options)
+    except ImportError:
+        from sklearn.cluster import HDBSCAN
+        options.pop("prediction_data", None)
+        return HDBSCAN(min_cluster_size=min_cluster_size, **options)
+
+
+def cluster_hdbscan(embeddings, min_cluster_size=3, metric="euclidean"):
+    if metric == "cosine":
+        # Kosinus auf normierten Vektoren als euklidische Distanz: gleiche
+        # Nachbarschaftsordnung, aber Baumindex statt Brute Force
+        embeddings = l2_normalize(embeddings)
+        metric = "euclidean"
+    return _hdbscan(min_cluster_size, metric=metric).fit_predict(embeddings)
+
+
+def cluster_knn_graph(embeddings, min_cluster_size=3, k=15, min_similarity=0.5, mutual=False, index=None):
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import connected_components
+    n = len(embeddings)
+    if n == 0:
+        return np.zeros(0, dtype=np.int64)
+    index = index or KnnIndex(embeddings)
+    neighbors, similarity = index.query(embeddings, k + 1)
+    rows = np.repeat(np.arange(n), neighbors.shape[1])
+    cols = neighbors.ravel()
+    keep = (similarity.ravel() >= min_similarity) & (rows != cols) & (cols >= 0)
+    graph = csr_matrix((np.ones(keep.sum()), (rows[keep], cols[keep])), shape=(n, n))
+    # mutual=True verbindet nur gegenseitige Nachbarn (weniger Brücken
+    # zwischen Clustern, in hohen Dimensionen aber mehr Rauschpunkte)
+    if mutual:
+        graph = graph.multiply(graph.T)
+    _, components = connected_components(graph, directed=False)
+    sizes = np.bincount(components)
+    # Kleine Komponenten sind Rauschen (-1), übrige fortlaufend nummerieren
+    large = np.flatnonzero(sizes >= min_cluster_size)
+    relabel = np.full(len(sizes), -1, dtype=np.int64)
+    relabel[large] = np.arange(len(large))
+    return relabel[components]
+
+
+def assign_by_neighbors(index, labels, vectors, k=10, min_similarity=0.0):
+    # Mehrheitsvotum der k nächsten beschrifteten Punkte (Rauschen zählt nicht)
+    labels = np.asarray(labels)
+    neighbors, similarity = index.query(vectors, k)
+    votes = labels[neighbors]
+    valid = (votes >= 0) & (similarity >= min_similarity)
+    n_labels = labels.max() + 1 if len(labels) and labels.max() >= 0 else 0
+    if n_labels == 0:
+        return np.full(len(vectors), -1, dtype=np.int64)
+    offsets = np.arange(len(vectors))[:, None] * n_labels
+    counts = np.bincount((votes + offsets)[valid], weights=similarity[valid],
+                         minlength=len(vectors) * n_labels).reshape(len(vectors), n_labels)
+    assigned = counts.argmax(axis=1)
+    assigned[counts.max(axis=1) <= 0] = -1
+    return assigned
+
+
+def cluster_sample(embeddings, min_cluster_size=3, sample_size=20000, k=10, seed=42):
+    n = len(embeddings)
+    vectors = l2_normalize(embeddings)
+    if n <= sample_size:
+        return cluster_hdbscan(vectors, min_cluster_size)
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(n, sample_size, replace=False))
+    labels = np.full(n, -1, dtype=np.int64)
+    labels[sample] = cluster_hdbscan(vectors[sample], min_cluster_size)
+    rest = np.setdiff1d(np.arange(n), sample, assume_unique=True)
+    index = KnnIndex(vectors[sample])
+    labels[rest] = assign_by_neighbors(index, labels[sample], vectors[rest], k=k)
+    return labels
+
+
+def cluster_embeddings(embeddings, method=None, min_cluster_size=3, **options):
+    method = method or os.environ.get("ARS_CLUSTER_METHOD", "hdbscan")
+    if method == "hdbscan":
+        return cluster_hdbscan(embeddings, min_cluster_size, **options)
+    # Die skalierbaren Varianten arbeiten immer mit Kosinus-Ähnlichkeit
+    options.pop("metric", None)
+    if method == "knn-graph":
+        return cluster_knn_graph(embeddings, min_cluster_size, **options)
+    if method == "sample":
+        return cluster_sample(embeddings, min_cluster_size, **options)
+    raise ValueError(f"Unbekannte Clustering-Methode: {method} (erlaubt: {', '.join(METHODS)})")
+
+
+class CategoryModel:
+    """Persistierbares Kategorienmodell: Zentroiden, Exemplare und Namen je Kategorie.
+
+    Die Kategorie-IDs bleiben über Läufe hinweg stabil: neue Clusterungen
+    werden per Zentroid-Abgleich auf bestehende IDs abgebildet, nur
+    unbekannte Cluster erhalten neue IDs. Neue Äußerungen werden ohne
+    erneutes Clustern über die nächsten Exemplare zugeordnet.
+    """
+
+    def __init__(self, encoder=None, max_exemplars=50):
+        self.encoder = encoder
+        self.max_exemplars = max_exemplars
+        self.ids = np.zeros(0, dtype=np.int64)          # stabile ID je Zentroid
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.sizes = np.zeros(0, dtype=np.int64)
+        self.exemplars = np.zeros((0, 0), dtype=np.float32)
+        self.exemplar_ids = np.zeros(0, dtype=np.int64)
+        self.names = {}
+        self.next_id = 0
+        # Optional: HDBSCAN mit prediction_data für approximate_predict
+        self.clusterer = None
+        self._clusterer_ids = None
+        self._index = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    # --- Aufbau ---
+
+    def _summarize(self, vectors, labels):
+        # Zentroid, Größe und die zentrumsnächsten Exemplare je Cluster
+        clusters = np.unique(labels[labels >= 0])
+        centroids, sizes, exemplars, owners = [], [], [], []
+        for c in clusters:
+            members = vectors[labels == c]
+            centroid = l2_normalize(members.mean(axis=0, keepdims=True))[0]
+            nearest = np.argsort(-(members @ centroid))[:self.max_exemplars]
+            centroids.append(centroid)
+            sizes.append(len(members))
+            exemplars.append(members[nearest])
+            owners.append(np.full(len(nearest), c, dtype=np.int64))
+        return clusters, centroids, sizes, exemplars, owners
+
+    def update(self, embeddings, labels, min_similarity=0.8, names=None, clusterer=None):
+        # Übernimmt eine (neue) Clusterung und liefert die Labels als stabile IDs;
+        # names (Cluster-Label -> Name) überschreibt vorhandene Namen
+        vectors = l2_normalize(embeddings)
+        labels = np.asarray(labels, dtype=np.int64)
+        clusters, centroids, sizes, exemplars, owners = self._summarize(vectors, labels)
+        mapping = {}
+        if len(clusters) and len(self.ids):
+            from scipy.optimize import linear_sum_assignment
+            similarity = np.stack(centroids) @ self.centroids.T
+            rows, cols = linear_sum_assignment(-similarity)
+            for r, c in zip(rows, cols):
+                if similarity[r, c] >= min_similarity:
+                    mapping[clusters[r]] = int(self.ids[c])
+        for c in clusters:
+            if c not in mapping:
+                mapping[c] = self.next_id
+                self.next_id += 1
+
+        # Gematchte Kategorien werden durch die neue Zusammenfassung ersetzt,
+        # nicht wiedergefundene bleiben erhalten (Grammatik kennt sie weiterhin)
+        new_ids = np.array([mapping[c] for c in clusters], dtype=np.int64)
+        keep = ~np.isin(self.ids, new_ids)
+        keep_ex = ~np.isin(self.exemplar_ids, new_ids)
+        dim = vectors.shape[1]
+        self.ids = np.concatenate([self.ids[keep], new_ids])
+        self.centroids = np.concatenate([self.centroids[keep].reshape(-1, dim)] + [c[None] for c in centroids])
+        self.sizes = np.concatenate([self.sizes[keep], np.asarray(sizes, dtype=np.int64)])
+        self.exemplars = np.concatenate([self.exemplars[keep_ex].reshape(-1, dim)] + exemplars)
+        self.exemplar_ids = np.concatenate([self.exemplar_ids[keep_ex]] + [np.full(len(o), mapping[c], dtype=np.int64)
+                                                                             for c, o in zip(clusters, owners)])
+        self._index = None
+
+        # Ein Clusterer ohne die neue Clusterung würde veraltete IDs liefern
+        self.clusterer = clusterer
+        self._clusterer_ids = mapping if clusterer is not None else None
+        for c, name in (names or {}).items():
+            if c in mapping:
+                self.names[mapping[c]] = name
+        stable = np.full(len(labels), -1, dtype=np.int64)
+        for c, i in mapping.items():
+            stable[labels == c] = i
+        return stable
+
+    @classmethod
+    def fit(cls, embeddings, labels, encoder=None, names=None, max_exemplars=50, clusterer=None):
+        model = cls(encoder=encoder, max_exemplars=max_exemplars)
+        model.update(embeddings, labels, names=names, clusterer=clusterer)
+        return model
+
+    # --- Zuordnung ---
+
+    def predict(self, embeddings, k=10, min_similarity=0.3):
+        # Stabile Kategorie-ID je Vektor, -1 wenn keine Kategorie nah genug ist
+        if not len(self.ids) or not len(embeddings):
+            return np.full(len(embeddings), -1, dtype=np.int64)
+        if self.clusterer is not None and getattr(self.clusterer, "prediction_data_", None) is not None:
+            import hdbscan
+            raw, _ = hdbscan.approximate_predict(self.clusterer, embeddings)
+            return np.array([self._clusterer_ids.get(r, -1) for r in raw], dtype=np.int64)
+        if self._index is None:
+            self._index = KnnIndex(self.exemplars)
+        return assign_by_neighbors(self._index, self.exemplar_ids, embeddings, k=k, min_similarity=min_similarity)
+
+    def name(self, category_id, prefix="T_"):
+        return self.names.get(int(category_id), f"{prefix}{category_id}")
+
+    def symbols(self, labels, prefix="T_"):
+        return [self.name(c, prefix) for c in labels]
+
+    # --- Persistenz ---
+
+    def save(self, directory, with_clusterer=False):
+        os.makedirs(directory, exist_ok=True)
+        np.savez(os.path.join(directory, "categories.npz"), ids=self.ids, centroids=self.centroids,
+                 sizes=self.sizes, exemplars=self.exemplars, exemplar_ids=self.exemplar_ids)
+        meta = {
+            "encoder": self.encoder,
+            "max_exemplars": self.max_exemplars,
+            "next_id": self.next_id,
+            "names": {str(k): v for k, v in self.names.items()},
+        }
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        if with_clusterer and self.clusterer is not None:
+            import pickle
+            with open(os.path.join(directory, "clusterer.pkl"), "wb") as f:
+                pickle.dump((self.clusterer, self._clusterer_ids), f)
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        model = cls(encoder=meta.get("encoder"), max_exemplars=meta.get("max_exemplars", 50))
+        model.next_id = meta["next_id"]
+        model.names = {int(k): v for k, v in meta.get("names", {}).items()}
+        with np.load(os.path.join(directory, "categories.npz")) as data:
+            model.ids = data["ids"]
+            model.centroids = data["centroids"]
+            model.sizes = data["sizes"]
+            model.exemplars = data["exemplars"]
+            model.exemplar_ids = data["exemplar_ids"]
+        path = os.path.join(directory, "clusterer.pkl")
+        if os.path.exists(path):
+            import pickle
+            with open(path, "rb") as f:
+                model.clusterer, model._clusterer_ids = pickle.load(f)
+        return model
@@ -1,94 +1,229 @@
 import os
 import json
 import csv
-import yaml
 import numpy as np
 
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.decomposition import PCA
-from sentence_transformers import SentenceTransformer
-import hdbscan
-import random
-
-# Modell laden
-model = SentenceTransformer("all-MiniLM-L6-v2")
-
-def read_transcripts(file_paths):
-    utterances = []
-    for file in file_paths:
-        with open(file, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if line:
-                    utterances.append(line)
-    return utterances
-
-def embed_utterances(utterances):
-    return model.encode(utterances)
-
-def cluster_embeddings(embeddings):
-    clusterer = hdbscan.HDBSCAN(min_cluster_size=3)
-    labels = clusterer.fit_predict(embeddings)
-    return labels
-
-def build_pcfg(labels, utterances):
-    pcfg = {}
-    terminal_chain = []
-    for i in range(len(labels) - 1):
-        src = str(labels[i])
-        dst = str(labels[i + 1])
-        terminal_chain.append(src)
-        if src not in pcfg:
-            pcfg[src] = {}
-        pcfg[src][dst] = pcfg[src].get(dst, 0) + 1
-
-    # Wahrscheinlichkeiten normalisieren
-    for src in pcfg:
-        total = sum(pcfg[src].values())
-        for dst in pcfg[src]:
-            pcfg[src][dst] /= total
-
-    return pcfg, terminal_chain
-
-def process_multiple_dialogs(file_paths):
-    utterances = read_transcripts(file_paths)
-    embeddings = embed_utterances(utterances)
-    labels = cluster_embeddings(embeddings)
-    pcfg, terminal_chain = build_pcfg(labels, utterances)
+from ars_cache import EmbeddingCache
+from ars_cluster import CategoryModel
+from ars_ingest import ingest_files, iter_file, format_line
+from ars_models import get_encoder
+from ars_embed import get_engine
+from ars_grammar import TransitionModel, as_dict
+from ars_sampler import ChainSampler
+from ars_artifact import save_artifact, load_artifact
+from ars_jobs import JobCancelled
+
+# Modell wird erst bei der ersten Verwendung geladen (siehe ars_models)
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+def get_model():
+    return get_encoder(MODEL_NAME)
+
+def open_embedding_cache(directory, revision="main", max_bytes=None):
+    return EmbeddingCache(directory, MODEL_NAME, revision=revision, max_bytes=max_bytes)
+
+def iter_transcripts(file_paths):
+    # Liefert (Äußerung, Datei-Index, Zeilennummer) ohne alles im Speicher zu halten;
+    # Kopfzeilen und Regieanweisungen werden übersprungen (siehe ars_ingest)
+    for file_id, file in enumerate(file_paths):
+        for line_no, speaker, text in iter_file(file):
+            yield format_line(speaker, text), file_id, line_no
+
+def iter_utterance_batches(file_paths, batch_size=1024):
+    batch, file_ids, line_numbers = [], [], []
+    for utterance, file_id, line_no in iter_transcripts(file_paths):
+        batch.append(utterance)
+        file_ids.append(file_id)
+        line_numbers.append(line_no)
+        if len(batch) >= batch_size:
+            yield batch, file_ids, line_numbers
+            batch, file_ids, line_numbers = [], [], []
+    if batch:
+        yield batch, file_ids, line_numbers
+
+def count_utterances(file_paths):
+    return sum(1 for _ in iter_transcripts(file_paths))
+
+def read_transcripts(file_paths, processes=None):
+    return ingest_files(file_paths, processes=processes).lines()
+
+def embed_utterances(utterances, cache=None):
+    engine = get_engine(MODEL_NAME)
+    if cache is None:
+        return engine.encode(utterances)
+    # Nur neue Äußerungen kodieren, Rest aus dem Cache
+    return cache.encode(engine, utterances)
+
+def embed_transcripts(file_paths, batch_size=1024, out_path=None, cache=None, keep_text=True,
+                      progress=None, cancel=None):
+    # Stapelweise einlesen und kodieren; Embeddings landen in einem vorab
+    # allokierten Array (bzw. Memmap unter out_path), Herkunft pro Zeile.
+    # progress(fertig, gesamt) nach jedem Stapel; cancel: threading.Event o. Ä.
+    total = count_utterances(file_paths)
+    embeddings = None
+    utterances = [] if keep_text else None
+    file_ids = np.zeros(total, dtype=np.int32)
+    line_numbers = np.zeros(total, dtype=np.int32)
+    pos = 0
+    for batch, batch_files, batch_lines in iter_utterance_batches(file_paths, batch_size):
+        if cancel is not None and cancel.is_set():
+            raise JobCancelled("embed_transcripts")
+        vectors = np.asarray(embed_utterances(batch, cache=cache), dtype=np.float32)
+        if embeddings is None:
+            shape = (total, vectors.shape[1])
+            if out_path:
+                embeddings = np.lib.format.open_memmap(out_path, mode='w+', dtype=np.float32, shape=shape)
+            else:
+                embeddings = np.empty(shape, dtype=np.float32)
+        end = pos + len(batch)
+        embeddings[pos:end] = vectors
+        file_ids[pos:end] = batch_files
+        line_numbers[pos:end] = batch_lines
+        if keep_text:
+            utterances.extend(batch)
+        pos = end
+        if progress is not None:
+            progress(pos, total)
+    if embeddings is None:
+        embeddings = np.zeros((0, 0), dtype=np.float32)
+    elif out_path:
+        embeddings.flush()
+    return {
+        "utterances": utterances,
+        "embeddings": embeddings,
+        "files": list(file_paths),
+        "file_ids": file_ids,
+        "line_numbers": line_numbers,
+    }
+
+def cluster_embeddings(embeddings, method=None, min_cluster_size=3):
+    # method: "hdbscan" (Standard), "knn-graph" oder "sample" (siehe ars_cluster)
+    from ars_cluster import cluster_embeddings as run_clustering
+    return run_clustering(embeddings, method=method, min_cluster_size=min_cluster_size)
+
+def open_category_model(directory=None):
+    # Gespeichertes Kategorienmodell laden oder ein leeres anlegen
+    if directory and os.path.exists(os.path.join(directory, "meta.json")):
+        return CategoryModel.load(directory)
+    return CategoryModel(encoder=MODEL_NAME)
+
+def label_utterances(utterances, category_model, cache=None):
+    # Neue Äußerungen ohne erneutes Clustern bestehenden Kategorien zuordnen
+    return category_model.predict(embed_utterances(utterances, cache=cache))
+
+def build_pcfg(labels, utterances, model=None):
+    # Zählungen bleiben im TransitionModel erhalten; neue Dialoge können
+    # später mit model.update(...) ergänzt werden
+    if model is None:
+        model = TransitionModel()
+    ids = model.intern(labels)
+    model.update_ids(ids)
+    terminal_chain = model.table.decode(ids[:-1])
+    # Grammar: dünne Matrix, verhält sich beim Lesen wie {src: {dst: p}}
+    return model.to_grammar().normalize(), terminal_chain
+
+def process_multiple_dialogs(file_paths, cache=None, batch_size=1024, embeddings_path=None,
+                             cluster_method=None, min_cluster_size=3, category_model=None,
+                             reduce=None, n_components=20, reduction_dir=None, progress=None, cancel=None,
+                             store=None):
+    # reduce: None, "pca" oder "umap" – geclustert wird dann auf n_components
+    # Dimensionen; die Projektion wird zwischengespeichert (siehe ars_reduce).
+    # progress/cancel gelten für die Einbettung (siehe embed_transcripts).
+    # store: Verzeichnis oder StageStore (Standard: ARS_STAGE_STORE); dann
+    # laufen nur Stufen mit geänderten Eingaben neu (siehe ars_pipeline),
+    # die Embeddings liegen im Store statt unter embeddings_path
+    from ars_pipeline import STAGE_STORE_PATH, run_pipeline
+    store = store or STAGE_STORE_PATH
+    if store:
+        return run_pipeline(file_paths, store, cache=cache, batch_size=batch_size,
+                            cluster_method=cluster_method, min_cluster_size=min_cluster_size,
+                            category_model=category_model, reduce=reduce, n_components=n_components,
+                            reduction_dir=reduction_dir, progress=progress, cancel=cancel)
+    corpus = embed_transcripts(file_paths, batch_size=batch_size, out_path=embeddings_path, cache=cache,
+                               progress=progress, cancel=cancel)
+    utterances = corpus["utterances"]
+    embeddings = corpus["embeddings"]
+    projection = None
+    features = embeddings
+    if reduce:
+        from ars_reduce import reduce_embeddings
+        projection = reduce_embeddings(embeddings, method=reduce, n_components=n_components,
+                                       cache_dir=reduction_dir)
+        features = projection.coords
+    labels = cluster_embeddings(features, method=cluster_method, min_cluster_size=min_cluster_size)
+    if category_model is not None:
+        # Stabile Kategorie-IDs statt neu durchnummerierter Cluster
+        labels = category_model.update(embeddings, labels)
+    transition_model = TransitionModel()
+    pcfg, terminal_chain = build_pcfg(labels, utterances, model=transition_model)
     return {
         "utterances": utterances,
         "embeddings": embeddings,
         "labels": labels,
         "pcfg": pcfg,
-        "terminal_chain": terminal_chain
+        "terminal_chain": terminal_chain,
+        "transition_model": transition_model,
+        "projection": projection,
+        "files": corpus["files"],
+        "file_ids": corpus["file_ids"],
+        "line_numbers": corpus["line_numbers"]
     }
 
-def simulate_dialog(pcfg, length=6):
+def save_analysis(result, filepath, with_embeddings=True):
+    # Ergebnis von process_multiple_dialogs als binäres Artefakt (siehe ars_artifact)
+    return save_artifact(
+        filepath, result["pcfg"],
+        counts=result["transition_model"].to_grammar(),
+        labels=result["labels"],
+        utterances=result["utterances"],
+        embeddings=result["embeddings"] if with_embeddings else None,
+        files=result["files"],
+        file_ids=result["file_ids"],
+        line_numbers=result["line_numbers"],
+        meta={"encoder": MODEL_NAME},
+    )
+
+def load_analysis(filepath):
+    # Gegenstück zu save_analysis; Embeddings bleiben eine Memmap auf die Datei
+    artifact = load_artifact(filepath)
+    counts = artifact.counts
+    labels = artifact.labels
+    return {
+        "utterances": artifact.utterances,
+        "embeddings": artifact.embeddings,
+        "labels": labels,
+        "pcfg": artifact.grammar,
+        "terminal_chain": artifact.label_symbols[:-1],
+        "transition_model": TransitionModel.from_grammar(counts) if counts is not None else TransitionModel(),
+        "projection": None,
+        "files": artifact.files,
+        "file_ids": artifact.file_ids,
+        "line_numbers": artifact.line_numbers
+    }
+
+def simulate_dialog(pcfg, length=6, seed=None):
     if not pcfg:
         return []
-    current = random.choice(list(pcfg.keys()))
-    sequence = [current]
-    for _ in range(length - 1):
-        if current not in pcfg:
-            break
-        next_states = list(pcfg[current].keys())
-        probs = list(pcfg[current].values())
-        current = np.random.choice(next_states, p=probs)
-        sequence.append(current)
-    return sequence
+    return ChainSampler(pcfg, seed=seed).sample_symbols(1, length)[0]
+
+def simulate_dialogs(pcfg, n_dialogs, length=6, seed=None):
+    # Viele Dialoge auf einmal: int-Array (n_dialogs, length) plus Symboltabelle
+    sampler = ChainSampler(pcfg, seed=seed)
+    return sampler.sample(n_dialogs, length), sampler.symbols
 
 def export_pcfg_to_json(pcfg, filepath):
     with open(filepath, 'w', encoding='utf-8') as f:
-        json.dump(pcfg, f, indent=2)
+        json.dump(as_dict(pcfg), f, indent=2)
 
 def export_pcfg_to_csv(pcfg, filepath):
     with open(filepath, 'w', encoding='utf-8', newline='') as f:
         writer = csv.writer(f)
         writer.writerow(["Source", "Target", "Probability"])
-        for src in pcfg:
-            for dst in pcfg[src]:
-                writer.writerow([src, dst, pcfg[src][dst]])
+        for src, targets in pcfg.items():
+            for dst, prob in targets.items():
+                writer.writerow([src, dst, prob])
 
 def export_pcfg_to_yaml(pcfg, filepath):
+    import yaml
     with open(filepath, 'w', encoding='utf-8') as f:
-        yaml.dump(pcfg, f, sort_keys=False, allow_unicode=True)
+        yaml.dump(as_dict(pcfg), f, sort_keys=False, allow_unicode=True)
@@ -0,0 +1,153 @@
+import os
+import time
+import threading
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from ars_jobs import JobCancelled
+from ars_models import get_encoder, DEFAULT_ENCODER
+
+# Embedding-Engine: Äußerungen nach Länge sortieren (weniger Padding),
+# Stapelgröße nach Token-Budget wählen und Stapel optional auf mehrere
+# Prozesse verteilen. Die Ausgabe behält immer die Eingabereihenfolge.
+
+
+def estimate_tokens(text):
+    # Grobe Schätzung ohne Tokenizer: Wörter plus Satzzeichen, mind. 1
+    return max(1, len(text.split()) + len(text) // 20) + 2
+
+
+def plan_batches(utterances, token_budget=4096, min_batch=8, max_batch=256):
+    # Liefert Listen von Indizes; innerhalb eines Stapels ähnlich lange Texte
+    lengths = np.fromiter((estimate_tokens(u) for u in utterances), dtype=np.int64, count=len(utterances))
+    order = np.argsort(-lengths, kind="stable")
+    batches = []
+    start = 0
+    while start < len(order):
+        longest = lengths[order[start]]
+        size = int(min(max_batch, max(min_batch, token_budget // longest)))
+        batches.append(order[start:start + size])
+        start += size
+    return batches
+
+
+_worker_model = None
+
+
+def _worker_init(model_name, threads):
+    global _worker_model
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    _worker_model = model_name
+
+
+def _worker_encode(batch, encode_kwargs):
+    model = get_encoder(_worker_model)
+    return np.asarray(model.encode(batch, batch_size=len(batch), show_progress_bar=False, **encode_kwargs),
+                      dtype=np.float32)
+
+
+class EmbeddingEngine:
+    def __init__(self, model_name=DEFAULT_ENCODER, processes=1, token_budget=4096,
+                 min_batch=8, max_batch=256):
+        self.model_name = model_name
+        self.processes = processes or os.cpu_count() or 1
+        self.token_budget = token_budget
+        self.min_batch = min_batch
+        self.max_batch = max_batch
+        self.last_stats = None
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                threads = max(1, (os.cpu_count() or 1) // self.processes)
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.processes,
+                    initializer=_worker_init,
+                    initargs=(self.model_name, threads),
+                )
+            return self._pool
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
+
+    def encode(self, utterances, progress=None, cancel=None, **encode_kwargs):
+        # progress(fertig, gesamt) nach jedem Stapel; cancel wird zwischen
+        # zwei Stapeln geprüft (JobCancelled)
+        encode_kwargs.pop("show_progress_bar", None)
+        utterances = list(utterances)
+        started = time.perf_counter()
+        batches = plan_batches(utterances, self.token_budget, self.min_batch, self.max_batch)
+        texts = [[utterances[i] for i in idx] for idx in batches]
+
+        futures = []
+        if self.processes > 1 and len(batches) > 1:
+            # Einzeln einreichen: bei Abbruch werden die noch wartenden Stapel
+            # verworfen, statt den nächsten Auftrag im Pool aufzuhalten
+            pool = self._get_pool()
+            futures = [pool.submit(_worker_encode, batch, encode_kwargs) for batch in texts]
+            results = (future.result() for future in futures)
+        else:
+            model = get_encoder(self.model_name)
+            results = (
+                np.asarray(model.encode(batch, batch_size=len(batch), show_progress_bar=False, **encode_kwargs),
+                           dtype=np.float32)
+                for batch in texts
+            )
+
+        output = None
+        done = 0
+        try:
+            for idx, vectors in zip(batches, results):
+                if output is None:
+                    output = np.empty((len(utterances), vectors.shape[1]), dtype=np.float32)
+                # Zurück an die ursprünglichen Positionen
+                output[idx] = vectors
+                done += len(idx)
+                if progress is not None:
+                    progress(done, len(utterances))
+                if cancel is not None and cancel.is_set() and done < len(utterances):
+                    raise JobCancelled("encode")
+        finally:
+            for future in futures:
+                future.cancel()
+        if output is None:
+            output = np.zeros((0, 0), dtype=np.float32)
+
+        elapsed = time.perf_counter() - started
+        self.last_stats = {
+            "utterances": len(utterances),
+            "batches": len(batches),
+            "processes": self.processes,
+            "seconds": elapsed,
+            "per_second": len(utterances) / elapsed if elapsed > 0 else 0.0,
+        }
+        return output
+
+    def throughput(self):
+        return self.last_stats["per_second"] if self.last_stats else 0.0
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(model_name=DEFAULT_ENCODER, processes=None):
+    # Eine Engine pro (Modell, Prozesszahl), von allen Apps geteilt
+    if processes is None:
+        processes = int(os.environ.get("ARS_EMBED_PROCESSES", "1"))
+    key = (model_name, processes)
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = EmbeddingEngine(model_name, processes=processes)
+            _engines[key] = engine
+    return engine
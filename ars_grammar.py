@@ -0,0 +1,484 @@
+import numpy as np
+
+# Symboltabelle (String-Symbole -> int32-IDs) und vektorisiertes Zählen
+# von Übergängen. Darauf baut das Übergangsmodell auf: neue Dialoge werden
+# inkrementell hinzugezählt, Teilkorpora getrennt gezählt und zusammengeführt;
+# Wahrscheinlichkeiten werden erst bei Bedarf normalisiert.
+
+
+class SymbolTable:
+    def __init__(self, symbols=()):
+        self.symbols = []
+        self.index = {}
+        for symbol in symbols:
+            self.add(symbol)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __contains__(self, symbol):
+        return symbol in self.index
+
+    def __getitem__(self, idx):
+        return self.symbols[idx]
+
+    def add(self, symbol):
+        idx = self.index.get(symbol)
+        if idx is None:
+            idx = len(self.symbols)
+            self.index[symbol] = idx
+            self.symbols.append(symbol)
+        return idx
+
+    def id(self, symbol, default=-1):
+        return self.index.get(symbol, default)
+
+    def encode(self, labels, add=True):
+        # Neue Symbole bekommen IDs in der Reihenfolge ihres ersten Auftretens
+        if isinstance(labels, np.ndarray) and labels.dtype.kind in "iub":
+            # Numerische Labels (z. B. HDBSCAN): nur die eindeutigen Werte
+            # laufen durch Python
+            if labels.size == 0:
+                return np.zeros(0, dtype=np.int32)
+            uniques, first, inverse = np.unique(labels, return_index=True, return_inverse=True)
+            mapped = np.empty(len(uniques), dtype=np.int32)
+            for u in np.argsort(first, kind="stable"):
+                symbol = str(uniques[u])
+                mapped[u] = self.add(symbol) if add else self.index.get(symbol, -1)
+            return mapped[inverse.reshape(-1)]
+
+        if isinstance(labels, np.ndarray):
+            labels = labels.tolist()
+        index = self.index
+        try:
+            return np.fromiter(map(index.__getitem__, labels), dtype=np.int32, count=len(labels))
+        except KeyError:
+            pass
+        if not add:
+            return np.fromiter((index.get(s, -1) for s in labels), dtype=np.int32, count=len(labels))
+        for symbol in dict.fromkeys(labels):
+            self.add(symbol)
+        return np.fromiter(map(index.__getitem__, labels), dtype=np.int32, count=len(labels))
+
+    def decode(self, ids):
+        return [self.symbols[i] for i in ids]
+
+
+def _chain_pairs(chains):
+    # chains: ein ID-Array, ein 2D-Array (eine Kette pro Zeile) oder eine
+    # Liste davon; keine Paare über Kettengrenzen, -1 markiert Lücken
+    if isinstance(chains, np.ndarray) and chains.ndim == 2:
+        src = chains[:, :-1].astype(np.int64).ravel()
+        dst = chains[:, 1:].astype(np.int64).ravel()
+        valid = (src >= 0) & (dst >= 0)
+        return src[valid], dst[valid]
+    if isinstance(chains, np.ndarray) and chains.ndim == 1:
+        chains = [chains]
+    src = [c[:-1] for c in chains if len(c) > 1]
+    dst = [c[1:] for c in chains if len(c) > 1]
+    if not src:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    src = np.concatenate(src).astype(np.int64)
+    dst = np.concatenate(dst).astype(np.int64)
+    valid = (src >= 0) & (dst >= 0)
+    return src[valid], dst[valid]
+
+
+def pair_counts(chains, n_symbols, order="key"):
+    # Eindeutige Übergänge (Quelle, Ziel, Anzahl). order="first" sortiert wie
+    # ein dict-of-dicts: Quellen nach erstem Auftreten, darin die Ziele.
+    src, dst = _chain_pairs(chains)
+    keys = src * n_symbols + dst
+    uniq, first, counts = np.unique(keys, return_index=True, return_counts=True)
+    rows, cols = uniq // n_symbols, uniq % n_symbols
+    if order == "first" and len(keys):
+        src_first = np.full(n_symbols, len(keys), dtype=np.int64)
+        np.minimum.at(src_first, src, np.arange(len(keys)))
+        perm = np.lexsort((first, src_first[rows]))
+        rows, cols, counts = rows[perm], cols[perm], counts[perm]
+    return rows, cols, counts
+
+
+def count_selected_pairs(chains, n_symbols, rows, cols):
+    # Zählt nur die vorgegebenen Übergänge, in deren Reihenfolge
+    src, dst = _chain_pairs(chains)
+    wanted = np.asarray(rows, dtype=np.int64) * n_symbols + np.asarray(cols, dtype=np.int64)
+    order = np.argsort(wanted)
+    keys = src * n_symbols + dst
+    pos = np.searchsorted(wanted[order], keys)
+    pos = np.minimum(pos, len(wanted) - 1) if len(wanted) else pos
+    hit = wanted[order][pos] == keys if len(wanted) else np.zeros(len(keys), dtype=bool)
+    counts = np.zeros(len(wanted), dtype=np.int64)
+    np.add.at(counts, order[pos[hit]], 1)
+    return counts
+
+
+def remap_chains(ids, mapping):
+    # IDs (2D, eine Kette pro Zeile) über mapping in eine andere Symboltabelle
+    # übertragen; nicht abbildbare Symbole (-1) werden entfernt, der Rest rückt auf
+    ids = np.asarray(ids)
+    mapped = np.where(ids >= 0, np.asarray(mapping)[np.maximum(ids, 0)], -1)
+    order = np.argsort(mapped < 0, axis=1, kind="stable")
+    return np.take_along_axis(mapped, order, axis=1)
+
+
+def count_transitions(chains, n_symbols, sparse=False):
+    if sparse:
+        from scipy.sparse import csr_matrix
+        rows, cols, counts = pair_counts(chains, n_symbols)
+        return csr_matrix((counts, (rows, cols)), shape=(n_symbols, n_symbols), dtype=np.int64)
+    src, dst = _chain_pairs(chains)
+    counts = np.bincount(src * n_symbols + dst, minlength=n_symbols * n_symbols)
+    return counts.reshape(n_symbols, n_symbols)
+
+
+def count_unigrams(chains, n_symbols):
+    if isinstance(chains, np.ndarray):
+        chains = [chains.ravel()]
+    ids = np.concatenate([np.asarray(c) for c in chains]) if len(chains) else np.zeros(0, dtype=np.int64)
+    ids = ids[ids >= 0]
+    return np.bincount(ids, minlength=n_symbols)
+
+
+class TransitionModel:
+    # Zählungen dünn: neue Übergänge werden als (Quelle, Ziel, Anzahl)
+    # gesammelt und erst beim Lesen zu einer CSR-Matrix zusammengefasst;
+    # Speicher wächst mit der Zahl der Regeln, nicht mit Symbole².
+    def __init__(self, symbols=None):
+        self.table = symbols if symbols is not None else SymbolTable()
+        self._counts = None
+        self._pending = []
+        self._probabilities = None
+
+    def __len__(self):
+        return len(self.table)
+
+    @property
+    def symbols(self):
+        return self.table.symbols
+
+    @property
+    def index(self):
+        return self.table.index
+
+    @property
+    def counts(self):
+        # CSR (int64, Symbole x Symbole)
+        from scipy.sparse import coo_matrix
+        n = len(self.symbols)
+        if self._counts is None or self._pending or self._counts.shape != (n, n):
+            parts = self._pending
+            if self._counts is not None and self._counts.nnz:
+                coo = self._counts.tocoo()
+                parts = [(coo.row, coo.col, coo.data)] + parts
+            if parts:
+                rows, cols, values = (np.concatenate(p) for p in zip(*parts))
+            else:
+                rows = cols = values = np.zeros(0, dtype=np.int64)
+            # tocsr() summiert doppelte (Quelle, Ziel)-Einträge
+            self._counts = coo_matrix((values.astype(np.int64), (rows, cols)), shape=(n, n)).tocsr()
+            self._pending = []
+        return self._counts
+
+    def intern(self, labels):
+        return self.table.encode(labels)
+
+    def update(self, labels):
+        return self.update_ids(self.intern(labels))
+
+    def update_ids(self, chains):
+        # Nur die tatsächlich vorkommenden Paare werden gespeichert
+        rows, cols, counts = pair_counts(chains, len(self.table))
+        if len(counts):
+            self._pending.append((rows, cols, counts))
+            self._probabilities = None
+        return self
+
+    def merge(self, other):
+        if not len(other):
+            return self
+        mapping = self.intern(other.symbols)
+        coo = other.counts.tocoo()
+        if coo.nnz:
+            self._pending.append((mapping[coo.row].astype(np.int64), mapping[coo.col].astype(np.int64), coo.data))
+            self._probabilities = None
+        return self
+
+    @property
+    def probabilities(self):
+        # Zeilennormalisierte CSR-Matrix (float64)
+        if self._probabilities is None:
+            from scipy.sparse import diags
+            counts = self.counts.astype(np.float64)
+            totals = np.asarray(counts.sum(axis=1)).ravel()
+            scale = np.divide(1.0, totals, out=np.zeros_like(totals), where=totals > 0)
+            self._probabilities = (diags(scale) @ counts).tocsr()
+        return self._probabilities
+
+    def to_pcfg(self):
+        probs = self.probabilities
+        symbols = self.symbols
+        pcfg = {}
+        for i, src in enumerate(symbols):
+            start, end = probs.indptr[i], probs.indptr[i + 1]
+            if end > start:
+                pcfg[src] = {symbols[j]: float(p) for j, p in zip(probs.indices[start:end], probs.data[start:end])}
+        return pcfg
+
+    @classmethod
+    def from_grammar(cls, counts):
+        # Umkehrung von to_grammar(), z. B. nach dem Laden eines Artefakts
+        model = cls(SymbolTable(counts.symbols))
+        coo = counts.matrix.tocoo()
+        model._pending.append((coo.row.astype(np.int64), coo.col.astype(np.int64),
+                               np.rint(coo.data).astype(np.int64)))
+        return model
+
+    def to_grammar(self):
+        # Zählungen als Grammar; Wahrscheinlichkeiten über .normalize()
+        return Grammar(self.counts, SymbolTable(self.symbols))
+
+    def to_counts(self):
+        counts = self.counts
+        symbols = self.symbols
+        result = {}
+        for i, src in enumerate(symbols):
+            start, end = counts.indptr[i], counts.indptr[i + 1]
+            if end > start:
+                result[src] = {symbols[j]: int(c) for j, c in zip(counts.indices[start:end], counts.data[start:end])}
+        return result
+
+
+# --- Grammatik als dünne Matrix ---
+# Zeile = Quellsymbol, Spalte = Folgesymbol, Werte = Wahrscheinlichkeiten
+# (bzw. Gewichte vor normalize()). Für bestehenden Code verhält sich eine
+# Grammar wie das frühere {src: {dst: p}}: Iteration über Quellsymbole mit
+# Regeln, grammar[src] liefert eine (schreibgeschützte) Regelansicht.
+
+
+class Grammar:
+    def __init__(self, matrix, table):
+        from scipy.sparse import csr_matrix
+        n = len(table)
+        matrix = csr_matrix(matrix, dtype=np.float64)
+        if matrix.shape != (n, n):
+            # Symboltabelle ist seit dem Aufbau gewachsen: Matrix auffüllen
+            matrix.resize((n, n))
+        matrix.sum_duplicates()
+        matrix.eliminate_zeros()
+        self.matrix = matrix
+        self.table = table
+
+    @classmethod
+    def from_dict(cls, pcfg, table=None):
+        if isinstance(pcfg, Grammar):
+            return pcfg.copy()
+        matrix, table = transition_matrix(pcfg, table)
+        return cls(matrix, table)
+
+    @classmethod
+    def from_counts(cls, counts, table):
+        return cls(counts, table)
+
+    # --- dict-kompatible Sicht ---
+
+    @property
+    def symbols(self):
+        return self.table.symbols
+
+    def _sources(self):
+        return np.flatnonzero(np.diff(self.matrix.indptr))
+
+    def __len__(self):
+        return len(self._sources())
+
+    def __bool__(self):
+        return self.matrix.nnz > 0
+
+    def __iter__(self):
+        symbols = self.table.symbols
+        return (symbols[i] for i in self._sources())
+
+    def keys(self):
+        return list(self)
+
+    def __contains__(self, src):
+        i = self.table.id(src)
+        return i >= 0 and self.matrix.indptr[i + 1] > self.matrix.indptr[i]
+
+    def row(self, src):
+        i = self.table.id(src)
+        if i < 0:
+            return {}
+        start, end = self.matrix.indptr[i], self.matrix.indptr[i + 1]
+        symbols = self.table.symbols
+        return {symbols[j]: float(v) for j, v in zip(self.matrix.indices[start:end], self.matrix.data[start:end])}
+
+    def __getitem__(self, src):
+        if src not in self:
+            raise KeyError(src)
+        from types import MappingProxyType
+        return MappingProxyType(self.row(src))
+
+    def get(self, src, default=None):
+        return self[src] if src in self else default
+
+    def items(self):
+        return ((src, self[src]) for src in self)
+
+    def values(self):
+        return (self[src] for src in self)
+
+    def to_dict(self):
+        return {src: self.row(src) for src in self}
+
+    def copy(self):
+        return Grammar(self.matrix.copy(), self.table)
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    @property
+    def nbytes(self):
+        m = self.matrix
+        return m.data.nbytes + m.indices.nbytes + m.indptr.nbytes
+
+    # --- vektorisierte Operationen (liefern neue Grammatiken) ---
+
+    def row_sums(self):
+        return np.asarray(self.matrix.sum(axis=1)).ravel()
+
+    def normalize(self):
+        from scipy.sparse import diags
+        sums = self.row_sums()
+        scale = np.divide(1.0, sums, out=np.zeros_like(sums), where=sums > 0)
+        return Grammar(diags(scale) @ self.matrix, self.table)
+
+    def align(self, table):
+        # Dieselbe Grammatik im Indexraum einer anderen Symboltabelle;
+        # dort unbekannte Symbole fallen heraus
+        from scipy.sparse import csr_matrix
+        if table is self.table:
+            return self
+        mapping = table.encode(self.table.symbols, add=False).astype(np.int64)
+        coo = self.matrix.tocoo()
+        rows, cols = mapping[coo.row], mapping[coo.col]
+        keep = (rows >= 0) & (cols >= 0)
+        n = len(table)
+        return Grammar(csr_matrix((coo.data[keep], (rows[keep], cols[keep])), shape=(n, n)), table)
+
+    def smooth(self, counts, alpha=0.1):
+        # Additive Glättung auf dem Regelmuster dieser Grammatik:
+        # (c(src, dst) + alpha) / (Summe c(src, .) + alpha * Regeln(src))
+        from scipy.sparse import csr_matrix
+        counts = counts.align(self.table).matrix
+        pattern = self.matrix.copy()
+        pattern.data[:] = 1.0
+        rules = np.diff(pattern.indptr)
+        rows = np.repeat(np.arange(len(rules)), rules)
+        base = np.asarray(counts[rows, pattern.indices]).ravel()
+        totals = np.asarray(counts.sum(axis=1)).ravel()
+        values = (base + alpha) / (totals[rows] + alpha * rules[rows])
+        return Grammar(csr_matrix((values, pattern.indices.copy(), pattern.indptr.copy()), shape=pattern.shape), self.table)
+
+    def blend(self, other, weight):
+        # (1 - weight) * self + weight * other, Symbole von other werden angeglichen
+        return Grammar((1.0 - weight) * self.matrix + weight * other.align(self.table).matrix, self.table)
+
+    def adjust_columns(self, columns, delta, low=0.01, high=0.99):
+        # Regeln mit Ziel in columns um delta[k] verschieben (auf [low, high]
+        # begrenzt), übrige Regeln unverändert; danach neu normalisieren
+        m = self.matrix.copy()
+        shift = np.zeros(m.shape[1])
+        selected = np.zeros(m.shape[1], dtype=bool)
+        columns = np.asarray(columns, dtype=np.int64)
+        valid = columns >= 0
+        shift[columns[valid]] = np.asarray(delta)[valid]
+        selected[columns[valid]] = True
+        hit = selected[m.indices]
+        m.data[hit] = np.clip(m.data[hit] + shift[m.indices[hit]], low, high)
+        return Grammar(m, self.table).normalize()
+
+
+def as_dict(pcfg):
+    # Für Exporte (JSON/YAML): Grammar in {src: {dst: p}} umwandeln
+    return pcfg.to_dict() if isinstance(pcfg, Grammar) else pcfg
+
+
+# --- Analytische Auswertung von Übergangsgrammatiken ---
+# Erwartete Häufigkeiten lassen sich direkt aus der Übergangsmatrix
+# berechnen, statt Ketten zu simulieren und auszuzählen.
+
+
+def transition_matrix(pcfg, table=None):
+    from scipy.sparse import csr_matrix
+    if isinstance(pcfg, Grammar):
+        if table is None or table is pcfg.table:
+            return pcfg.matrix, pcfg.table
+        for symbol in pcfg.symbols:
+            table.add(symbol)
+        return pcfg.align(table).matrix, table
+    table = table if table is not None else SymbolTable()
+    rows, cols, values = [], [], []
+    for src, targets in pcfg.items():
+        i = table.add(src)
+        for dst, prob in targets.items():
+            rows.append(i)
+            cols.append(table.add(dst))
+            values.append(prob)
+    n = len(table)
+    return csr_matrix((values, (rows, cols)), shape=(n, n), dtype=np.float64), table
+
+
+def expected_counts(P, start, horizon, next_state=None, tol=1e-12):
+    # Erwartete Anzahl jedes erzeugten Symbols in `horizon` Schritten.
+    # P: Zustand -> erzeugtes Symbol; next_state (optional, dünn): erzeugtes
+    # Symbol -> Folgezustand. Zeilen mit Summe < 1 beenden Ketten (Sackgassen).
+    # Sobald die Verteilung stationär ist, wird der Rest hochgerechnet.
+    PT = P.T.tocsr()
+    ST = next_state.T.tocsr() if next_state is not None else None
+    v = np.asarray(start, dtype=np.float64)
+    total = np.zeros(P.shape[1])
+    for t in range(horizon):
+        emitted = PT @ v
+        total += emitted
+        v_next = emitted if ST is None else ST @ emitted
+        if np.abs(v_next - v).sum() < tol:
+            total += emitted * (horizon - t - 1)
+            break
+        v = v_next
+    return total
+
+
+def expected_bigram_counts(P, start, horizon, tol=1e-12):
+    # Erwartete Übergangszählungen einer Kette mit `horizon` Positionen
+    # (Startsymbol an Position 0): diag(Besuche der ersten horizon-1 Positionen) @ P
+    from scipy.sparse import diags
+    v = np.asarray(start, dtype=np.float64)
+    visits = v.copy()
+    if horizon > 2:
+        visits = visits + expected_counts(P, v, horizon - 2, tol=tol)
+    return (diags(visits) @ P).tocsr()
+
+
+def reduce_to_terminals(P, terminal_mask, start=None):
+    # Nichtterminale Zwischenzustände eliminieren:
+    # Q = P_TT + P_TN (I - P_NN)^-1 P_NT; ein Startvektor wird genauso
+    # auf die Terminale übertragen. Liefert (Q, Terminal-Indizes, Start).
+    from scipy.sparse import csr_matrix, identity
+    from scipy.sparse.linalg import splu
+    terminal_mask = np.asarray(terminal_mask, dtype=bool)
+    T = np.flatnonzero(terminal_mask)
+    N = np.flatnonzero(~terminal_mask)
+    P = P.tocsr()
+    Q = P[T][:, T]
+    start_T = None if start is None else np.asarray(start, dtype=np.float64)[T]
+    if len(N):
+        P_NT = P[N][:, T].toarray()
+        lu = splu((identity(len(N), format="csc") - P[N][:, N]).tocsc())
+        through = lu.solve(P_NT)
+        Q = Q + csr_matrix(P[T][:, N] @ through)
+        if start is not None:
+            start_T = start_T + np.asarray(start, dtype=np.float64)[N] @ through
+    return csr_matrix(Q), T, start_T
@@ -3,16 +3,19 @@ from tkinter import filedialog, messagebox, ttk
 import os
 import json
 import csv
-import yaml
-import numpy as np
+import time
+import threading
 
 from ars_core import (
     process_multiple_dialogs,
     simulate_dialog,
     export_pcfg_to_json,
     export_pcfg_to_csv,
-    export_pcfg_to_yaml
+    export_pcfg_to_yaml,
+    save_analysis,
+    load_analysis
 )
+from ars_jobs import JobScheduler, JobCancelled
 
 class ARSGUIApp:
     def __init__(self, root):
@@ -21,6 +24,7 @@ class ARSGUIApp:
 
         self.dialog_files = []
         self.processed_data = None
+        self.jobs = JobScheduler(root)
 
         self.build_gui()
 
@@ -40,10 +44,20 @@ class ARSGUIApp:
         ttk.Button(frm, text="PCFG → CSV", command=lambda: self.export_pcfg("csv")).grid(row=3, column=1, pady=5)
         ttk.Button(frm, text="PCFG → YAML", command=lambda: self.export_pcfg("yaml")).grid(row=3, column=2, pady=5)
 
+        ttk.Button(frm, text="Analyse speichern", command=self.save_analysis).grid(row=4, column=0, pady=5)
+        ttk.Button(frm, text="Analyse laden", command=self.load_analysis).grid(row=4, column=1, pady=5)
+        ttk.Button(frm, text="Abbrechen", command=self.cancel_processing).grid(row=4, column=2, pady=5)
+        self.progress = ttk.Progressbar(frm, mode="determinate")
+        self.progress.grid(row=6, column=0, columnspan=3, sticky="ew")
+
         self.text_output = tk.Text(frm, wrap="word", height=20)
-        self.text_output.grid(row=4, column=0, columnspan=3, sticky="nsew", pady=10)
+        self.text_output.grid(row=5, column=0, columnspan=3, sticky="nsew", pady=10)
 
     def log(self, msg):
+        if threading.current_thread() is not threading.main_thread():
+            # Aus Hintergrundjobs: Tk nur im UI-Thread anfassen
+            self.jobs.call_soon(self.log, msg)
+            return
         self.text_output.insert(tk.END, msg + "\n")
         self.text_output.see(tk.END)
 
@@ -57,11 +71,41 @@ class ARSGUIApp:
         if not self.dialog_files:
             messagebox.showwarning("Warnung", "Keine Dateien ausgewählt.")
             return
+        if self.jobs.busy():
+            messagebox.showinfo("Hinweis", "Verarbeitung läuft bereits.")
+            return
         self.log("Starte Verarbeitung...")
-        self.processed_data = process_multiple_dialogs(self.dialog_files)
+        self.progress["value"] = 0
+        # Einbettung und Clustering im Hintergrund, die Oberfläche bleibt bedienbar
+        self.jobs.submit(
+            "Verarbeitung",
+            lambda job, files: process_multiple_dialogs(files, progress=job.report, cancel=job.cancel_event),
+            list(self.dialog_files),
+            on_done=self._processing_done,
+            on_error=self._job_failed,
+            on_progress=self._show_progress,
+        )
+
+    def _processing_done(self, result):
+        self.processed_data = result
         self.log("Verarbeitung abgeschlossen.")
         self.log(f"Kategorien: {set(self.processed_data['terminal_chain'])}")
 
+    def _show_progress(self, done, total):
+        self.progress["maximum"] = max(total, 1)
+        self.progress["value"] = done
+
+    def _job_failed(self, error):
+        if isinstance(error, JobCancelled):
+            self.log("Verarbeitung abgebrochen.")
+        else:
+            self.log(f"Verarbeitung fehlgeschlagen: {error}")
+
+    def cancel_processing(self):
+        if self.jobs.busy():
+            self.log("Breche nach dem aktuellen Stapel ab...")
+            self.jobs.cancel()
+
     def run_simulation(self):
         if not self.processed_data:
             messagebox.showwarning("Warnung", "Bitte zuerst Transkripte verarbeiten.")
@@ -84,9 +128,37 @@ class ARSGUIApp:
                 export_pcfg_to_yaml(self.processed_data["pcfg"], filepath)
             self.log(f"PCFG exportiert als {filepath}")
 
+    def save_analysis(self):
+        if not self.processed_data:
+            messagebox.showwarning("Warnung", "Bitte zuerst Transkripte verarbeiten.")
+            return
+        filepath = filedialog.asksaveasfilename(defaultextension=".npz", filetypes=[("ARS-Analyse", "*.npz")])
+        if filepath:
+            save_analysis(self.processed_data, filepath)
+            self.log(f"Analyse gespeichert als {filepath}")
 
-if __name__ == "__main__":
+    def load_analysis(self):
+        # Binäres Artefakt statt erneuter Einbettung und Clusterbildung
+        filepath = filedialog.askopenfilename(filetypes=[("ARS-Analyse", "*.npz")])
+        if not filepath:
+            return
+        start = time.perf_counter()
+        try:
+            self.processed_data = load_analysis(filepath)
+        except (ValueError, KeyError, OSError) as e:
+            messagebox.showerror("Fehler", f"Analyse konnte nicht geladen werden: {e}")
+            return
+        self.log(f"Analyse geladen ({len(self.processed_data['utterances'])} Äußerungen, "
+                 f"{time.perf_counter() - start:.2f}s).")
+        self.log(f"Kategorien: {set(self.processed_data['terminal_chain'])}")
+
+
+def main():
     root = tk.Tk()
     app = ARSGUIApp(root)
     root.mainloop()
 
+
+if __name__ == "__main__":
+    main()
+
@@ -0,0 +1,142 @@
+import heapq
+import numpy as np
+
+# Induktion hierarchischer Nonterminale nach Re-Pair: wiederholt das
+# häufigste Symbolpaar durch ein neues Nonterminal ersetzen. Mit verketteter
+# Liste, Positionsmengen pro Paar und einem Heap mit verzögerter
+# Invalidierung läuft das in nahezu linearer Zeit über int-kodierte Ketten;
+# wiederholte Teilfolgen beliebiger Länge entstehen als Regelhierarchie.
+
+SEPARATOR = -1
+
+
+class InducedGrammar:
+    def __init__(self, n_terminals, rules, counts, sequence):
+        self.n_terminals = n_terminals
+        self.rules = rules          # Nonterminal-ID -> (links, rechts)
+        self.counts = counts        # Nonterminal-ID -> Anzahl Ersetzungen
+        self.sequence = sequence    # komprimierte Kette, SEPARATOR zwischen Dialogen
+        self._expansions = {}
+
+    def __len__(self):
+        return len(self.rules)
+
+    def is_nonterminal(self, symbol):
+        return symbol >= self.n_terminals
+
+    def expand(self, symbol):
+        # Terminal-Expansion, Regeln werden in Erzeugungsreihenfolge aufgelöst
+        if symbol < self.n_terminals:
+            return [symbol]
+        cached = self._expansions.get(symbol)
+        if cached is None:
+            left, right = self.rules[symbol]
+            cached = self.expand(left) + self.expand(right)
+            self._expansions[symbol] = cached
+        return cached
+
+    def nonterminals(self):
+        return sorted(self.rules)
+
+    def repeated_pairs(self, min_count=2):
+        # Paare, die in der komprimierten Kette noch min_count-mal ohne
+        # Überlappung vorkommen; nach repair() immer leer
+        counts = {}
+        last = {}
+        seq = self.sequence.tolist()
+        for i in range(len(seq) - 1):
+            pair = (seq[i], seq[i + 1])
+            if SEPARATOR in pair or last.get(pair) == i - 1:
+                continue
+            last[pair] = i
+            counts[pair] = counts.get(pair, 0) + 1
+        return {pair: c for pair, c in counts.items() if c >= min_count}
+
+
+def repair(sequences, n_terminals, min_count=2, max_rules=None):
+    # sequences: ein int-Array oder eine Liste davon (Terminal-IDs 0..n-1);
+    # über Dialoggrenzen hinweg wird nichts zusammengefasst
+    if isinstance(sequences, np.ndarray) and sequences.ndim == 1:
+        sequences = [sequences]
+    parts = []
+    for seq in sequences:
+        if parts:
+            parts.append([SEPARATOR])
+        parts.append(np.asarray(seq, dtype=np.int64).tolist())
+    sym = [s for part in parts for s in part]
+    n = len(sym)
+    nxt = list(range(1, n + 1))
+    prv = list(range(-1, n - 1))
+    if n:
+        nxt[-1] = -1
+
+    occurrences = {}
+    for i in range(n - 1):
+        pair = (sym[i], sym[i + 1])
+        if pair[0] != SEPARATOR and pair[1] != SEPARATOR:
+            occurrences.setdefault(pair, set()).add(i)
+    heap = [(-len(pos), pair) for pair, pos in occurrences.items() if len(pos) >= min_count]
+    heapq.heapify(heap)
+
+    def remove(i):
+        if i < 0 or nxt[i] < 0:
+            return
+        j = nxt[i]
+        positions = occurrences.get((sym[i], sym[j]))
+        if positions is not None:
+            positions.discard(i)
+
+    def add(i):
+        if i < 0 or nxt[i] < 0:
+            return
+        j = nxt[i]
+        if sym[i] == SEPARATOR or sym[j] == SEPARATOR:
+            return
+        pair = (sym[i], sym[j])
+        positions = occurrences.setdefault(pair, set())
+        positions.add(i)
+        if len(positions) >= min_count:
+            heapq.heappush(heap, (-len(positions), pair))
+
+    rules = {}
+    counts = {}
+    next_id = n_terminals
+    while heap and (max_rules is None or len(rules) < max_rules):
+        neg, pair = heapq.heappop(heap)
+        positions = occurrences.get(pair)
+        if not positions or len(positions) < min_count:
+            continue  # veralteter Heap-Eintrag
+        if -neg != len(positions):
+            # Anzahl hat sich seit dem Eintrag geändert: mit aktuellem Wert neu einreihen
+            heapq.heappush(heap, (-len(positions), pair))
+            continue
+        # Von links nach rechts ohne Überlappung (a a a ergibt nur ein Paar)
+        selected = []
+        last = -1
+        for i in sorted(positions):
+            if i != last:
+                selected.append(i)
+                last = nxt[i]
+        if len(selected) < min_count:
+            continue
+        new = next_id
+        next_id += 1
+        for i in selected:
+            j = nxt[i]
+            remove(prv[i])
+            remove(i)
+            remove(j)
+            sym[i] = new
+            sym[j] = None
+            k = nxt[j]
+            nxt[i] = k
+            if k >= 0:
+                prv[k] = i
+            add(prv[i])
+            add(i)
+        del occurrences[pair]
+        rules[new] = pair
+        counts[new] = len(selected)
+
+    sequence = np.array([s for s in sym if s is not None], dtype=np.int64)
+    return InducedGrammar(n_terminals, rules, counts, sequence)
@@ -0,0 +1,200 @@
+import os
+import re
+import codecs
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+# Gemeinsames Einlesen von Transkripten: Dekodieren, Kopfzeilen entfernen
+# ("Text 1", "Datum: ...", Regieanweisungen in Klammern) und
+# "Sprecher: Äußerung" zerlegen. Viele Dateien werden parallel verarbeitet.
+
+HEADER_PATTERNS = [
+    re.compile(r'^(ende\s+)?text\s*\d+\s*$', re.IGNORECASE),
+    re.compile(r'^(datum|ort|zeit|uhrzeit|date|location|place|time)\s*:', re.IGNORECASE),
+]
+STAGE_DIRECTION = re.compile(r'^[\(\[].*[\)\]]$')
+SPEAKER_LINE = re.compile(r'^([^:()\[\]]{1,40}?)\s*:\s*(.+)$')
+
+ENCODINGS = ("utf-8", "cp1252", "latin-1")
+
+
+def decode_bytes(raw):
+    for encoding in ENCODINGS:
+        try:
+            return raw.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+    return raw.decode("utf-8", errors="replace")
+
+
+def detect_encoding(path, chunk_size=1 << 20):
+    # Wie decode_bytes: die erste Kodierung, mit der die ganze Datei
+    # dekodierbar ist, aber stückweise geprüft. Eine Kodierung je Datei,
+    # damit iter_file und ingest_files denselben Text liefern
+    candidates = list(ENCODINGS)
+    decoders = {encoding: codecs.getincrementaldecoder(encoding)() for encoding in candidates}
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            for encoding in list(candidates):
+                try:
+                    decoders[encoding].decode(chunk)
+                except UnicodeDecodeError:
+                    candidates.remove(encoding)
+            if len(candidates) <= 1:
+                break
+    for encoding in candidates:
+        try:
+            decoders[encoding].decode(b"", final=True)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return "utf-8"
+
+
+def open_text(path):
+    # newline=None: \n, \r\n und \r trennen Zeilen, wie in split_lines
+    return open(path, "r", encoding=detect_encoding(path), errors="replace", newline=None)
+
+
+def split_lines(text):
+    # Zeilentrennung für beide Leser; splitlines() würde zusätzlich an \x0b,
+    # \x1c–\x1e usw. trennen und so die Zeilennummern verschieben
+    return text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+
+
+def is_header(line):
+    return bool(STAGE_DIRECTION.match(line)) or any(p.match(line) for p in HEADER_PATTERNS)
+
+
+def parse_line(line):
+    # (Sprecher, Äußerung); Sprecher ist "" wenn die Zeile keinen hat
+    line = line.strip()
+    if not line or is_header(line):
+        return None
+    match = SPEAKER_LINE.match(line)
+    if match:
+        return match.group(1).strip(), match.group(2).strip()
+    return "", line
+
+
+def iter_parsed_lines(raw_text):
+    for line_no, line in enumerate(split_lines(raw_text), 1):
+        parsed = parse_line(line)
+        if parsed is not None:
+            yield line_no, parsed[0], parsed[1]
+
+
+def parse_text(raw_text, with_speaker=False):
+    if with_speaker:
+        return [(speaker, text) for _, speaker, text in iter_parsed_lines(raw_text)]
+    return [text for _, _, text in iter_parsed_lines(raw_text)]
+
+
+def iter_file(path):
+    # Zeilenweise, für Archive die nicht komplett in den Speicher sollen
+    with open_text(path) as f:
+        for line_no, line in enumerate(f, 1):
+            parsed = parse_line(line)
+            if parsed is not None:
+                yield line_no, parsed[0], parsed[1]
+
+
+def format_line(speaker, text):
+    return f"{speaker}: {text}" if speaker else text
+
+
+def read_file(path):
+    with open_text(path) as f:
+        return f.read()
+
+
+def _parse_file(path):
+    # Läuft im Worker-Prozess; liefert kompakte Spalten statt Einzelobjekte
+    speakers, texts, line_numbers = [], [], []
+    for line_no, speaker, text in iter_parsed_lines(read_file(path)):
+        speakers.append(speaker)
+        texts.append(text)
+        line_numbers.append(line_no)
+    lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+    return "".join(texts), lengths, speakers, np.asarray(line_numbers, dtype=np.int32)
+
+
+class Corpus:
+    """Spaltenorientiertes Ergebnis des Einlesens.
+
+    Alle Äußerungen liegen in einem Textpuffer; offsets[i]:offsets[i+1]
+    ist Äußerung i. speaker_ids/file_ids verweisen auf speakers/files.
+    """
+
+    def __init__(self, files, text, offsets, speakers, speaker_ids, file_ids, line_numbers):
+        self.files = files
+        self.text = text
+        self.offsets = offsets
+        self.speakers = speakers
+        self.speaker_ids = speaker_ids
+        self.file_ids = file_ids
+        self.line_numbers = line_numbers
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def utterance(self, i):
+        return self.text[self.offsets[i]:self.offsets[i + 1]]
+
+    def speaker(self, i):
+        return self.speakers[self.speaker_ids[i]]
+
+    def texts(self):
+        return [self.utterance(i) for i in range(len(self))]
+
+    def lines(self):
+        # Äußerungen mit Sprecherpräfix, wie sie im Transkript stehen
+        result = []
+        for i in range(len(self)):
+            result.append(format_line(self.speaker(i), self.utterance(i)))
+        return result
+
+    def provenance(self, i):
+        return self.files[self.file_ids[i]], int(self.line_numbers[i])
+
+
+def ingest_files(file_paths, processes=None, chunksize=8):
+    file_paths = list(file_paths)
+    if processes is None:
+        processes = min(len(file_paths), os.cpu_count() or 1)
+    if processes <= 1 or len(file_paths) < 2:
+        parts = [_parse_file(p) for p in file_paths]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as pool:
+            parts = list(pool.map(_parse_file, file_paths, chunksize=chunksize))
+
+    speaker_index = {}
+    speakers = []
+    buffers = []
+    all_lengths = []
+    speaker_ids = []
+    file_ids = []
+    line_numbers = []
+    for file_id, (text, lengths, file_speakers, lines) in enumerate(parts):
+        buffers.append(text)
+        all_lengths.append(lengths)
+        for name in file_speakers:
+            if name not in speaker_index:
+                speaker_index[name] = len(speakers)
+                speakers.append(name)
+            speaker_ids.append(speaker_index[name])
+        file_ids.append(np.full(len(lengths), file_id, dtype=np.int32))
+        line_numbers.append(lines)
+
+    lengths = np.concatenate(all_lengths) if all_lengths else np.zeros(0, dtype=np.int64)
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return Corpus(
+        files=file_paths,
+        text="".join(buffers),
+        offsets=offsets,
+        speakers=speakers,
+        speaker_ids=np.asarray(speaker_ids, dtype=np.int32),
+        file_ids=np.concatenate(file_ids) if file_ids else np.zeros(0, dtype=np.int32),
+        line_numbers=np.concatenate(line_numbers) if line_numbers else np.zeros(0, dtype=np.int32),
+    )
@@ -0,0 +1,196 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# Hintergrundjobs für die Tk-Oberflächen. Schwere Stufen (Einbettung,
+# Clustering, LLM, Optimierung) laufen in einem Thread-Pool; Fortschritt,
+# Log-Zeilen und Ergebnisse gehen über eine Warteschlange, die der UI-Thread
+# per root.after abfragt – Tk wird nur vom UI-Thread aus angefasst. Jobs
+# können auf andere warten (after=...) und zwischen Stapeln abgebrochen werden.
+
+PENDING, RUNNING, DONE, FAILED, CANCELLED = "pending", "running", "done", "failed", "cancelled"
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, scheduler, name, fn, args, kwargs, after, on_done, on_error, on_progress, process):
+        self.scheduler = scheduler
+        self.name = name
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.after = after
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.process = process
+        self.state = PENDING
+        self.result = None
+        self.error = None
+        self.cancel_event = threading.Event()
+
+    def __repr__(self):
+        return f"Job({self.name!r}, {self.state})"
+
+    @property
+    def active(self):
+        return self.state in (PENDING, RUNNING)
+
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def check(self):
+        # Zwischen zwei Stapeln aufrufen: bricht den Job bei Bedarf ab
+        if self.cancel_event.is_set():
+            raise JobCancelled(self.name)
+
+    def report(self, done, total):
+        # Aus dem Worker: Fortschritt (wird im UI-Thread zusammengefasst)
+        self.scheduler._events.put(("progress", self, (done, total)))
+
+    def cancel(self):
+        self.cancel_event.set()
+
+
+class JobScheduler:
+    """Führt Jobs außerhalb des Tk-Hauptthreads aus.
+
+    fn wird mit dem Job als erstem Argument aufgerufen (für report/check);
+    on_done, on_error und on_progress laufen im UI-Thread. Mit process=True
+    läuft fn(*args) in einem Prozesspool (muss picklebar sein, ohne Job-Argument).
+    """
+
+    def __init__(self, root, max_workers=2, processes=0, poll_ms=50):
+        self.root = root
+        self.poll_ms = poll_ms
+        self._threads = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ars-job")
+        self._processes = ProcessPoolExecutor(max_workers=processes) if processes else None
+        self._events = queue.Queue()
+        self._waiting = []
+        self.jobs = []
+        self._polling = False
+
+    # --- Einreichen ---
+
+    def submit(self, name, fn, *args, after=None, on_done=None, on_error=None, on_progress=None,
+               process=False, **kwargs):
+        # after: Job oder Liste von Jobs, die vorher erfolgreich enden müssen
+        if after is None:
+            after = []
+        elif isinstance(after, Job):
+            after = [after]
+        job = Job(self, name, fn, args, kwargs, [j for j in after if j is not None],
+                  on_done, on_error, on_progress, process)
+        self.jobs.append(job)
+        self._waiting.append(job)
+        self._start_ready()
+        self._schedule_poll()
+        return job
+
+    def call_soon(self, fn, *args):
+        # Beliebigen Aufruf aus einem Worker an den UI-Thread übergeben
+        self._events.put(("call", fn, args))
+        if threading.current_thread() is threading.main_thread():
+            self._schedule_poll()
+
+    def cancel(self, job=None):
+        # Einen Job oder alle aktiven; wartende Nachfolger entfallen mit
+        for j in ([job] if job is not None else self.jobs):
+            if j.active:
+                j.cancel()
+        self._start_ready()
+
+    def active(self):
+        return [j for j in self.jobs if j.active]
+
+    def busy(self):
+        return bool(self.active())
+
+    def shutdown(self, wait=False):
+        self.cancel()
+        self._threads.shutdown(wait=wait, cancel_futures=True)
+        if self._processes is not None:
+            self._processes.shutdown(wait=wait, cancel_futures=True)
+
+    # --- Ablauf ---
+
+    def _start_ready(self):
+        for job in list(self._waiting):
+            blocked = [dep for dep in job.after if dep.state != DONE]
+            if job.cancelled() or any(dep.state in (FAILED, CANCELLED) for dep in blocked):
+                self._waiting.remove(job)
+                self._finish(job, CANCELLED)
+            elif not blocked:
+                self._waiting.remove(job)
+                job.state = RUNNING
+                if job.process and self._processes is not None:
+                    future = self._processes.submit(job.fn, *job.args, **job.kwargs)
+                else:
+                    future = self._threads.submit(self._run, job)
+                future.add_done_callback(lambda f, job=job: self._events.put(("done", job, f)))
+
+    @staticmethod
+    def _run(job):
+        job.check()
+        return job.fn(job, *job.args, **job.kwargs)
+
+    def _finish(self, job, state, result=None, error=None):
+        job.state = state
+        job.result = result
+        job.error = error
+        if state == DONE and job.on_done is not None:
+            job.on_done(result)
+        elif state == FAILED and job.on_error is not None:
+            job.on_error(error)
+        elif state == CANCELLED and job.on_error is not None:
+            job.on_error(JobCancelled(job.name))
+
+    def _schedule_poll(self):
+        if not self._polling:
+            self._polling = True
+            self.root.after(self.poll_ms, self._poll)
+
+    def _poll(self):
+        # Im UI-Thread: Ereignisse abarbeiten, Fortschritt nur den letzten Stand
+        progress = {}
+        finished = False
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                break
+            kind = event[0]
+            if kind == "progress":
+                progress[event[1]] = event[2]
+            elif kind == "call":
+                event[1](*event[2])
+            elif kind == "done":
+                job, future = event[1], event[2]
+                if job in progress:
+                    self._report(job, progress.pop(job))
+                try:
+                    result = future.result()
+                except JobCancelled:
+                    self._finish(job, CANCELLED)
+                except Exception as e:
+                    self._finish(job, FAILED, error=e)
+                else:
+                    self._finish(job, CANCELLED if job.cancelled() and job.process else DONE, result)
+                finished = True
+        for job, value in progress.items():
+            self._report(job, value)
+        if finished:
+            self._start_ready()
+            self.jobs = [j for j in self.jobs if j.active]
+        if self.busy() or not self._events.empty():
+            self.root.after(self.poll_ms, self._poll)
+        else:
+            self._polling = False
+
+    @staticmethod
+    def _report(job, value):
+        if job.on_progress is not None:
+            job.on_progress(*value)
@@ -0,0 +1,96 @@
+import os
+import hashlib
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from ars_cache import normalize_utterance
+from ars_models import DEFAULT_ENCODER, MULTILINGUAL_ENCODER
+
+# Spracherkennung als eigene Stufe: reproduzierbar (langdetect mit festem
+# Seed), Ergebnisse nach Text-Hash zwischengespeichert, große Mengen auf
+# mehrere Prozesse verteilt (langdetect ist reines Python). Kurze Äußerungen
+# ("Ja", "Danke") erben die Sprache ihrer Gruppe (z. B. Datei + Sprecher),
+# deren Text zusammen erkannt wird.
+
+UNKNOWN = "unk"
+
+# Sprachen mit eigenem (kleinerem) Encoder; alle anderen gehen an das
+# mehrsprachige Modell
+ENCODER_BY_LANGUAGE = {"en": DEFAULT_ENCODER}
+
+_languages = {}
+
+
+def text_key(text):
+    return hashlib.sha1(normalize_utterance(text).encode("utf-8")).digest()
+
+
+def _detect_batch(texts, seed=0):
+    from langdetect import DetectorFactory, detect
+    from langdetect.lang_detect_exception import LangDetectException
+    DetectorFactory.seed = seed
+    languages = []
+    for text in texts:
+        try:
+            languages.append(detect(text))
+        except LangDetectException:
+            languages.append(UNKNOWN)
+    return languages
+
+
+def _detect_unique(texts, seed, processes, batch_size):
+    # Nur unbekannte Texte erkennen; ab mehreren Stapeln im Prozesspool
+    keys = [text_key(t) for t in texts]
+    todo = {}
+    for key, text in zip(keys, texts):
+        if key not in _languages and key not in todo:
+            todo[key] = text
+    if todo:
+        pending = list(todo.values())
+        batches = [pending[i:i + batch_size] for i in range(0, len(pending), batch_size)]
+        processes = processes or int(os.environ.get("ARS_LANG_PROCESSES", 0)) or os.cpu_count() or 1
+        if processes > 1 and len(batches) > 1:
+            with ProcessPoolExecutor(max_workers=min(processes, len(batches))) as pool:
+                results = pool.map(_detect_batch, batches, [seed] * len(batches))
+                detected = [lang for batch in results for lang in batch]
+        else:
+            detected = _detect_batch(pending, seed)
+        _languages.update(zip(todo, detected))
+    return [_languages[key] for key in keys]
+
+
+def detect_languages(texts, groups=None, min_chars=20, seed=0, processes=None, batch_size=500):
+    # Sprache je Äußerung. groups: Gruppen-ID je Äußerung (z. B. Datei/Sprecher);
+    # Äußerungen unter min_chars Zeichen erhalten die Sprache ihrer Gruppe.
+    texts = list(texts)
+    if groups is None:
+        groups = [0] * len(texts)
+    members = {}
+    for i, group in enumerate(groups):
+        members.setdefault(group, []).append(i)
+    group_texts = [" ".join(texts[i] for i in idx) for idx in members.values()]
+    long_idx = [i for i, t in enumerate(texts) if len(t.strip()) >= min_chars]
+
+    detected = _detect_unique(group_texts + [texts[i] for i in long_idx], seed, processes, batch_size)
+    group_language = dict(zip(members, detected[:len(group_texts)]))
+    languages = [group_language[g] for g in groups]
+    for i, lang in zip(long_idx, detected[len(group_texts):]):
+        if lang != UNKNOWN:
+            languages[i] = lang
+    return languages
+
+
+def encoder_for(language):
+    return ENCODER_BY_LANGUAGE.get(language, MULTILINGUAL_ENCODER)
+
+
+def route_by_language(languages):
+    # Encoder -> Indizes der Äußerungen, die er kodieren soll
+    routes = {}
+    for i, lang in enumerate(languages):
+        routes.setdefault(encoder_for(lang), []).append(i)
+    return routes
+
+
+def language_summary(languages):
+    return Counter(languages).most_common()
@@ -0,0 +1,37 @@
+from ars_embed import plan_batches
+
+# Gebündelte Textgenerierung für text2text-Pipelines: Prompts nach Länge
+# sortieren (wenig Padding), stapelweise an die Pipeline geben, Fortschritt
+# melden und zwischen zwei Stapeln auf Abbruch prüfen. Die Ausgabe behält
+# die Eingabereihenfolge; nicht erzeugte Einträge bleiben None.
+
+
+def generate_batched(llm, prompts, token_budget=2048, min_batch=4, max_batch=32,
+                     progress=None, cancel=None, **generate_kwargs):
+    # progress(fertig, gesamt) nach jedem Stapel; cancel: threading.Event o. Ä.
+    results = [None] * len(prompts)
+    done = 0
+    for batch in plan_batches(prompts, token_budget=token_budget, min_batch=min_batch, max_batch=max_batch):
+        if cancel is not None and cancel.is_set():
+            break
+        texts = [prompts[i] for i in batch]
+        try:
+            outputs = llm(texts, batch_size=len(texts), **generate_kwargs)
+        except Exception:
+            # Stapel scheitert: einzeln wiederholen, Fehlschläge bleiben None
+            outputs = []
+            for text in texts:
+                try:
+                    outputs.append(llm(text, **generate_kwargs))
+                except Exception:
+                    outputs.append(None)
+        for i, output in zip(batch, outputs):
+            if output:
+                # Pipelines liefern je Prompt eine Liste von Dicts (oder ein Dict)
+                first = output[0] if isinstance(output, list) else output
+                results[i] = first["generated_text"].strip()
+        done += len(batch)
+        if progress is not None:
+            progress(done, len(prompts))
+    return results
+
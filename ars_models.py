@@ -0,0 +1,55 @@
+import threading
+
+# Gemeinsame Modell-Registry: Encoder und LLM werden erst bei der ersten
+# Verwendung geladen und danach von allen Apps im Prozess geteilt.
+
+DEFAULT_ENCODER = "all-MiniLM-L6-v2"
+MULTILINGUAL_ENCODER = "paraphrase-multilingual-mpnet-base-v2"
+DEFAULT_LLM = "google/flan-t5-base"
+
+_models = {}
+_locks = {}
+_registry_lock = threading.Lock()
+
+
+def _key_lock(key):
+    with _registry_lock:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def _get(key, factory):
+    model = _models.get(key)
+    if model is not None:
+        return model
+    # Pro Modell ein eigenes Lock: Encoder laden blockiert das LLM nicht
+    with _key_lock(key):
+        model = _models.get(key)
+        if model is None:
+            model = factory()
+            _models[key] = model
+    return model
+
+
+def get_encoder(name=DEFAULT_ENCODER):
+    def load():
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(name)
+    return _get(("encoder", name), load)
+
+
+def get_llm(model=DEFAULT_LLM, task="text2text-generation"):
+    def load():
+        from transformers import pipeline
+        return pipeline(task, model=model)
+    return _get(("llm", task, model), load)
+
+
+def is_loaded(kind, *names):
+    return (kind, *names) in _models
+
+
+def unload(kind=None):
+    with _registry_lock:
+        for key in list(_models):
+            if kind is None or key[0] == kind:
+                del _models[key]
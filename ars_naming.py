@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import asyncio
+import email.utils
+import urllib.error
+import urllib.request
+import numpy as np
+
+from ars_cache import MeaningCache, normalize_utterance
+
+# Benennung von Clustern. Lokal und deterministisch über klassenbasiertes
+# TF-IDF (c-TF-IDF): alle Äußerungen eines Clusters bilden ein Dokument, die
+# am stärksten gewichteten Begriffe ergeben den Namen. Optional fragt ein
+# entfernter Dienst (OpenAI-kompatibles Chat-API) nach knappen Namen –
+# nebenläufig, mit begrenzter Parallelität, Wiederholungen und einem
+# persistenten Cache nach Beispieläußerungen des Clusters.
+
+NOISE_NAME = "Sonstiges"
+
+NAME_PROMPT = "Gib eine knappe Kategorienbezeichnung (1–2 Wörter) für folgende Aussagen:\n{samples}"
+
+# Häufige deutsche Funktionswörter, die als Clustername nichts aussagen
+GERMAN_STOP_WORDS = frozenset("""
+aber alle als also am an auch auf aus bei bin bis bist da dann das dass dem den
+der des die dies diese dieser doch du ein eine einem einen einer eines er es
+für hab habe hat hier ich ihr im in ist ja jetzt kann mal man mein mit mir
+nach nicht noch nur ob oder schon sein sich sie sind so und uns von vor war
+was wie wir wird wo zu zum zur
+""".split())
+
+# HTTP-Status, bei denen eine Wiederholung sinnvoll ist
+RETRY_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+
+# Persistenter Namens-Cache (SQLite); Pfad über ARS_NAME_CACHE änderbar
+NAME_CACHE_PATH = os.environ.get(
+    "ARS_NAME_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "ars", "names.sqlite"))
+
+
+def group_texts(texts, labels):
+    # Label -> Indizes der Äußerungen, Reihenfolge des ersten Auftretens
+    groups = {}
+    for i, label in enumerate(labels):
+        groups.setdefault(label, []).append(i)
+    return groups
+
+
+def ctfidf_terms(texts, labels, top_n=3, stop_words=GERMAN_STOP_WORDS):
+    # Label -> die top_n Begriffe mit dem höchsten c-TF-IDF-Gewicht
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    groups = group_texts(texts, labels)
+    classes = [label for label in groups if label != -1]
+    if not classes:
+        return {}
+    documents = [" ".join(texts[i] for i in groups[label]) for label in classes]
+    vectorizer = TfidfVectorizer(stop_words=list(stop_words), token_pattern=r"(?u)\b[^\W\d_]{2,}\b",
+                                 sublinear_tf=True)
+    try:
+        scores = vectorizer.fit_transform(documents).toarray()
+    except ValueError:
+        # Nur Stoppwörter/Zahlen in allen Clustern
+        return {label: [] for label in classes}
+    vocabulary = vectorizer.get_feature_names_out()
+    # Stabil sortiert: bei gleichem Gewicht entscheidet die Begriffsreihenfolge
+    order = np.argsort(-scores, axis=1, kind="stable")[:, :top_n]
+    return {label: [vocabulary[j] for j in row if scores[k, j] > 0]
+            for k, (label, row) in enumerate(zip(classes, order))}
+
+
+def local_names(texts, labels, top_n=2):
+    names = {label: " / ".join(terms) or f"Cluster {label}"
+             for label, terms in ctfidf_terms(texts, labels, top_n=top_n).items()}
+    if any(label == -1 for label in labels):
+        names[-1] = NOISE_NAME
+    return names
+
+
+def select_exemplars(texts, labels, embeddings=None, k=5):
+    # Label -> k typische Äußerungen: am nächsten am Clusterzentrum, ohne
+    # Embeddings die häufigsten; deterministisch (Gleichstand: erste zuerst)
+    exemplars = {}
+    for label, idx in group_texts(texts, labels).items():
+        idx = np.asarray(idx)
+        if embeddings is not None:
+            vectors = np.asarray(embeddings)[idx]
+            distance = np.linalg.norm(vectors - vectors.mean(axis=0), axis=1)
+            ranked = idx[np.argsort(distance, kind="stable")]
+        else:
+            counts = {}
+            for i in idx:
+                counts.setdefault(normalize_utterance(texts[i]), []).append(i)
+            ranked = [group[0] for group in sorted(counts.values(), key=lambda g: (-len(g), g[0]))]
+        chosen = []
+        for i in ranked:
+            text = texts[i]
+            if text not in chosen:
+                chosen.append(text)
+            if len(chosen) == k:
+                break
+        exemplars[label] = chosen
+    return exemplars
+
+
+class RemoteNamer:
+    """Clusternamen von einem OpenAI-kompatiblen Chat-Endpunkt.
+
+    Anfragen laufen nebenläufig (höchstens concurrency gleichzeitig) und
+    werden bei Fehlern mit wachsender Wartezeit wiederholt. Ergebnisse
+    landen im Namens-Cache, Schlüssel sind Modell, Prompt und die sortierten
+    Beispieläußerungen; base_url kann auf einen lokalen Server zeigen.
+    """
+
+    def __init__(self, api_key=None, model="gpt-4", base_url=None, concurrency=4, retries=3,
+                 backoff=0.5, timeout=30.0, max_wait=60.0, cache_path=NAME_CACHE_PATH):
+        self.api_key = api_key or os.environ.get("OPENAI_API_KEY", "")
+        self.model = model
+        self.base_url = (base_url or os.environ.get("ARS_NAMER_URL", "https://api.openai.com/v1")).rstrip("/")
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.max_wait = max_wait
+        self.cache = MeaningCache(cache_path, model, NAME_PROMPT) if cache_path else None
+        self.requests = 0
+        self.failures = 0
+
+    def prompt(self, exemplars):
+        return NAME_PROMPT.format(samples="\n".join(f"- {s}" for s in exemplars))
+
+    def _request(self, prompt):
+        body = json.dumps({
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.3,
+        }).encode("utf-8")
+        request = urllib.request.Request(
+            f"{self.base_url}/chat/completions", data=body,
+            headers={"Content-Type": "application/json", "Authorization": f"Bearer {self.api_key}"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            data = json.load(response)
+        return data["choices"][0]["message"]["content"].strip()
+
+    def retry_delay(self, attempt, retry_after=None):
+        # Exponentiell wachsend; ein Retry-After des Servers (Sekunden oder
+        # HTTP-Datum) hat Vorrang, begrenzt auf max_wait
+        delay = self.backoff * 2 ** attempt
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                try:
+                    delay = max(delay, email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time())
+                except (TypeError, ValueError):
+                    pass
+        return min(delay, self.max_wait)
+
+    async def _name_one(self, semaphore, exemplars):
+        prompt = self.prompt(exemplars)
+        async with semaphore:
+            for attempt in range(self.retries + 1):
+                self.requests += 1
+                try:
+                    # urllib blockiert; im Thread-Pool laufen mehrere Anfragen gleichzeitig
+                    return await asyncio.to_thread(self._request, prompt)
+                except urllib.error.HTTPError as e:
+                    # z. B. 401: Wiederholen hilft nicht
+                    if e.code not in RETRY_STATUS or attempt == self.retries:
+                        break
+                    retry_after = e.headers.get("Retry-After") if e.headers is not None else None
+                    await asyncio.sleep(self.retry_delay(attempt, retry_after))
+                except (OSError, ValueError, KeyError, IndexError):
+                    if attempt == self.retries:
+                        break
+                    await asyncio.sleep(self.retry_delay(attempt))
+        self.failures += 1
+        return None
+
+    async def _name_all(self, groups):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        labels = list(groups)
+        names = await asyncio.gather(*(self._name_one(semaphore, groups[label]) for label in labels))
+        return dict(zip(labels, names))
+
+    def name(self, groups):
+        # groups: Label -> Beispieläußerungen; Ergebnis: Label -> Name (None bei Fehlschlag)
+        keys = {}
+        names = {}
+        if self.cache is not None:
+            keys = {label: self.cache.key("\n".join(sorted(samples))) for label, samples in groups.items()}
+            cached = self.cache.get_many(list(keys.values()))
+            names = {label: name for label, name in zip(keys, cached) if name is not None}
+        todo = {label: samples for label, samples in groups.items() if label not in names}
+        if todo:
+            fetched = asyncio.run(self._name_all(todo))
+            if self.cache is not None:
+                self.cache.put_many((keys[label], name) for label, name in fetched.items() if name)
+            names.update(fetched)
+        return names
+
+    def stats(self):
+        stats = {"requests": self.requests, "failures": self.failures}
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
+        return stats
+
+
+def name_clusters(texts, labels, embeddings=None, remote=None, k=5, known=()):
+    # Label -> Name. Lokale c-TF-IDF-Namen immer; mit remote (RemoteNamer)
+    # ersetzen dessen Namen die lokalen, wo die Anfrage gelingt. Für Labels
+    # in known (bereits benannt) wird nichts angefragt.
+    names = local_names(texts, labels)
+    if remote is not None:
+        groups = {label: samples for label, samples in select_exemplars(texts, labels, embeddings, k).items()
+                  if label != -1 and label not in known}
+        if groups:
+            for label, name in remote.name(groups).items():
+                if name:
+                    names[label] = name
+    return names
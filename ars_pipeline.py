@@ -0,0 +1,330 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+from array import array
+import numpy as np
+
+from ars_core import (MODEL_NAME, iter_transcripts, embed_utterances, cluster_embeddings,
+                      build_pcfg)
+from ars_grammar import Grammar, SymbolTable, TransitionModel
+from ars_jobs import JobCancelled
+
+# process_multiple_dialogs als Folge expliziter Stufen:
+#   read -> embed -> cluster -> grammar
+# Jede Stufe hat einen Schlüssel aus dem Schlüssel ihrer Eingabe und ihren
+# Parametern (read: Inhalt der Dateien). Ergebnisse liegen als .npy-Dateien
+# im StageStore; eine Stufe wird nur berechnet, wenn ihr Schlüssel fehlt.
+# Ändert sich z. B. min_cluster_size, laufen nur cluster und grammar neu.
+# Die Einbettung schreibt nach jedem Stapel einen Zwischenstand; nach einem
+# Absturz oder Abbruch setzt der nächste Lauf dort fort.
+
+STAGES = ("read", "embed", "cluster", "grammar")
+
+# Bei Änderungen an einer Stufe erhöhen: alte Einträge gelten dann nicht mehr
+STAGE_VERSIONS = {"read": 2, "embed": 1, "cluster": 1, "grammar": 1}
+
+# Standard-Ablage für process_multiple_dialogs, wenn kein store übergeben wird
+STAGE_STORE_PATH = os.environ.get("ARS_STAGE_STORE")
+
+CACHED, COMPUTED, RESUMED = "cached", "computed", "resumed"
+
+
+def _digest(*parts):
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode("utf-8"))
+
+
+def files_key(file_paths):
+    # Inhalt statt Pfad/mtime: kopierte oder neu gespeicherte Dateien bleiben gültig
+    digest = _digest("read", STAGE_VERSIONS["read"])
+    for path in file_paths:
+        # Stückweise hashen: große Transkripte nie ganz im Speicher
+        file_digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                file_digest.update(chunk)
+        digest.update(file_digest.digest())
+    return digest.hexdigest()[:20]
+
+
+def stage_key(stage, parent, **params):
+    return _digest(stage, STAGE_VERSIONS[stage], parent, params).hexdigest()[:20]
+
+
+def labels_key(labels):
+    labels = np.ascontiguousarray(labels)
+    digest = _digest("grammar", STAGE_VERSIONS["grammar"], str(labels.dtype), labels.shape)
+    digest.update(labels.tobytes())
+    return digest.hexdigest()[:20]
+
+
+class StageStore:
+    """Ablage für Stufenergebnisse: <directory>/<stage>/<key>/*.npy + meta.json.
+
+    Ein Eintrag wird in einem .partial-Verzeichnis geschrieben und erst
+    vollständig umbenannt; unvollständige Einträge gelten nie als fertig.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, stage, key):
+        return os.path.join(self.directory, stage, key)
+
+    def has(self, stage, key):
+        return os.path.exists(os.path.join(self.path(stage, key), "meta.json"))
+
+    def partial(self, stage, key):
+        # Arbeitsverzeichnis einer Stufe; bleibt nach Abbruch für die Fortsetzung liegen
+        path = self.path(stage, key) + ".partial"
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def commit(self, stage, key, arrays=None, meta=None):
+        work = self.partial(stage, key)
+        for name, array in (arrays or {}).items():
+            np.save(os.path.join(work, f"{name}.npy"), np.asarray(array), allow_pickle=False)
+        with open(os.path.join(work, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"stage": stage, "key": key, "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       **(meta or {})}, f, indent=2)
+        final = self.path(stage, key)
+        if os.path.exists(final):
+            # Paralleler Lauf war schneller; gleicher Schlüssel, gleicher Inhalt
+            shutil.rmtree(work, ignore_errors=True)
+        else:
+            os.replace(work, final)
+
+    def load(self, stage, key, mmap=True):
+        path = self.path(stage, key)
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        arrays = {name[:-4]: np.load(os.path.join(path, name), mmap_mode="r" if mmap else None,
+                                     allow_pickle=False)
+                  for name in os.listdir(path) if name.endswith(".npy")}
+        return arrays, meta
+
+    def entries(self, stage=None):
+        stages = [stage] if stage else STAGES
+        return {s: sorted(k for k in os.listdir(os.path.join(self.directory, s)) if not k.endswith(".partial"))
+                for s in stages if os.path.isdir(os.path.join(self.directory, s))}
+
+    def clear(self, stage=None):
+        for s in ([stage] if stage else STAGES):
+            shutil.rmtree(os.path.join(self.directory, s), ignore_errors=True)
+
+
+def open_store(store):
+    if store is None or isinstance(store, StageStore):
+        return store
+    return StageStore(store)
+
+
+# --- Stufen ---
+
+class StoredStrings:
+    """Äußerungen der read-Stufe als Sequenz über Text-Blob und Offsets (Memmaps).
+
+    Dekodiert nur die angefragten Einträge; Slices liefern Listen, so dass
+    die Einbettung stapelweise liest, ohne den Korpus als Liste zu halten.
+    """
+
+    batch_size = 4096
+
+    def __init__(self, text, offsets):
+        self.text = text
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _decode(self, start, stop):
+        bounds = np.asarray(self.offsets[start:stop + 1]).tolist()
+        if not bounds:
+            return []
+        raw = np.asarray(self.text[bounds[0]:bounds[-1]]).tobytes()
+        base = bounds[0]
+        return [raw[a - base:b - base].decode("utf-8") for a, b in zip(bounds[:-1], bounds[1:])]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return self._decode(start, max(start, stop))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self._decode(index, index + 1)[0]
+
+    def __iter__(self):
+        for start in range(0, len(self), self.batch_size):
+            yield from self._decode(start, min(start + self.batch_size, len(self)))
+
+
+def _stored_strings(arrays):
+    return StoredStrings(arrays["utterances_text"], arrays["utterances_offsets"])
+
+
+def read_stage(store, file_paths, chunk_size=1 << 20):
+    key = files_key(file_paths)
+    if store.has("read", key):
+        arrays, _ = store.load("read", key)
+        return key, _stored_strings(arrays), np.asarray(arrays["file_ids"]), np.asarray(arrays["line_numbers"]), CACHED
+    # Text direkt in eine Rohdatei streamen; im Speicher bleiben nur Offsets
+    # und Positionen (Zahlen je Äußerung)
+    work = store.partial("read", key)
+    raw_path = os.path.join(work, "utterances_text.raw")
+    offsets, file_ids, line_numbers = array("q", [0]), array("i"), array("i")
+    with open(raw_path, "wb") as raw:
+        for utterance, file_id, line_no in iter_transcripts(file_paths):
+            encoded = utterance.encode("utf-8")
+            raw.write(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+            file_ids.append(file_id)
+            line_numbers.append(line_no)
+    # Rohdatei stückweise in die .npy-Datei des Eintrags kopieren
+    text = np.lib.format.open_memmap(os.path.join(work, "utterances_text.npy"), mode="w+",
+                                     dtype=np.uint8, shape=(offsets[-1],))
+    with open(raw_path, "rb") as raw:
+        for start in range(0, offsets[-1], chunk_size):
+            chunk = raw.read(chunk_size)
+            text[start:start + len(chunk)] = np.frombuffer(chunk, dtype=np.uint8)
+    text.flush()
+    del text
+    os.remove(raw_path)
+    store.commit("read", key, {"utterances_offsets": np.frombuffer(offsets, dtype=np.int64),
+                               "file_ids": np.frombuffer(file_ids, dtype=np.int32),
+                               "line_numbers": np.frombuffer(line_numbers, dtype=np.int32)},
+                 {"files": [os.path.basename(str(f)) for f in file_paths], "utterances": len(file_ids)})
+    arrays, _ = store.load("read", key)
+    return key, _stored_strings(arrays), np.asarray(arrays["file_ids"]), np.asarray(arrays["line_numbers"]), COMPUTED
+
+
+def embed_stage(store, parent, utterances, batch_size=1024, cache=None, progress=None, cancel=None):
+    key = stage_key("embed", parent, model=MODEL_NAME)
+    total = len(utterances)
+    if store.has("embed", key):
+        if progress is not None:
+            progress(total, total)
+        arrays, _ = store.load("embed", key)
+        return key, arrays["embeddings"], CACHED
+    work = store.partial("embed", key)
+    data_path = os.path.join(work, "embeddings.npy")
+    state_path = os.path.join(work, "state.json")
+    done = 0
+    embeddings = None
+    if os.path.exists(state_path) and os.path.exists(data_path):
+        # Zwischenstand eines abgebrochenen Laufs: fertige Zeilen übernehmen
+        with open(state_path, "r", encoding="utf-8") as f:
+            done = json.load(f)["rows"]
+        embeddings = np.lib.format.open_memmap(data_path, mode="r+")
+    status = RESUMED if done else COMPUTED
+    if done and progress is not None:
+        progress(done, total)
+    for start in range(done, total, batch_size):
+        if cancel is not None and cancel.is_set():
+            raise JobCancelled("embed")
+        batch = utterances[start:start + batch_size]
+        vectors = np.asarray(embed_utterances(batch, cache=cache), dtype=np.float32)
+        if embeddings is None:
+            embeddings = np.lib.format.open_memmap(data_path, mode="w+", dtype=np.float32,
+                                                   shape=(total, vectors.shape[1]))
+        embeddings[start:start + len(batch)] = vectors
+        embeddings.flush()
+        # Erst die Daten, dann der Zähler: state.json zeigt nie auf ungeschriebene Zeilen
+        with open(state_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"rows": start + len(batch)}, f)
+        os.replace(state_path + ".tmp", state_path)
+        if progress is not None:
+            progress(start + len(batch), total)
+    if embeddings is None:
+        embeddings = np.zeros((0, 0), dtype=np.float32)
+        np.save(data_path, embeddings)
+    del embeddings
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    store.commit("embed", key, meta={"model": MODEL_NAME, "rows": total})
+    arrays, _ = store.load("embed", key)
+    return key, arrays["embeddings"], status
+
+
+def cluster_stage(store, parent, embeddings, method=None, min_cluster_size=3, reduce=None,
+                  n_components=20, reduction_dir=None):
+    method = method or os.environ.get("ARS_CLUSTER_METHOD", "hdbscan")
+    key = stage_key("cluster", parent, method=method, min_cluster_size=min_cluster_size,
+                    reduce=reduce, n_components=n_components if reduce else None)
+    projection = None
+    if reduce:
+        # Projektion hat ihren eigenen Inhalts-Cache (ars_reduce); bei geänderten
+        # Clustering-Parametern wird sie nur geladen, nicht neu angepasst
+        from ars_reduce import reduce_embeddings
+        projection = reduce_embeddings(embeddings, method=reduce, n_components=n_components,
+                                       cache_dir=reduction_dir or os.path.join(store.directory, "projection"))
+    if store.has("cluster", key):
+        arrays, _ = store.load("cluster", key, mmap=False)
+        return key, arrays["labels"], projection, CACHED
+    features = projection.coords if projection is not None else embeddings
+    labels = np.asarray(cluster_embeddings(features, method=method, min_cluster_size=min_cluster_size))
+    store.commit("cluster", key, {"labels": labels},
+                 {"method": method, "min_cluster_size": min_cluster_size, "reduce": reduce})
+    return key, labels, projection, COMPUTED
+
+
+def grammar_stage(store, labels):
+    # Schlüssel aus den Labels selbst: gleiche Labels (auch nach anderem
+    # Clustering oder über ein Kategorienmodell) ergeben dieselben Zählungen
+    from scipy.sparse import csr_matrix
+    key = labels_key(labels)
+    if store.has("grammar", key):
+        arrays, _ = store.load("grammar", key, mmap=False)
+        symbols = arrays["symbols"].tolist()
+        n = len(symbols)
+        counts = csr_matrix((arrays["counts"], (arrays["rows"], arrays["cols"])), shape=(n, n))
+        model = TransitionModel.from_grammar(Grammar(counts, SymbolTable(symbols)))
+        terminal_chain = model.table.decode(model.intern(labels)[:-1])
+        return key, model.to_grammar().normalize(), terminal_chain, model, CACHED
+    model = TransitionModel()
+    pcfg, terminal_chain = build_pcfg(labels, None, model=model)
+    coo = model.to_grammar().matrix.tocoo()
+    store.commit("grammar", key, {"symbols": np.asarray(model.symbols), "rows": coo.row, "cols": coo.col,
+                                  "counts": np.rint(coo.data).astype(np.int64)},
+                 {"symbols": len(model.symbols)})
+    return key, pcfg, terminal_chain, model, COMPUTED
+
+
+def run_pipeline(file_paths, store, cache=None, batch_size=1024, cluster_method=None, min_cluster_size=3,
+                 category_model=None, reduce=None, n_components=20, reduction_dir=None,
+                 progress=None, cancel=None):
+    # Wie process_multiple_dialogs, Ergebnis zusätzlich mit "stages":
+    # {Stufe: "cached" | "computed" | "resumed"} und "keys"
+    store = open_store(store)
+    file_paths = list(file_paths)
+    stages, keys = {}, {}
+    keys["read"], utterances, file_ids, line_numbers, stages["read"] = read_stage(store, file_paths)
+    keys["embed"], embeddings, stages["embed"] = embed_stage(
+        store, keys["read"], utterances, batch_size=batch_size, cache=cache, progress=progress, cancel=cancel)
+    keys["cluster"], labels, projection, stages["cluster"] = cluster_stage(
+        store, keys["embed"], embeddings, method=cluster_method, min_cluster_size=min_cluster_size,
+        reduce=reduce, n_components=n_components, reduction_dir=reduction_dir)
+    if category_model is not None:
+        # Kategorienmodell hat Zustand und läuft daher immer; die Grammatik-Stufe
+        # bleibt trotzdem gültig, solange die Kategorie-IDs gleich bleiben
+        labels = category_model.update(embeddings, labels)
+    keys["grammar"], pcfg, terminal_chain, transition_model, stages["grammar"] = grammar_stage(store, labels)
+    return {
+        "utterances": utterances,
+        "embeddings": embeddings,
+        "labels": labels,
+        "pcfg": pcfg,
+        "terminal_chain": terminal_chain,
+        "transition_model": transition_model,
+        "projection": projection,
+        "files": file_paths,
+        "file_ids": file_ids,
+        "line_numbers": line_numbers,
+        "stages": stages,
+        "keys": keys,
+    }
@@ -0,0 +1,140 @@
+import os
+import json
+import pickle
+import hashlib
+from collections import OrderedDict
+import numpy as np
+
+# Optionale Dimensionsreduktion zwischen Embedding und Clustering. Die
+# angepasste Transformation und die projizierten Koordinaten werden nach
+# Inhalt der Embeddings zwischengespeichert (im Prozess und optional auf
+# Platte) und sowohl fürs Clustering als auch für die 2D-Darstellung benutzt.
+
+REDUCERS = ("pca", "umap")
+
+# Zuletzt benutzte Projektionen im Prozess (UMAP-Modelle können groß sein;
+# im Streamlit-Server teilen sich alle Sitzungen diesen Speicher)
+MAX_PROJECTIONS = 8
+
+_projections = OrderedDict()
+
+
+def projection_key(embeddings, method, n_components, seed, chunk_rows=4096):
+    # Stückweise hashen: keine Kopie der ganzen (evtl. gemappten) Matrix
+    embeddings = np.asarray(embeddings)
+    digest = hashlib.sha1(f"{method}\0{n_components}\0{seed}\0{embeddings.shape}".encode("utf-8"))
+    for start in range(0, len(embeddings), chunk_rows):
+        chunk = np.ascontiguousarray(embeddings[start:start + chunk_rows], dtype=np.float32)
+        digest.update(chunk.tobytes())
+    return digest.hexdigest()[:20]
+
+
+class Projection:
+    """Angepasste Reduktion samt projizierten Koordinaten.
+
+    PCA wird als Mittelwert + Komponenten gespeichert (kein sklearn nötig
+    für transform), UMAP als gepickeltes Modell.
+    """
+
+    def __init__(self, method, n_components, seed, coords, model=None, mean=None, components=None, key=None):
+        self.method = method
+        self.n_components = n_components
+        self.seed = seed
+        self.coords = coords
+        self.model = model
+        self.mean = mean
+        self.components = components
+        self.key = key
+        self._coords_2d = None
+
+    def transform(self, embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if self.method == "pca":
+            return (embeddings - self.mean) @ self.components.T
+        return self.model.transform(embeddings).astype(np.float32)
+
+    def coords_2d(self):
+        # 2D-Koordinaten für die Darstellung; bei UMAP mit mehr als zwei
+        # Komponenten ein zweiter, kleiner UMAP-Lauf auf den reduzierten Daten
+        if self._coords_2d is None:
+            if self.method == "pca" or self.n_components <= 2:
+                self._coords_2d = self.coords[:, :2]
+            else:
+                import umap
+                self._coords_2d = umap.UMAP(n_components=2, random_state=self.seed).fit_transform(self.coords)
+        return self._coords_2d
+
+    # --- Persistenz ---
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        arrays = {"coords": self.coords}
+        if self._coords_2d is not None:
+            arrays["coords_2d"] = self._coords_2d
+        if self.method == "pca":
+            arrays["mean"] = self.mean
+            arrays["components"] = self.components
+        else:
+            with open(os.path.join(directory, "model.pkl"), "wb") as f:
+                pickle.dump(self.model, f)
+        np.savez(os.path.join(directory, "projection.npz"), **arrays)
+        meta = {"method": self.method, "n_components": self.n_components, "seed": self.seed, "key": self.key}
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with np.load(os.path.join(directory, "projection.npz")) as data:
+            arrays = {name: data[name] for name in data.files}
+        model = None
+        if meta["method"] != "pca":
+            with open(os.path.join(directory, "model.pkl"), "rb") as f:
+                model = pickle.load(f)
+        projection = cls(meta["method"], meta["n_components"], meta["seed"], arrays["coords"], model=model,
+                         mean=arrays.get("mean"), components=arrays.get("components"), key=meta.get("key"))
+        projection._coords_2d = arrays.get("coords_2d")
+        return projection
+
+
+def fit_projection(embeddings, method="pca", n_components=20, seed=42):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    n_components = min(n_components, *embeddings.shape)
+    if method == "pca":
+        from sklearn.decomposition import PCA
+        pca = PCA(n_components=n_components, svd_solver="randomized", random_state=seed)
+        pca.fit(embeddings)
+        projection = Projection(method, n_components, seed, None,
+                                mean=pca.mean_.astype(np.float32), components=pca.components_.astype(np.float32))
+        # Koordinaten über dieselbe Abbildung wie transform (randomisierte
+        # SVD liefert in fit_transform leicht abweichende Werte)
+        projection.coords = projection.transform(embeddings)
+        return projection
+    if method == "umap":
+        import umap
+        reducer = umap.UMAP(n_components=n_components, random_state=seed, metric="cosine")
+        coords = reducer.fit_transform(embeddings).astype(np.float32)
+        return Projection(method, n_components, seed, coords, model=reducer)
+    raise ValueError(f"Unbekanntes Reduktionsverfahren: {method} (erlaubt: {', '.join(REDUCERS)})")
+
+
+def reduce_embeddings(embeddings, method="pca", n_components=20, seed=42, cache_dir=None):
+    # Liefert eine Projection; gleiche Embeddings + Parameter werden nur einmal angepasst
+    key = projection_key(embeddings, method, n_components, seed)
+    projection = _projections.get(key)
+    if projection is not None:
+        _projections.move_to_end(key)
+        return projection
+    directory = os.path.join(cache_dir, key) if cache_dir else None
+    if directory and os.path.exists(os.path.join(directory, "meta.json")):
+        projection = Projection.load(directory)
+    else:
+        projection = fit_projection(embeddings, method, n_components, seed)
+        projection.key = key
+        if directory:
+            projection.save(directory)
+    _projections[key] = projection
+    while len(_projections) > MAX_PROJECTIONS:
+        _projections.popitem(last=False)
+    return projection
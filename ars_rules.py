@@ -0,0 +1,154 @@
+import os
+import re
+import json
+from collections import Counter
+import numpy as np
+
+# Regelbasierte Vorklassifikation von Äußerungen. Die Schlüsselwort-Tabelle
+# wird in einen einzigen regulären Ausdruck mit Wortgrenzen übersetzt; ganze
+# Listen von Äußerungen werden in einem Durchlauf über den verketteten Text
+# klassifiziert. Bei mehreren Treffern gewinnt die erste Kategorie der Tabelle;
+# Treffer dürfen sich dabei überlappen ("ein kilo" verdeckt "kilo" nicht).
+
+DEFAULT_RULES = {
+    'order': ['bitte', 'nehme', 'hätte', 'kaufen', 'gramm', 'kilo'],
+    'question': ['?', 'wie', 'was', 'wo'],
+    'confirmation': ['ja', 'okay', 'genau', 'richtig'],
+    'greeting': ['guten tag', 'hallo', 'guten morgen'],
+    'thanks': ['danke', 'vielen dank', 'dankeschön'],
+}
+
+
+def load_rules(path):
+    # JSON oder YAML: {Kategorie: [Schlüsselwort, ...]}, Reihenfolge = Priorität
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+SEPARATOR = "\n"
+
+
+def _boundary(keyword):
+    # Wortgrenzen nur an Enden aus Wortzeichen ("?" bleibt frei). Die linke
+    # Grenze wird nach dem Treffer geprüft, damit der Ausdruck mit einem
+    # Literal beginnt und re schnell zu möglichen Anfangszeichen springen kann.
+    suffix = ""
+    if re.match(r"\w", keyword):
+        suffix += r"(?<!\w.{%d})" % len(keyword)
+    if re.search(r"\w$", keyword):
+        suffix += r"(?!\w)"
+    return suffix
+
+
+def _trie_pattern(keywords):
+    # Schlüsselwörter als Präfixbaum-Regex ("danke(?:schön|)"): pro Position
+    # wird nur ein Zweig verfolgt, längere Schlüsselwörter haben Vorrang
+    trie = {}
+    for kw in keywords:
+        node = trie
+        for ch in kw:
+            node = node.setdefault(ch, {})
+        node[""] = kw
+
+    def emit(node):
+        branches = [re.escape(ch) + emit(child) for ch, child in sorted(node.items()) if ch]
+        if "" in node:
+            branches.append(_boundary(node[""]))
+        return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+
+    return emit(trie)
+
+
+def _overlapping_pattern(keywords):
+    # Ein Treffer je Anfangsposition statt nicht überlappender Treffer: nur
+    # das erste Zeichen wird verbraucht, das Schlüsselwort selbst per Lookahead
+    # (in einem Lookbehind der Breite 1) erfasst. Die Zeichenklasse am Anfang
+    # lässt re weiterhin direkt zu möglichen Anfangszeichen springen.
+    first = "".join(sorted({kw[0] for kw in keywords}))
+    return re.compile("[" + re.escape(first) + "](?<=(?=(" + _trie_pattern(keywords) + ")).)", re.S)
+
+
+class KeywordClassifier:
+    def __init__(self, rules=None, max_chars=100):
+        self.rules = {c: [kw.strip().lower() for kw in kws if kw.strip()] for c, kws in (rules or DEFAULT_RULES).items()}
+        self.categories = list(self.rules)
+        self.max_chars = max_chars
+        # Schlüsselwort -> Priorität (Index der ersten Kategorie, die es nennt)
+        self._priority = {}
+        for rank, category in enumerate(self.categories):
+            for kw in self.rules[category]:
+                self._priority.setdefault(kw, rank)
+        self._keywords = list(self._priority)
+        self._code_priority = np.array([self._effective_priority(kw) for kw in self._keywords], dtype=np.int64)
+        self._codes = {kw: i for i, kw in enumerate(self._keywords)}
+        self._codes[SEPARATOR] = -1
+        self.pattern = _overlapping_pattern(self._keywords + [SEPARATOR]) if self._keywords else None
+        self._labels = np.array([c.upper() for c in self.categories] + [None], dtype=object)
+        self.keyword_counts = Counter()
+        self.category_counts = Counter()
+
+    def _effective_priority(self, keyword):
+        # Kürzere Schlüsselwörter, die an derselben Stelle ebenfalls treffen
+        # ("guten" in "guten tag"), werden vom längsten verdeckt; ihre
+        # Priorität gilt deshalb für das längere mit
+        rank = self._priority[keyword]
+        for other, other_rank in self._priority.items():
+            if other_rank < rank and len(other) < len(keyword) and keyword.startswith(other):
+                if re.match(re.escape(other) + _boundary(other), keyword):
+                    rank = other_rank
+        return rank
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        return cls(load_rules(path), **kwargs)
+
+    def label(self, rank):
+        return self.categories[rank].upper() if rank >= 0 else None
+
+    def classify_ids(self, utterances):
+        # Kategorie-Index je Äußerung (-1 ohne Treffer), ein Regex-Lauf für alle
+        ranks = np.full(len(utterances), len(self.categories), dtype=np.int64)
+        if self.pattern is None or not len(utterances):
+            return np.full(len(utterances), -1, dtype=np.int64)
+        parts = [u[:self.max_chars] for u in utterances]
+        text = SEPARATOR.join(parts)
+        if text.count(SEPARATOR) != len(parts) - 1:
+            # Zeilenumbrüche innerhalb einer Äußerung wie Leerzeichen behandeln
+            text = SEPARATOR.join(p.replace(SEPARATOR, " ") for p in parts)
+        # Trennzeichen werden mitgefunden; ihre laufende Zahl ist die Zeilennummer
+        found = self.pattern.findall(text.lower())
+        codes = np.fromiter(map(self._codes.__getitem__, found), dtype=np.int64, count=len(found))
+        is_separator = codes < 0
+        rows = np.cumsum(is_separator)[~is_separator]
+        codes = codes[~is_separator]
+        if len(codes):
+            np.minimum.at(ranks, rows, self._code_priority[codes])
+            counts = np.bincount(codes, minlength=len(self._keywords))
+            self.keyword_counts.update({kw: int(n) for kw, n in zip(self._keywords, counts) if n})
+        hits = np.bincount(ranks, minlength=len(self.categories) + 1)[:-1]
+        self.category_counts.update({c: int(n) for c, n in zip(self.categories, hits) if n})
+        ranks[ranks == len(self.categories)] = -1
+        return ranks
+
+    def classify(self, utterances):
+        return self._labels[self.classify_ids(utterances)].tolist()
+
+    def classify_one(self, utterance):
+        return self.classify([utterance])[0]
+
+    def reset_stats(self):
+        self.keyword_counts.clear()
+        self.category_counts.clear()
+
+    def stats(self):
+        # Treffer je Schlüsselwort und je zugewiesener Kategorie seit Erzeugung
+        return {"keywords": dict(self.keyword_counts), "categories": dict(self.category_counts)}
+
+
+def get_classifier(path=None):
+    # Regeltabelle aus path bzw. ARS_RULES, sonst die eingebaute Tabelle
+    path = path or os.environ.get("ARS_RULES")
+    return KeywordClassifier.from_file(path) if path else KeywordClassifier()
@@ -0,0 +1,180 @@
+import time
+import numpy as np
+
+from ars_grammar import Grammar, SymbolTable
+
+# Kompilierter Sampler für Übergangsgrammatiken: die PCFG wird einmal in
+# Indexarrays mit Alias-Tabellen pro Zustand übersetzt; danach werden viele
+# Ketten gleichzeitig (vektorisiert über die Ketten) erzeugt.
+
+
+def build_alias_table(probs):
+    # Vose-Alias-Methode: O(k) Aufbau, O(1) Ziehen
+    k = len(probs)
+    scaled = np.asarray(probs, dtype=np.float64) * k / np.sum(probs)
+    prob = np.ones(k, dtype=np.float64)
+    alias = np.arange(k, dtype=np.int32)
+    small = [i for i in range(k) if scaled[i] < 1.0]
+    large = [i for i in range(k) if scaled[i] >= 1.0]
+    while small and large:
+        s = small.pop()
+        l = large.pop()
+        prob[s] = scaled[s]
+        alias[s] = l
+        scaled[l] = scaled[l] + scaled[s] - 1.0
+        if scaled[l] < 1.0:
+            small.append(l)
+        else:
+            large.append(l)
+    return prob, alias
+
+
+class ChainSampler:
+    """Erzeugt Ketten aus einer PCFG ({src: {dst: p}} oder Grammar).
+
+    state_of bildet ein erzeugtes Symbol auf den Zustand ab, von dem aus
+    weitergezogen wird (z. B. letztes Terminal einer Nonterminal-Expansion);
+    standardmäßig ist das Symbol selbst der nächste Zustand.
+    """
+
+    def __init__(self, pcfg, seed=None, state_of=None):
+        if isinstance(pcfg, Grammar):
+            self._compile_matrix(pcfg)
+        else:
+            self._compile_dict(pcfg)
+        n = len(self.table)
+
+        # Folgezustand je Symbol; -1 wenn das Symbol nicht weiterführt
+        self.next_state = np.arange(n, dtype=np.int64)
+        if state_of is not None:
+            for i, symbol in enumerate(self.table.symbols):
+                self.next_state[i] = self.table.id(state_of(symbol))
+        self.rng = np.random.default_rng(seed)
+
+    def _compile_matrix(self, grammar):
+        # CSR-Zeilen sind bereits die Ausgangsmengen je Zustand
+        m = grammar.matrix
+        self.table = grammar.table
+        n = len(self.table)
+        sizes = np.diff(m.indptr)
+        self.states = np.flatnonzero(sizes).tolist()
+        self.offsets = m.indptr[:-1].astype(np.int64)
+        self.sizes = sizes.astype(np.int64)
+        self.outcomes = m.indices.astype(np.int32)
+        self.prob = np.ones(m.nnz, dtype=np.float64)
+        self.alias = np.arange(m.nnz, dtype=np.int64)
+        for i in self.states:
+            start, end = m.indptr[i], m.indptr[i + 1]
+            if m.data[start:end].sum() <= 0:
+                self.sizes[i] = 0
+                continue
+            prob, alias = build_alias_table(m.data[start:end])
+            self.prob[start:end] = prob
+            self.alias[start:end] = alias + start
+        self.states = [i for i in self.states if self.sizes[i] > 0]
+        if len(self.offsets) < n:
+            pad = n - len(self.offsets)
+            self.offsets = np.concatenate([self.offsets, np.zeros(pad, dtype=np.int64)])
+            self.sizes = np.concatenate([self.sizes, np.zeros(pad, dtype=np.int64)])
+
+    def _compile_dict(self, pcfg):
+        self.table = SymbolTable()
+        self.states = [self.table.add(src) for src in pcfg]
+        for src in pcfg:
+            for dst in pcfg[src]:
+                self.table.add(dst)
+        n = len(self.table)
+
+        self.offsets = np.zeros(n, dtype=np.int64)
+        self.sizes = np.zeros(n, dtype=np.int64)
+        outcomes, probs, aliases = [], [], []
+        pos = 0
+        for src, targets in pcfg.items():
+            weights = np.fromiter(targets.values(), dtype=np.float64, count=len(targets))
+            if not len(targets) or weights.sum() <= 0:
+                continue
+            i = self.table.id(src)
+            prob, alias = build_alias_table(weights)
+            self.offsets[i] = pos
+            self.sizes[i] = len(targets)
+            outcomes.append(self.table.encode(list(targets.keys())))
+            probs.append(prob)
+            aliases.append(alias + pos)
+            pos += len(targets)
+        self.outcomes = np.concatenate(outcomes) if outcomes else np.zeros(0, dtype=np.int32)
+        self.prob = np.concatenate(probs) if probs else np.zeros(0)
+        self.alias = np.concatenate(aliases) if aliases else np.zeros(0, dtype=np.int64)
+
+    @property
+    def symbols(self):
+        return self.table.symbols
+
+    def sample(self, n_chains, length, start=None, include_start=True):
+        # Ergebnis: int32-Array (n_chains, length), -1 nach einer Sackgasse
+        out = np.full((n_chains, length), -1, dtype=np.int32)
+        if length <= 0 or not self.states:
+            return out
+        if start is None:
+            current = np.asarray(self.states, dtype=np.int64)[self.rng.integers(0, len(self.states), n_chains)]
+        else:
+            current = np.full(n_chains, self.table.id(start), dtype=np.int64)
+
+        col = 0
+        if include_start:
+            out[:, 0] = current
+            col = 1
+        for t in range(col, length):
+            alive = current >= 0
+            alive[alive] = self.sizes[current[alive]] > 0
+            if not alive.any():
+                break
+            state = current[alive]
+            slot = self.offsets[state] + (self.rng.random(len(state)) * self.sizes[state]).astype(np.int64)
+            keep = self.rng.random(len(state)) < self.prob[slot]
+            chosen = self.outcomes[np.where(keep, slot, self.alias[slot])]
+            out[alive, t] = chosen
+            current = np.full(n_chains, -1, dtype=np.int64)
+            current[alive] = self.next_state[chosen]
+        return out
+
+    def decode(self, row):
+        row = np.asarray(row)
+        end = np.flatnonzero(row < 0)
+        if len(end):
+            row = row[:end[0]]
+        return self.table.decode(row)
+
+    def sample_symbols(self, n_chains, length, start=None, include_start=True):
+        ids = self.sample(n_chains, length, start=start, include_start=include_start)
+        return [self.decode(row) for row in ids]
+
+
+def _correlation(a, b):
+    if np.std(a) == 0 or np.std(b) == 0:
+        return 0.0
+    return float(np.corrcoef(a, b)[0, 1])
+
+
+def estimate_counts(sampler, count_fn, length, reference=None, max_chains=5000, batch_chains=500,
+                    tol=0.01, deadline=None, include_start=True):
+    # Zieht Ketten stapelweise, bis die Korrelation der Stapel mit reference
+    # stabil ist (Standardfehler < tol), max_chains erreicht oder die Zeit um ist.
+    # Liefert (summierte Zählungen, Standardfehler, Anzahl Ketten).
+    total = None
+    batch_corrs = []
+    drawn = 0
+    stderr = float("nan")
+    while drawn < max_chains:
+        n = min(batch_chains, max_chains - drawn)
+        counts = count_fn(sampler.sample(n, length, include_start=include_start))
+        total = counts if total is None else total + counts
+        drawn += n
+        if reference is not None:
+            batch_corrs.append(_correlation(reference, counts))
+            if len(batch_corrs) >= 2:
+                stderr = float(np.std(batch_corrs, ddof=1) / np.sqrt(len(batch_corrs)))
+                if stderr < tol:
+                    break
+        if deadline is not None and time.monotonic() > deadline:
+            break
+    return total, stderr, drawn
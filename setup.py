@@ -7,6 +7,12 @@ setup(
     author="Dein Name",
     author_email="dein.email@example.com",
     packages=find_packages(),
+    py_modules=[
+        "app", "ars_gui_app", "ars4_gui_app", "ars6_gui_app", "ars_cli", "ars_bench",
+        "ars_artifact", "ars_cache", "ars_cluster", "ars_core", "ars_embed", "ars_grammar",
+        "ars_induction", "ars_ingest", "ars_jobs", "ars_lang", "ars_llm", "ars_models",
+        "ars_naming", "ars_pipeline", "ars_reduce", "ars_rules", "ars_sampler",
+    ],
     include_package_data=True,
     install_requires=[
         "sentence-transformers",
@@ -16,11 +22,18 @@ setup(
         "pyyaml",
         "streamlit",
         "networkx",
-        "matplotlib"
+        "matplotlib",
+        "scipy",
+        "langdetect"
     ],
+    extras_require={
+        # ANN-Index für die Clustering-Verfahren "knn-graph" und "sample"
+        "ann": ["hnswlib"],
+    },
     entry_points={
         'console_scripts': [
-            'ars-gui = app:main',  # Voraussetzung: app.py enthält eine main()-Funktion
+            'ars = ars_cli:main',
+            'ars-gui = ars_gui_app:main',
         ],
     },
     classifiers=[